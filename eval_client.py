@@ -3,28 +3,268 @@
 用于调用评估API服务的示例代码
 """
 
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
 import requests
-from typing import Dict, List, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Optional, Union, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from translation_evaluator.codec import (
+        decode_body, encode_body, supported_encodings, msgpack_available,
+        from_columnar, JSON_TYPE, MSGPACK_TYPE
+    )
+    CODEC_AVAILABLE = True
+except ImportError:
+    # 单独使用客户端文件时：只支持未压缩的JSON（响应的gzip由requests自动解压）
+    CODEC_AVAILABLE = False
+    JSON_TYPE = "application/json"
+    MSGPACK_TYPE = "application/msgpack"
+
+    def encode_body(payload, binary=False, encoding=None):
+        return json.dumps(payload, ensure_ascii=False).encode("utf-8"), {"Content-Type": f"{JSON_TYPE}; charset=utf-8"}
+
+    def decode_body(data, content_encoding=None, content_type=None, allow_decoded=True):
+        return json.loads(data) if data else None
+
+    def supported_encodings():
+        return []
+
+    def msgpack_available():
+        return False
+
+    def from_columnar(columns, count=None):
+        if count is None:
+            count = max((len(column) for column in columns.values()), default=0)
+        return [{key: column[i] for key, column in columns.items()} for i in range(count)]
+
+
+class AdaptiveChunkSizer:
+    """
+    自适应分块大小
+    
+    根据每个分块的服务器延迟估计单样本耗时（指数滑动平均），
+    调整分块大小使单个请求的延迟接近目标值；服务器过载时分块大小减半
+    """
+    
+    def __init__(
+        self,
+        initial_size: int = 256,
+        min_size: int = 8,
+        max_size: int = 2048,
+        target_latency: float = 10.0,
+        adaptive: bool = True,
+        smoothing: float = 0.3
+    ):
+        """
+        Args:
+            initial_size: 初始分块大小
+            min_size: 最小分块大小
+            max_size: 最大分块大小
+            target_latency: 单个分块请求的目标延迟（秒）
+            adaptive: 是否启用自适应（False时始终使用initial_size）
+            smoothing: 单样本耗时滑动平均的权重
+        """
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.size = min(max(initial_size, self.min_size), self.max_size) if adaptive else max(1, initial_size)
+        self.target_latency = target_latency
+        self.adaptive = adaptive
+        self.smoothing = smoothing
+        self.per_item_latency = None
+        self._lock = threading.Lock()
+    
+    def next_size(self) -> int:
+        """下一个分块的大小"""
+        with self._lock:
+            return self.size
+    
+    def record_success(self, size: int, latency: float):
+        """记录一个成功分块的延迟"""
+        if not self.adaptive or size <= 0:
+            return
+        with self._lock:
+            per_item = latency / size
+            if self.per_item_latency is None:
+                self.per_item_latency = per_item
+            else:
+                self.per_item_latency = (1 - self.smoothing) * self.per_item_latency + self.smoothing * per_item
+            
+            if self.per_item_latency > 0:
+                # 每次最多翻倍，避免延迟估计抖动导致分块大小振荡
+                target = int(self.target_latency / self.per_item_latency)
+                self.size = max(self.min_size, min(self.max_size, target, self.size * 2))
+    
+    def record_overload(self):
+        """服务器过载（429/503/超时）：分块大小减半"""
+        if not self.adaptive:
+            return
+        with self._lock:
+            self.size = max(self.min_size, self.size // 2)
+
+
+class _BatchState:
+    """一次批量评估的分块调度状态（线程安全）"""
+    
+    def __init__(self, total: int, sizer: AdaptiveChunkSizer):
+        self.total = total
+        self.sizer = sizer
+        self.cursor = 0
+        self.responses = {}
+        self._lock = threading.Lock()
+    
+    def take(self) -> Optional[Tuple[int, int]]:
+        """领取下一个分块范围（大小按当前自适应结果决定）"""
+        with self._lock:
+            if self.cursor >= self.total:
+                return None
+            start = self.cursor
+            self.cursor = min(self.total, start + self.sizer.next_size())
+            return start, self.cursor
+    
+    def store(self, start: int, end: int, response: Dict):
+        with self._lock:
+            self.responses[start] = (end, response)
 
 
 class EvaluationClient:
     """评估API客户端"""
     
-    def __init__(self, base_url: str = "http://localhost:5001"):
+    # 表示服务器过载、可以重试的状态码
+    RETRYABLE_STATUS = (429, 503)
+    
+    def __init__(
+        self,
+        base_url: str = "http://localhost:5001",
+        chunk_size: int = 256,
+        max_workers: int = 4,
+        timeout: float = 300,
+        adaptive_chunking: bool = True,
+        target_latency: float = 10.0,
+        min_chunk_size: int = 8,
+        max_chunk_size: int = 2048,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        max_backoff: float = 60.0,
+        api_key: Optional[str] = None,
+        compression: Optional[str] = "auto",
+        binary: Optional[bool] = None,
+        columnar: Optional[bool] = None
+    ):
         """
         初始化客户端
         
         Args:
             base_url: API服务器地址
+            chunk_size: 批量评估时的初始分块大小（大批次自动拆分）
+            max_workers: 同时在途的分块请求数（连接池大小与之一致）
+            timeout: 每个请求的超时时间（秒）
+            adaptive_chunking: 是否根据服务器延迟自适应调整分块大小
+            target_latency: 自适应分块的目标延迟（秒）
+            min_chunk_size: 自适应分块的最小值
+            max_chunk_size: 自适应分块的最大值
+            max_retries: 429/503/超时/连接失败时的最大重试次数
+            backoff_base: 指数退避的基础等待时间（秒）
+            max_backoff: 单次退避的最长等待时间（秒）
+            api_key: API Key（通过X-API-Key请求头发送，服务器按其计配额）
+            compression: 请求体的内容编码（gzip、zstd或None）；"auto"表示使用服务器/health声明支持的编码，
+                未声明的（旧版）服务器使用未压缩的请求体。响应按本机支持的编码协商
+            binary: 使用MessagePack传输（需要安装msgpack）；None表示服务器声明支持时使用
+            columnar: 批量结果以列式格式返回后在本地还原；None表示服务器声明支持时使用
         """
         self.base_url = base_url.rstrip('/')
         self.eval_url = f"{self.base_url}/eval"
         self.batch_url = f"{self.base_url}/eval/batch"
+        self.qe_url = f"{self.base_url}/qe"
+        self.qe_batch_url = f"{self.base_url}/qe/batch"
+        self.chunk_size = chunk_size
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        
+        # 跨调用保留学习到的分块大小
+        self.chunk_sizer = AdaptiveChunkSizer(
+            initial_size=chunk_size,
+            min_size=min_chunk_size,
+            max_size=max_chunk_size,
+            target_latency=target_latency,
+            adaptive=adaptive_chunking
+        )
+        
+        # 复用keep-alive连接，连接池足够容纳所有并发分块
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["X-API-Key"] = api_key
+        
+        # 传输格式：显式指定的直接使用，未指定的在首次请求前按服务器声明的能力确定
+        self.compression = compression if CODEC_AVAILABLE else None
+        self.binary = binary and msgpack_available() if binary is not None else None
+        self.columnar = columnar
+        self._negotiate_lock = threading.Lock()
+        # 响应格式由服务器按Accept/Accept-Encoding协商，旧服务器忽略这些请求头
+        self.session.headers["Accept"] = MSGPACK_TYPE if binary is not False and msgpack_available() else JSON_TYPE
+        if supported_encodings():
+            self.session.headers["Accept-Encoding"] = ", ".join(supported_encodings())
+    
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _transport(self) -> Tuple[Optional[str], bool, bool]:
+        """
+        (请求体内容编码, 是否MessagePack, 是否请求列式结果)
+        未显式指定的项按服务器/health中的codec声明确定（只查询一次）；
+        旧版服务器没有该声明，使用未压缩的JSON和逐样本结果
+        """
+        if self.compression == "auto" or self.binary is None or self.columnar is None:
+            with self._negotiate_lock:
+                if self.compression == "auto" or self.binary is None or self.columnar is None:
+                    health = self.health_check()
+                    codec = health.get("codec") or {}
+                    compression = next(
+                        (name for name in supported_encodings() if name in codec.get("content_encodings", [])), None
+                    )
+                    binary = bool(codec.get("msgpack")) and msgpack_available()
+                    columnar = "columnar" in codec.get("response_formats", [])
+                    if health.get("status") == "error":
+                        # 服务器暂时不可达：本次使用最保守的格式，下次请求再协商
+                        return (
+                            None if self.compression == "auto" else self.compression,
+                            bool(self.binary),
+                            bool(self.columnar)
+                        )
+                    if self.compression == "auto":
+                        self.compression = compression
+                    if self.binary is None:
+                        self.binary = binary
+                    if self.columnar is None:
+                        self.columnar = columnar
+        return self.compression, self.binary, self.columnar
     
     def health_check(self) -> Dict:
         """健康检查"""
         try:
-            response = requests.get(f"{self.base_url}/health", timeout=5)
+            response = self.session.get(f"{self.base_url}/health", timeout=5)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -33,18 +273,22 @@ class EvaluationClient:
     def evaluate(
         self,
         translation: str,
-        reference: str,
+        reference: Union[str, List[str]],
         source: Optional[str] = None,
-        mqm_score: Optional[Dict] = None
+        mqm_score: Optional[Dict] = None,
+        metrics: Optional[List[str]] = None,
+        lang_pair: Optional[str] = None
     ) -> Dict:
         """
-        评估单个翻译样本
+        评估单个翻译样本（服务器繁忙时按Retry-After/指数退避重试）
         
         Args:
             translation: 翻译文本
-            reference: 参考翻译
+            reference: 参考翻译（字符串或多个参考的列表）
             source: 源文本（可选）
             mqm_score: MQM评分（可选）
+            metrics: 只计算这些指标（如 ["bleu", "chrf"]，默认为服务器启用的所有指标）
+            lang_pair: 语言对（可选，如 "zh-en"，服务器据此选择BERTScore模型）
             
         Returns:
             评估结果字典
@@ -60,55 +304,254 @@ class EvaluationClient:
         if mqm_score:
             data["mqm_score"] = mqm_score
         
-        try:
-            response = requests.post(self.eval_url, json=data, timeout=60)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            return {
-                "success": False,
-                "error": f"请求失败: {str(e)}"
-            }
+        if metrics:
+            data["metrics"] = list(metrics)
+        
+        if lang_pair:
+            data["lang_pair"] = lang_pair
+        
+        result, _ = self._post_with_retry(self.eval_url, data)
+        return result
+    
+    def qe(self, source: str, translation: str) -> Dict:
+        """
+        无参考质量评估（服务器只运行COMETKiwi，不需要参考翻译）
+        
+        Returns:
+            {"success": True, "score": {"comet_kiwi": ..., "model": ...}}
+        """
+        result, _ = self._post_with_retry(self.qe_url, {"source": source, "translation": translation})
+        return result
+    
+    def qe_batch(self, sources: List[str], translations: List[str]) -> Dict:
+        """
+        批量无参考质量评估（单个请求）
+        
+        Returns:
+            {"success": True, "metrics": ["comet_kiwi"], "scores": [{"comet_kiwi": ...}, ...]}
+        """
+        result, _ = self._post_with_retry(self.qe_batch_url, {"sources": sources, "translations": translations})
+        return result
     
     def evaluate_batch(
         self,
         translations: List[str],
-        references: List[str],
+        references: List[Union[str, List[str]]],
         sources: Optional[List[str]] = None,
-        mqm_scores: Optional[List[Dict]] = None
+        mqm_scores: Optional[List[Dict]] = None,
+        chunk_size: Optional[int] = None,
+        metrics: Optional[List[str]] = None,
+        lang_pairs: Optional[List[str]] = None
     ) -> Dict:
         """
         批量评估
         
+        大批次拆分成多个请求，最多max_workers个并发在途，结果按原顺序拼接。
+        分块大小根据服务器延迟自适应调整；失败的分块单独重试，不影响已完成的分块
+        
         Args:
             translations: 翻译文本列表
-            references: 参考翻译列表
+            references: 参考翻译列表（每项可以是字符串或多个参考的列表）
             sources: 源文本列表（可选）
             mqm_scores: MQM评分列表（可选）
+            chunk_size: 本次调用使用固定分块大小（默认使用自适应分块）
+            metrics: 只计算这些指标（默认为服务器启用的所有指标）
+            lang_pairs: 每个样本的语言对（可选，如 ["en-zh", "zh-en", ...]）
             
         Returns:
             批量评估结果字典
         """
-        data = {
-            "translations": translations,
-            "references": references
-        }
+        payload = (translations, references, sources, mqm_scores, metrics, lang_pairs)
+        state = self._new_batch_state(len(translations), chunk_size)
+        workers = self._worker_count(state)
+        
+        if workers == 1:
+            self._batch_worker(payload, state)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for future in [executor.submit(self._batch_worker, payload, state) for _ in range(workers)]:
+                    future.result()
         
-        if sources:
-            data["sources"] = sources
+        return self._merge_responses(state)
+    
+    async def evaluate_batch_async(
+        self,
+        translations: List[str],
+        references: List[Union[str, List[str]]],
+        sources: Optional[List[str]] = None,
+        mqm_scores: Optional[List[Dict]] = None,
+        chunk_size: Optional[int] = None,
+        metrics: Optional[List[str]] = None,
+        lang_pairs: Optional[List[str]] = None
+    ) -> Dict:
+        """
+        批量评估（asyncio版本，参数同evaluate_batch）
         
-        if mqm_scores:
-            data["mqm_scores"] = mqm_scores
+        分块请求在线程池中执行，事件循环不被阻塞；最多max_workers个分块同时在途
+        """
+        payload = (translations, references, sources, mqm_scores, metrics, lang_pairs)
+        state = self._new_batch_state(len(translations), chunk_size)
+        workers = self._worker_count(state)
+        loop = asyncio.get_running_loop()
         
-        try:
-            response = requests.post(self.batch_url, json=data, timeout=300)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            return {
-                "success": False,
-                "error": f"请求失败: {str(e)}"
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            await asyncio.gather(*(
+                loop.run_in_executor(executor, self._batch_worker, payload, state)
+                for _ in range(workers)
+            ))
+        
+        return self._merge_responses(state)
+    
+    def _new_batch_state(self, total: int, chunk_size: Optional[int]) -> _BatchState:
+        """创建批次调度状态（指定chunk_size时使用固定分块）"""
+        sizer = self.chunk_sizer
+        if chunk_size:
+            sizer = AdaptiveChunkSizer(initial_size=chunk_size, adaptive=False)
+        return _BatchState(total, sizer)
+    
+    def _worker_count(self, state: _BatchState) -> int:
+        """并发数不超过按最小分块计算的分块数"""
+        min_chunks = -(-state.total // max(1, state.sizer.min_size)) if state.sizer.adaptive else \
+            -(-state.total // max(1, state.sizer.size))
+        return max(1, min(self.max_workers, min_chunks))
+    
+    def _batch_worker(self, payload: Tuple, state: _BatchState):
+        """持续领取并发送分块，直到批次全部领取完"""
+        translations, references, sources, mqm_scores, metrics, lang_pairs = payload
+        while True:
+            chunk_range = state.take()
+            if chunk_range is None:
+                return
+            start, end = chunk_range
+            
+            data = {
+                "translations": translations[start:end],
+                "references": references[start:end]
             }
+            if self._transport()[2]:
+                data["response_format"] = "columnar"
+            if sources:
+                data["sources"] = sources[start:end]
+            if mqm_scores:
+                data["mqm_scores"] = mqm_scores[start:end]
+            if metrics:
+                data["metrics"] = list(metrics)
+            if lang_pairs:
+                data["lang_pairs"] = lang_pairs[start:end]
+            
+            result, latency = self._post_with_retry(self.batch_url, data, state.sizer)
+            if latency is not None and result.get("success"):
+                state.sizer.record_success(end - start, latency)
+            state.store(start, end, result)
+    
+    def _post_with_retry(
+        self,
+        url: str,
+        data: Dict,
+        sizer: Optional[AdaptiveChunkSizer] = None
+    ) -> Tuple[Dict, Optional[float]]:
+        """
+        发送请求；429/503、超时和连接失败时按Retry-After或带抖动的指数退避重试
+        
+        Returns:
+            (结果字典, 成功请求的延迟秒数；失败时为None)
+        """
+        error = None
+        compression, binary, _ = self._transport()
+        body, headers = encode_body(data, binary=binary, encoding=compression)
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            started = time.monotonic()
+            try:
+                response = self.session.post(url, data=body, headers=headers, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = f"请求失败: {str(e)}"
+            except requests.exceptions.RequestException as e:
+                return {"success": False, "error": f"请求失败: {str(e)}"}, None
+            else:
+                if response.status_code in self.RETRYABLE_STATUS:
+                    error = f"服务器繁忙 (HTTP {response.status_code})"
+                    retry_after = self._parse_retry_after(response.headers.get("Retry-After"))
+                else:
+                    try:
+                        response.raise_for_status()
+                        return self._decode_response(response), time.monotonic() - started
+                    except requests.exceptions.RequestException as e:
+                        # 其他错误（如400/500）重试无意义
+                        return {"success": False, "error": f"请求失败: {str(e)}"}, None
+                    except ValueError as e:
+                        return {"success": False, "error": f"响应解析失败: {str(e)}"}, None
+            
+            if sizer is not None:
+                sizer.record_overload()
+            if attempt < self.max_retries:
+                time.sleep(self._backoff_delay(attempt, retry_after))
+        
+        return {"success": False, "error": error, "retries": self.max_retries}, None
+    
+    @staticmethod
+    def _decode_response(response) -> Dict:
+        """解码响应（JSON/MessagePack、gzip/zstd），列式批量结果还原为逐样本字典"""
+        result = decode_body(
+            response.content,
+            response.headers.get("Content-Encoding"),
+            response.headers.get("Content-Type"),
+            allow_decoded=True
+        )
+        if isinstance(result, dict) and "columns" in result:
+            result["scores"] = from_columnar(result.pop("columns"), result.get("count"))
+            result.pop("format", None)
+        return result
+    
+    def _backoff_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        """退避等待时间：优先遵循Retry-After，否则使用full jitter指数退避"""
+        if retry_after is not None:
+            return min(self.max_backoff, retry_after) + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.max_backoff, self.backoff_base * (2 ** attempt)))
+    
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """解析Retry-After（秒数或HTTP日期）"""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    
+    @staticmethod
+    def _merge_responses(state: _BatchState) -> Dict:
+        """
+        按顺序拼接分块结果；有分块失败时仍返回已完成分块的分数，
+        失败范围内的位置为None，并在failed_ranges中列出
+        """
+        ordered = [(start,) + state.responses[start] for start in sorted(state.responses)]
+        failed = [(start, end, r) for start, end, r in ordered if not r.get("success")]
+        
+        scores = []
+        for start, end, response in ordered:
+            if response.get("success"):
+                scores.extend(response.get("scores", []))
+            else:
+                scores.extend([None] * (end - start))
+        
+        merged = {
+            "success": not failed,
+            "count": len(scores),
+            "scores": scores,
+            "chunks": len(ordered)
+        }
+        if failed:
+            merged["error"] = failed[0][2].get("error")
+            merged["failed_ranges"] = [[start, end] for start, end, _ in failed]
+        succeeded = [response for _, _, response in ordered if response.get("success")]
+        if succeeded and "metrics" in succeeded[0]:
+            merged["metrics"] = succeeded[0]["metrics"]
+        return merged
 
 
 def evaluate_translation(
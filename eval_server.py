@@ -5,10 +5,12 @@
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import traceback
 import sys
 import os
 import json
+import re
 import logging
 from datetime import datetime
 from pathlib import Path
@@ -17,15 +19,32 @@ from pathlib import Path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from translation_evaluator import UnifiedEvaluator, PaperGradeScore
+from translation_evaluator.references import has_reference
+from translation_evaluator.admission import AdmissionController, AdmissionRejected
+from translation_evaluator.scheduler import INTERACTIVE, BULK
+from translation_evaluator.singleflight import SingleFlight
+from translation_evaluator.checkpoint import fingerprint, purge_expired
+from translation_evaluator.model_registry import get_registry
+from translation_evaluator.thread_budget import ThreadBudget, get_thread_budget
+from translation_evaluator.qe import QualityEstimator
+from translation_evaluator.codec import (
+    decode_body, encode_body, choose_encoding, wants_msgpack, to_columnar,
+    supported_encodings, msgpack_available, MAX_BODY_SIZE
+)
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
+# 请求体大小上限（与ASGI服务器一致；解压后的大小在decode_body中同样受此限制）
+app.config["MAX_CONTENT_LENGTH"] = MAX_BODY_SIZE
 
 # Debug模式配置（默认开启）
 DEBUG_MODE = True
 LOGS_DIR = Path(__file__).parent / "logs"
 LOGS_DIR.mkdir(exist_ok=True)
 
+# 批量评估检查点目录（请求携带job_id时使用）
+CHECKPOINT_DIR = Path(__file__).parent / "checkpoints"
+
 # 配置日志记录器
 def setup_logger():
     """设置日志记录器"""
@@ -61,9 +80,236 @@ evaluator_config = {
     "use_bleurt": True,  # 默认关闭，需要TensorFlow
     "use_bertscore": True,
     "use_mqm": True,
-    "use_chrf": True
+    "use_chrf": True,
+    "bertscore_idf": None,  # BERTScore的IDF表路径（None表示不加权）
+    "update_bertscore_idf": False,
+    "bertscore_lang": "zh",  # 未指定语言对的样本使用的BERTScore目标语言
+    "token_cache_dir": None,  # 神经指标共用的分词缓存目录（多个服务进程可指向同一目录）
+    "bertscore_model": None,  # 默认目标语言的BERTScore模型（None为bert_score的默认模型，可选蒸馏模型）
+    "bertscore_precision": "fp32",  # BERTScore推理精度：fp32、int8、bf16
+    "bertscore_num_layers": None
 }
 
+# 准入控制（按API Key/客户端的配额 + 有界全局队列），启动参数可覆盖
+admission = AdmissionController()
+
+# 批量请求按该大小分块执行，分块之间让出执行槽位给交互式请求（/eval）
+BULK_CHUNK_SIZE = 64
+
+# 合并并发请求中相同的样本（每个唯一样本只计算一次）
+single_flight = SingleFlight()
+
+# 无参考质量评估（/qe），只加载COMETKiwi，首次请求时创建
+quality_estimator = None
+qe_config = {
+    "model": "Unbabel/wmt22-cometkiwi-da",
+    "max_batch_size": 64,
+    "max_wait": 0.01
+}
+
+
+def segment_key(source, translation, reference, mqm_score, metrics=None, lang_pair=None):
+    """样本的合并键（源文本、翻译、参考、MQM评分、请求的指标和语言对都相同才视为同一样本）"""
+    parts = [source or "", translation, reference, mqm_score]
+    if metrics is not None:
+        parts.append(sorted(metrics))
+    if lang_pair is not None:
+        parts.append(UnifiedEvaluator.parse_lang_pair(lang_pair))
+    return fingerprint(*parts)
+
+
+def request_metrics(data):
+    """请求的指标子集（None表示所有已启用的指标），不支持的指标抛出ValueError"""
+    return UnifiedEvaluator.parse_metrics(data.get("metrics"))
+
+
+def request_lang_pairs(data, n=None):
+    """
+    请求的语言对：单样本为lang_pair，批量为lang_pairs（与translations等长的列表），
+    格式不正确时抛出ValueError
+    """
+    if n is None:
+        lang_pair = data.get("lang_pair")
+        UnifiedEvaluator.parse_lang_pair(lang_pair)
+        return lang_pair
+    lang_pairs = data.get("lang_pairs")
+    if lang_pairs is None:
+        return None
+    if not isinstance(lang_pairs, list) or len(lang_pairs) != n:
+        raise ValueError("lang_pairs必须是与translations等长的列表")
+    for lang_pair in lang_pairs:
+        UnifiedEvaluator.parse_lang_pair(lang_pair)
+    return lang_pairs
+
+
+def evaluate_single(ticket, source, translation, reference, mqm_score, metrics=None, lang_pair=None):
+    """单样本评估；相同样本正在被其他请求计算时等待其结果"""
+    def compute():
+        with ticket.slot():
+            return evaluator.score(
+                source=source,
+                translation=translation,
+                reference=reference,
+                mqm_score=mqm_score,
+                metrics=metrics,
+                lang_pair=lang_pair
+            )
+    
+    with ticket:
+        return single_flight.do(segment_key(source, translation, reference, mqm_score, metrics, lang_pair), compute)
+
+
+def evaluate_batch(ticket, sources, translations, references, mqm_scores, checkpoint_path=None, metrics=None,
+                   lang_pairs=None):
+    """
+    批量评估；按分块申请执行槽位，交互式请求最多等待一个分块。
+    其他请求正在计算的样本不重复计算，等待其结果（使用检查点时不合并）
+    """
+    with ticket:
+        if checkpoint_path:
+            return evaluator.batch_score(
+                sources=sources,
+                translations=translations,
+                references=references,
+                mqm_scores=mqm_scores if mqm_scores else None,
+                checkpoint_path=checkpoint_path,
+                chunk_size=BULK_CHUNK_SIZE,
+                chunk_context=ticket.slot,
+                metrics=metrics,
+                lang_pairs=lang_pairs
+            )
+        
+        n = len(translations)
+        mqm_list = mqm_scores or []
+        keys = [
+            segment_key(
+                sources[i] if i < len(sources) else "",
+                translations[i],
+                references[i],
+                mqm_list[i] if i < len(mqm_list) else None,
+                metrics,
+                lang_pairs[i] if lang_pairs else None
+            )
+            for i in range(n)
+        ]
+        first_index = {}
+        for i, key in enumerate(keys):
+            first_index.setdefault(key, i)
+        unique_keys = list(first_index)
+        
+        # 按分块认领：进入执行槽位后才认领本分块的样本，避免单样本请求等待尚未开始的批量分块
+        results_by_key = {}
+        waiting = {}
+        for start in range(0, len(unique_keys), BULK_CHUNK_SIZE):
+            chunk = unique_keys[start:start + BULK_CHUNK_SIZE]
+            with ticket.slot(len(chunk)):
+                owned, chunk_waiting = single_flight.claim(chunk)
+                waiting.update(chunk_waiting)
+                if not owned:
+                    continue
+                index = [first_index[key] for key in owned]
+                try:
+                    owned_scores = evaluator.batch_score(
+                        sources=[sources[i] if i < len(sources) else "" for i in index],
+                        translations=[translations[i] for i in index],
+                        references=[references[i] for i in index],
+                        mqm_scores=[mqm_list[i] if i < len(mqm_list) else None for i in index] if mqm_list else None,
+                        metrics=metrics,
+                        lang_pairs=[lang_pairs[i] for i in index] if lang_pairs else None
+                    )
+                except BaseException as e:
+                    for key in owned:
+                        single_flight.resolve(key, error=e)
+                    raise
+                for key, score in zip(owned, owned_scores):
+                    results_by_key[key] = score
+                    single_flight.resolve(key, score)
+        
+        # 在执行槽位之外等待其他请求正在计算的样本
+        for key, future in waiting.items():
+            results_by_key[key] = future.result()
+        return [results_by_key[key] for key in keys]
+
+
+def get_quality_estimator():
+    """QE评估器：并发的/qe请求在后台凑批推理，每批占用一个交互式执行槽位"""
+    global quality_estimator
+    if quality_estimator is None:
+        quality_estimator = QualityEstimator(
+            model_name=qe_config["model"],
+            max_batch_size=qe_config["max_batch_size"],
+            max_wait=qe_config["max_wait"],
+            batch_context=lambda n: admission.scheduler.slot(INTERACTIVE),
+            token_cache_dir=evaluator_config["token_cache_dir"]
+        )
+    return quality_estimator
+
+
+def evaluate_qe_batch(ticket, sources, translations):
+    """批量QE：按分块申请执行槽位（与/eval/batch相同，分块之间优先处理交互式请求）"""
+    with ticket:
+        return get_quality_estimator().score_batch(
+            sources,
+            translations,
+            chunk_size=BULK_CHUNK_SIZE,
+            chunk_context=ticket.slot
+        )
+
+
+def client_id():
+    """客户端标识：优先使用X-API-Key请求头，否则使用客户端地址"""
+    return request.headers.get("X-API-Key") or request.remote_addr or "unknown"
+
+
+def read_request_data():
+    """
+    解析请求体（支持gzip/zstd内容编码和MessagePack），格式错误时抛出ValueError，
+    超过MAX_BODY_SIZE时抛出RequestEntityTooLarge
+    """
+    return decode_body(
+        request.get_data(),
+        request.headers.get("Content-Encoding"),
+        request.content_type
+    )
+
+
+def body_error_response(error):
+    """请求体无法解析：过大返回413，格式错误返回400"""
+    if isinstance(error, RequestEntityTooLarge):
+        return jsonify({
+            "success": False,
+            "error": f"请求体过大（上限 {MAX_BODY_SIZE} 字节）"
+        }), 413
+    return jsonify({
+        "success": False,
+        "error": f"请求体格式错误: {error}"
+    }), 400
+
+
+def api_response(payload, status=200):
+    """
+    编码成功响应：按Accept选择JSON或MessagePack，按Accept-Encoding选择gzip/zstd压缩
+    """
+    body, headers = encode_body(
+        payload,
+        binary=wants_msgpack(request.headers.get("Accept")),
+        encoding=choose_encoding(request.headers.get("Accept-Encoding"))
+    )
+    content_type = headers.pop("Content-Type")
+    return app.response_class(body, status=status, headers=headers, content_type=content_type)
+
+
+def reject_response(error, request_id):
+    """准入被拒绝：立即返回429和Retry-After（单个请求过大时返回413）"""
+    if DEBUG_MODE:
+        api_logger.warning(f"[请求ID: {request_id}] ⛔ 请求被拒绝 ({error.reason}): {error.message}")
+    return jsonify({
+        "success": False,
+        "error": error.message,
+        "reason": error.reason,
+        "retry_after": error.retry_after
+    }), error.status, {"Retry-After": error.retry_after_header}
+
 
 def init_evaluator(use_bleurt=None, force_reinit=False):
     """
@@ -77,10 +323,13 @@ def init_evaluator(use_bleurt=None, force_reinit=False):
     
     # 如果指定了use_bleurt，更新配置
     if use_bleurt is not None:
+        changed = evaluator_config["use_bleurt"] != use_bleurt
         evaluator_config["use_bleurt"] = use_bleurt
-        # 如果配置改变且评估器已初始化，需要重新初始化
-        if evaluator is not None:
-            force_reinit = True
+        # 评估器已初始化时只增量加载/关闭BLEURT，其他模型继续服务
+        if evaluator is not None and changed and not force_reinit:
+            print(f"🔄 BLEURT配置变更，增量重新配置（use_bleurt={use_bleurt}）...")
+            evaluator.reconfigure(use_bleurt=use_bleurt, background=True)
+            return evaluator
     
     if evaluator is None or force_reinit:
         if force_reinit and evaluator is not None:
@@ -93,13 +342,24 @@ def init_evaluator(use_bleurt=None, force_reinit=False):
         if evaluator_config["use_bleurt"]:
             print("⚠️  启用BLEURT评估器（需要TensorFlow和模型文件）")
         
+        bertscore_models = None
+        if evaluator_config["bertscore_model"]:
+            bertscore_models = {evaluator_config["bertscore_lang"]: evaluator_config["bertscore_model"]}
+        
         evaluator = UnifiedEvaluator(
             use_bleu=evaluator_config["use_bleu"],
             use_comet=evaluator_config["use_comet"],
             use_bleurt=evaluator_config["use_bleurt"],
             use_bertscore=evaluator_config["use_bertscore"],
             use_mqm=evaluator_config["use_mqm"],
-            use_chrf=evaluator_config["use_chrf"]
+            use_chrf=evaluator_config["use_chrf"],
+            bertscore_idf=evaluator_config["bertscore_idf"],
+            update_bertscore_idf=evaluator_config["update_bertscore_idf"],
+            bertscore_lang=evaluator_config["bertscore_lang"],
+            token_cache_dir=evaluator_config["token_cache_dir"],
+            bertscore_models=bertscore_models,
+            bertscore_precision=evaluator_config["bertscore_precision"],
+            bertscore_num_layers=evaluator_config["bertscore_num_layers"]
         )
         
         success = evaluator.initialize()
@@ -169,8 +429,12 @@ def index():
             "/": "API信息",
             "/health": "健康检查",
             "/eval": "单个样本评估 (POST)",
-            "/eval/batch": "批量评估 (POST)"
+            "/eval/batch": "批量评估 (POST)",
+            "/qe": "无参考质量评估，只运行COMETKiwi (POST)",
+            "/qe/batch": "批量无参考质量评估 (POST)"
         },
+        "encoding": "请求/响应支持Content-Encoding/Accept-Encoding: gzip, zstd；Accept: application/msgpack 返回MessagePack",
+        "admission": "请求头X-API-Key标识客户端（默认按客户端地址），超出配额或队列已满时返回429和Retry-After，单个请求过大时返回413",
         "usage": {
             "single": {
                 "url": "/eval",
@@ -178,8 +442,9 @@ def index():
                 "body": {
                     "source": "源文本（可选）",
                     "translation": "翻译文本（必需）",
-                    "reference": "参考翻译（必需）",
-                    "mqm_score": "MQM评分（可选）"
+                    "reference": "参考翻译（必需，字符串或多个参考的列表）",
+                    "mqm_score": "MQM评分（可选）",
+                    "lang_pair": "语言对（可选，如 en-zh）"
                 }
             },
             "batch": {
@@ -188,17 +453,36 @@ def index():
                 "body": {
                     "sources": ["源文本列表"],
                     "translations": ["翻译文本列表"],
-                    "references": ["参考翻译列表"],
-                    "mqm_scores": ["MQM评分列表（可选）"]
+                    "references": ["参考翻译列表（每项为字符串或多个参考的列表）"],
+                    "mqm_scores": ["MQM评分列表（可选）"],
+                    "job_id": "任务ID（可选，断点续评）",
+                    "lang_pairs": ["语言对列表（可选）"],
+                    "response_format": "rows（默认，逐样本字典）或 columnar（每个指标一个数组）"
+                }
+            },
+            "qe": {
+                "url": "/qe",
+                "method": "POST",
+                "body": {
+                    "source": "源文本（必需）",
+                    "translation": "翻译文本（必需）"
+                }
+            },
+            "qe_batch": {
+                "url": "/qe/batch",
+                "method": "POST",
+                "body": {
+                    "sources": ["源文本列表"],
+                    "translations": ["翻译文本列表"],
+                    "response_format": "rows（默认）或 columnar"
                 }
             }
         }
     })
 
 
-@app.route("/health", methods=["GET"])
-def health():
-    """健康检查"""
+def health_status():
+    """健康检查内容（Flask与ASGI服务器共用）"""
     evaluator_status = {}
     if evaluator is not None:
         evaluator_status = {
@@ -207,14 +491,88 @@ def health():
             "use_bleurt": evaluator.use_bleurt and evaluator.bleurt_scorer is not None,
             "use_bertscore": evaluator.use_bertscore and evaluator.bertscore_scorer is not None,
             "use_chrf": evaluator.use_chrf and evaluator.chrf_scorer is not None,
-            "use_mqm": evaluator.use_mqm
+            "use_mqm": evaluator.use_mqm,
+            "reconfiguring": list(evaluator.reconfiguring)
         }
     
-    return jsonify({
+    return {
         "status": "healthy",
         "evaluator_initialized": evaluator is not None,
-        "evaluator_status": evaluator_status
-    })
+        "evaluator_status": evaluator_status,
+        "admission": admission.stats(),
+        "single_flight": single_flight.stats(),
+        "models": get_registry().stats(),
+        "threads": get_thread_budget().stats(),
+        "qe": quality_estimator.stats() if quality_estimator is not None else None,
+        # 客户端据此决定是否压缩请求体、使用MessagePack和列式响应
+        "codec": {
+            "content_encodings": supported_encodings(),
+            "msgpack": msgpack_available(),
+            "response_formats": ["rows", "columnar"]
+        }
+    }
+
+
+def score_to_dict(score, include_model_info=False):
+    """评分对象转换为响应字典"""
+    if isinstance(score, PaperGradeScore):
+        score_dict = {
+            "bleu": score.bleu,
+            "comet": score.comet,
+            "bleurt": score.bleurt,  # 确保BLEURT总是包含在返回结果中
+            "bertscore_f1": score.bertscore_f1,
+            "chrf": score.chrf,
+            "mqm_adequacy": score.mqm_adequacy,
+            "mqm_fluency": score.mqm_fluency,
+            "mqm_terminology": score.mqm_terminology,
+            "mqm_overall": score.mqm_overall,
+            "final_score": score.final_score
+        }
+        if include_model_info:
+            score_dict["model_info"] = score.model_info
+            score_dict["metrics"] = score.metrics
+        return score_dict
+    
+    score_dict = score.__dict__ if hasattr(score, '__dict__') else {}
+    # 确保BLEURT字段存在
+    if "bleurt" not in score_dict:
+        score_dict["bleurt"] = 0.0
+    return score_dict
+
+
+def batch_payload(scores_list, response_format="rows", metrics=None):
+    """
+    批量评估响应：rows为逐样本字典列表，columnar为每个指标一个数组；
+    metrics为实际计算的指标（整个批次相同）
+    """
+    payload = {"success": True, "count": len(scores_list)}
+    if metrics is not None:
+        payload["metrics"] = metrics
+    if response_format == "columnar":
+        payload["format"] = "columnar"
+        payload["columns"] = to_columnar(scores_list)
+    else:
+        payload["scores"] = scores_list
+    return payload
+
+
+def checkpoint_path_for(job_id):
+    """
+    job_id对应的检查点路径（未指定job_id时返回None，格式不合法时抛出ValueError）；
+    同时清理已完成且过期的检查点
+    """
+    if job_id is None:
+        return None
+    if not isinstance(job_id, str) or not re.fullmatch(r"[A-Za-z0-9_.-]{1,128}", job_id):
+        raise ValueError("job_id只能包含字母、数字、'_'、'-'、'.'（最长128个字符）")
+    purge_expired(str(CHECKPOINT_DIR))
+    return str(CHECKPOINT_DIR / job_id)
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    """健康检查"""
+    return jsonify(health_status())
 
 
 @app.route("/eval", methods=["POST"])
@@ -226,13 +584,15 @@ def eval_text():
     {
         "source": "源文本（可选）",
         "translation": "翻译文本（必需）",
-        "reference": "参考翻译（必需）",
+        "reference": "参考翻译（必需，字符串或多个参考的列表）",
         "mqm_score": {
             "adequacy": 0.9,
             "fluency": 0.85,
             "terminology": 0.95,
             "overall": 0.9
-        }  // 可选
+        },  // 可选
+        "metrics": ["bleu", "chrf"],  // 可选，只计算这些指标（bleu, chrf, comet, bleurt, bertscore, mqm）
+        "lang_pair": "zh-en"  // 可选，BERTScore按目标语言选择模型
     }
     
     Response:
@@ -248,7 +608,8 @@ def eval_text():
             "mqm_fluency": 0.85,
             "mqm_terminology": 0.95,
             "mqm_overall": 0.9,
-            "final_score": 0.89
+            "final_score": 0.89,
+            "metrics": ["bleu", "comet", ...]  // 实际计算的指标
         }
     }
     """
@@ -264,7 +625,10 @@ def eval_text():
             init_evaluator()
         
         # 获取请求数据
-        data = request.json
+        try:
+            data = read_request_data()
+        except (ValueError, RequestEntityTooLarge) as e:
+            return body_error_response(e)
         if not data:
             if DEBUG_MODE:
                 api_logger.error(f"[请求ID: {request_id}] 请求体为空")
@@ -284,7 +648,7 @@ def eval_text():
                 # 记录完整数据（截断长文本）
                 log_data = data.copy()
                 for key in ['translation', 'reference', 'source']:
-                    if key in log_data and len(log_data[key]) > 200:
+                    if key in log_data and isinstance(log_data[key], str) and len(log_data[key]) > 200:
                         log_data[key] = log_data[key][:200] + f"... (总长度: {len(data[key])})"
                 api_logger.debug(f"[请求ID: {request_id}] 完整请求数据: {json.dumps(log_data, ensure_ascii=False, indent=2)}")
         
@@ -310,6 +674,14 @@ def eval_text():
         translation = data["translation"]
         source = data.get("source", "")
         mqm_score = data.get("mqm_score")
+        try:
+            metrics = request_metrics(data)
+            lang_pair = request_lang_pairs(data)
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
         
         # 记录评估器状态
         if DEBUG_MODE:
@@ -325,8 +697,8 @@ def eval_text():
             api_logger.info(f"  - BERTScore评估器存在: {evaluator.bertscore_scorer is not None}")
             api_logger.info(f"  - ChrF评估器存在: {evaluator.chrf_scorer is not None}")
         
-        # 验证reference不为空
-        if not reference or not reference.strip():
+        # 验证reference不为空（多参考时至少一个非空）
+        if not has_reference(reference):
             if DEBUG_MODE:
                 api_logger.error(f"[请求ID: {request_id}] reference为空")
             return jsonify({
@@ -334,17 +706,18 @@ def eval_text():
                 "error": "reference不能为空（BLEURT等评估器需要reference）"
             }), 400
         
+        # 准入控制
+        try:
+            ticket = admission.admit(client_id(), 1, priority=INTERACTIVE)
+        except AdmissionRejected as e:
+            return reject_response(e, request_id)
+        
         # 开始评估
         if DEBUG_MODE:
             api_logger.info(f"[请求ID: {request_id}] 🚀 开始评估...")
             start_time = datetime.now()
         
-        score = evaluator.score(
-            source=source,
-            translation=translation,
-            reference=reference,
-            mqm_score=mqm_score
-        )
+        score = evaluate_single(ticket, source, translation, reference, mqm_score, metrics, lang_pair)
         
         # 记录评估结果
         if DEBUG_MODE:
@@ -366,29 +739,11 @@ def eval_text():
                 api_logger.info(f"  - 模型信息: {score.model_info}")
         
         # 转换为字典（处理dataclass）
-        if isinstance(score, PaperGradeScore):
-            score_dict = {
-                "bleu": score.bleu,
-                "comet": score.comet,
-                "bleurt": score.bleurt,  # 确保BLEURT总是包含在返回结果中
-                "bertscore_f1": score.bertscore_f1,
-                "chrf": score.chrf,
-                "mqm_adequacy": score.mqm_adequacy,
-                "mqm_fluency": score.mqm_fluency,
-                "mqm_terminology": score.mqm_terminology,
-                "mqm_overall": score.mqm_overall,
-                "final_score": score.final_score,
-                "model_info": score.model_info
-            }
-            # 调试信息：如果BLEURT为0但评估器已启用，记录日志
-            if evaluator.use_bleurt and score.bleurt == 0.0:
-                if DEBUG_MODE:
-                    api_logger.warning(f"[请求ID: {request_id}] ⚠️  BLEURT已启用但分数为0")
-        else:
-            score_dict = score.__dict__ if hasattr(score, '__dict__') else {}
-            # 确保BLEURT字段存在
-            if "bleurt" not in score_dict:
-                score_dict["bleurt"] = 0.0
+        score_dict = score_to_dict(score, include_model_info=True)
+        # 调试信息：如果BLEURT为0但评估器已启用，记录日志
+        if isinstance(score, PaperGradeScore) and evaluator.use_bleurt and score.bleurt == 0.0:
+            if DEBUG_MODE:
+                api_logger.warning(f"[请求ID: {request_id}] ⚠️  BLEURT已启用但分数为0")
         
         # 记录返回结果
         if DEBUG_MODE:
@@ -396,7 +751,7 @@ def eval_text():
             api_logger.debug(f"[请求ID: {request_id}] 完整返回数据: {json.dumps(score_dict, ensure_ascii=False, indent=2)}")
             api_logger.info(f"[请求ID: {request_id}] " + "=" * 100)
         
-        return jsonify({
+        return api_response({
             "success": True,
             "score": score_dict
         })
@@ -426,16 +781,21 @@ def eval_batch():
     {
         "sources": ["源文本1", "源文本2", ...],
         "translations": ["翻译1", "翻译2", ...],
-        "references": ["参考1", "参考2", ...],
+        "references": ["参考1", ["参考2a", "参考2b"], ...],  // 每项可以是多个参考的列表
         "mqm_scores": [
             {"overall": 0.9},
             {"overall": 0.85}
-        ]  // 可选
+        ],  // 可选
+        "job_id": "nightly-2025-01-01",  // 可选，指定后分块持久化，请求中断后重新提交会从断点继续
+        "response_format": "columnar",  // 可选，返回 {"columns": {"bleu": [...], "comet": [...], ...}}
+        "metrics": ["bleu", "chrf"],  // 可选，只计算这些指标
+        "lang_pairs": ["en-zh", "zh-en", ...]  // 可选，混合语言的批次按目标语言分组评估
     }
     
     Response:
     {
         "success": true,
+        "metrics": ["bleu", "comet", ...],  // 实际计算的指标
         "scores": [
             {
                 "bleu": 0.85,
@@ -458,7 +818,10 @@ def eval_batch():
             init_evaluator()
         
         # 获取请求数据
-        data = request.json
+        try:
+            data = read_request_data()
+        except (ValueError, RequestEntityTooLarge) as e:
+            return body_error_response(e)
         if not data:
             if DEBUG_MODE:
                 api_logger.error(f"[请求ID: {request_id}] 请求体为空")
@@ -496,6 +859,23 @@ def eval_batch():
         references = data["references"]
         sources = data.get("sources", [""] * len(translations))
         mqm_scores = data.get("mqm_scores", [None] * len(translations))
+        job_id = data.get("job_id")
+        response_format = data.get("response_format", "rows")
+        if response_format not in ("rows", "columnar"):
+            return jsonify({
+                "success": False,
+                "error": f"不支持的response_format: {response_format}（可选: rows, columnar）"
+            }), 400
+        
+        try:
+            checkpoint_path = checkpoint_path_for(job_id)
+            metrics = request_metrics(data)
+            lang_pairs = request_lang_pairs(data, len(translations))
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
         
         # 验证长度
         if len(translations) != len(references):
@@ -516,36 +896,25 @@ def eval_batch():
             api_logger.info(f"  - use_chrf: {evaluator.use_chrf}")
             api_logger.info(f"  - use_mqm: {evaluator.use_mqm}")
         
+        # 准入控制（按样本数计配额）
+        try:
+            ticket = admission.admit(client_id(), len(translations), priority=BULK)
+        except AdmissionRejected as e:
+            return reject_response(e, request_id)
+        
         # 开始批量评估
         if DEBUG_MODE:
             api_logger.info(f"[请求ID: {request_id}] 🚀 开始批量评估...")
             start_time = datetime.now()
         
-        results = evaluator.batch_score(
-            sources=sources,
-            translations=translations,
-            references=references,
-            mqm_scores=mqm_scores if mqm_scores else None
+        results = evaluate_batch(
+            ticket, sources, translations, references, mqm_scores, checkpoint_path, metrics, lang_pairs
         )
         
         # 转换为字典列表
         scores_list = []
         for i, score in enumerate(results):
-            if isinstance(score, PaperGradeScore):
-                score_dict = {
-                    "bleu": score.bleu,
-                    "comet": score.comet,
-                    "bleurt": score.bleurt,
-                    "bertscore_f1": score.bertscore_f1,
-                    "chrf": score.chrf,
-                    "mqm_adequacy": score.mqm_adequacy,
-                    "mqm_fluency": score.mqm_fluency,
-                    "mqm_terminology": score.mqm_terminology,
-                    "mqm_overall": score.mqm_overall,
-                    "final_score": score.final_score
-                }
-            else:
-                score_dict = score.__dict__ if hasattr(score, '__dict__') else {}
+            score_dict = score_to_dict(score)
             scores_list.append(score_dict)
             
             # 记录每个样本的评估结果
@@ -561,15 +930,13 @@ def eval_batch():
         if DEBUG_MODE:
             end_time = datetime.now()
             duration = (end_time - start_time).total_seconds()
-            api_logger.info(f"[请求ID: {request_id}] ✅ 批量评估完成 (总耗时: {duration:.3f}秒, 平均: {duration/len(results):.3f}秒/样本)")
+            api_logger.info(f"[请求ID: {request_id}] ✅ 批量评估完成 (总耗时: {duration:.3f}秒, 平均: {duration/max(1, len(results)):.3f}秒/样本)")
             api_logger.info(f"[请求ID: {request_id}] 📤 返回 {len(scores_list)} 个评估结果")
             api_logger.info(f"[请求ID: {request_id}] " + "=" * 100)
         
-        return jsonify({
-            "success": True,
-            "count": len(scores_list),
-            "scores": scores_list
-        })
+        return api_response(batch_payload(
+            scores_list, response_format, results[0].metrics if results else evaluator._select_metrics(metrics)
+        ))
         
     except Exception as e:
         error_msg = str(e)
@@ -587,21 +954,206 @@ def eval_batch():
         }), 500
 
 
-if __name__ == "__main__":
+@app.route("/qe", methods=["POST"])
+def qe_eval():
+    """
+    无参考质量评估（只运行COMETKiwi，不需要参考翻译，不计算BLEU/ChrF等参考指标）
+    
+    并发请求在服务端动态合并成批次推理，重复样本直接返回缓存分数
+    
+    Request Body:
+    {
+        "source": "源文本（必需）",
+        "translation": "翻译文本（必需）"
+    }
+    
+    Response:
+    {
+        "success": true,
+        "score": {"comet_kiwi": 0.82, "model": "Unbabel/wmt22-cometkiwi-da"}
+    }
+    """
+    request_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    
+    try:
+        try:
+            data = read_request_data()
+        except (ValueError, RequestEntityTooLarge) as e:
+            return body_error_response(e)
+        
+        for field in ("source", "translation"):
+            if not isinstance((data or {}).get(field), str):
+                return jsonify({
+                    "success": False,
+                    "error": f"缺少必需字段: {field}"
+                }), 400
+        
+        try:
+            ticket = admission.admit(client_id(), 1, priority=INTERACTIVE)
+        except AdmissionRejected as e:
+            return reject_response(e, request_id)
+        
+        estimator = get_quality_estimator()
+        with ticket:
+            score = estimator.submit(data["source"], data["translation"]).result()
+        
+        return api_response({
+            "success": True,
+            "score": {"comet_kiwi": score, "model": estimator.model_name}
+        })
+        
+    except Exception as e:
+        error_msg = str(e)
+        if DEBUG_MODE:
+            api_logger.error(f"[请求ID: {request_id}] ❌ QE评估错误: {error_msg}")
+            api_logger.error(f"[请求ID: {request_id}] 错误堆栈:\n{traceback.format_exc()}")
+        
+        return jsonify({
+            "success": False,
+            "error": error_msg,
+            "traceback": traceback.format_exc() if app.debug else None
+        }), 500
+
+
+@app.route("/qe/batch", methods=["POST"])
+def qe_eval_batch():
+    """
+    批量无参考质量评估（只运行COMETKiwi）
+    
+    Request Body:
+    {
+        "sources": ["源文本1", "源文本2", ...],
+        "translations": ["翻译1", "翻译2", ...],
+        "response_format": "columnar"  // 可选，返回 {"columns": {"comet_kiwi": [...]}}
+    }
+    
+    Response:
+    {
+        "success": true,
+        "metrics": ["comet_kiwi"],
+        "scores": [{"comet_kiwi": 0.82}, ...]
+    }
+    """
+    request_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    
+    try:
+        try:
+            data = read_request_data()
+        except (ValueError, RequestEntityTooLarge) as e:
+            return body_error_response(e)
+        
+        for field in ("sources", "translations"):
+            if not isinstance((data or {}).get(field), list):
+                return jsonify({
+                    "success": False,
+                    "error": f"缺少必需字段: {field}"
+                }), 400
+        
+        sources = data["sources"]
+        translations = data["translations"]
+        if len(sources) != len(translations):
+            return jsonify({
+                "success": False,
+                "error": f"sources和translations长度不匹配: {len(sources)} vs {len(translations)}"
+            }), 400
+        
+        response_format = data.get("response_format", "rows")
+        if response_format not in ("rows", "columnar"):
+            return jsonify({
+                "success": False,
+                "error": f"不支持的response_format: {response_format}（可选: rows, columnar）"
+            }), 400
+        
+        try:
+            ticket = admission.admit(client_id(), len(translations), priority=BULK)
+        except AdmissionRejected as e:
+            return reject_response(e, request_id)
+        
+        scores = evaluate_qe_batch(ticket, sources, translations)
+        rows = [{"comet_kiwi": score} for score in scores]
+        return api_response(batch_payload(rows, response_format, ["comet_kiwi"]))
+        
+    except Exception as e:
+        error_msg = str(e)
+        if DEBUG_MODE:
+            api_logger.error(f"[请求ID: {request_id}] ❌ 批量QE评估错误: {error_msg}")
+            api_logger.error(f"[请求ID: {request_id}] 错误堆栈:\n{traceback.format_exc()}")
+        
+        return jsonify({
+            "success": False,
+            "error": error_msg,
+            "traceback": traceback.format_exc() if app.debug else None
+        }), 500
+
+
+def build_arg_parser(description="翻译评估API服务器"):
+    """命令行参数（Flask服务器与ASGI服务器共用）"""
     import argparse
     
-    parser = argparse.ArgumentParser(description="翻译评估API服务器")
+    parser = argparse.ArgumentParser(description=description)
     parser.add_argument("--host", default="0.0.0.0", help="监听地址 (默认: 0.0.0.0)")
     parser.add_argument("--port", type=int, default=5001, help="监听端口 (默认: 5001)")
     parser.add_argument("--debug", action="store_true", help="启用Flask调试模式")
     parser.add_argument("--use-bleurt", action="store_true", help="启用BLEURT评估器")
     parser.add_argument("--no-api-debug", action="store_true", help="禁用API请求调试日志（默认开启）")
-    
-    args = parser.parse_args()
+    parser.add_argument("--rate-limit", type=float, default=100.0, help="每个客户端的配额，样本/秒 (默认: 100)")
+    parser.add_argument("--burst", type=float, default=2000.0, help="每个客户端的突发量，样本数 (默认: 2000)")
+    parser.add_argument("--max-queue", type=int, default=64, help="全局队列最大请求数 (默认: 64)")
+    parser.add_argument("--max-queued-segments", type=int, default=20000, help="全局队列最大样本数 (默认: 20000)")
+    parser.add_argument("--bulk-chunk-size", type=int, default=BULK_CHUNK_SIZE, help=f"批量请求的执行分块大小，分块之间优先处理单样本请求 (默认: {BULK_CHUNK_SIZE})")
+    parser.add_argument("--quota-file", help='按API Key的配额JSON文件，如 {"team-a": {"rate": 500, "burst": 50000}}')
+    parser.add_argument("--model-budget-mb", type=float, help="已加载模型的内存预算（MB），超出时按LRU卸载空闲模型 (默认: 不限制)")
+    parser.add_argument("--bertscore-lang", default=evaluator_config["bertscore_lang"], help=f"未指定语言对时BERTScore的目标语言 (默认: {evaluator_config['bertscore_lang']})")
+    parser.add_argument("--bertscore-idf", help="BERTScore的IDF表路径（用 translation-evaluator --build-bertscore-idf 构建）")
+    parser.add_argument("--update-bertscore-idf", action="store_true", help="把请求中新的参考翻译增量加入IDF表")
+    parser.add_argument("--bertscore-model", help="默认目标语言的BERTScore模型（如蒸馏模型 distilbert-base-multilingual-cased）")
+    parser.add_argument("--bertscore-precision", choices=["fp32", "int8", "bf16"], default="fp32", help="BERTScore推理精度：int8动态量化（CPU）或bf16混合精度 (默认: fp32)")
+    parser.add_argument("--bertscore-num-layers", type=int, help="BERTScore使用的隐藏层（更浅的层更快，默认为模型的推荐层）")
+    parser.add_argument("--thread-budget", help="按指标分配torch/TF/BLAS线程数与CPU亲和性的JSON配置（用 translation-evaluator --benchmark-threads 生成）")
+    parser.add_argument("--token-cache-dir", help="COMET/BLEURT/BERTScore共用的分词缓存目录（子词id持久化，跨进程共享）")
+    parser.add_argument("--qe-model", default=qe_config["model"], help=f"/qe使用的COMETKiwi模型 (默认: {qe_config['model']})")
+    parser.add_argument("--qe-batch-size", type=int, default=qe_config["max_batch_size"], help=f"/qe动态批处理的最大批大小 (默认: {qe_config['max_batch_size']})")
+    parser.add_argument("--qe-max-wait-ms", type=float, default=qe_config["max_wait"] * 1000, help=f"/qe凑批的最长等待时间，毫秒 (默认: {qe_config['max_wait'] * 1000:.0f})")
+    return parser
+
+
+def configure_from_args(args):
+    """按命令行参数配置日志、准入控制和调度，并初始化评估器"""
+    global DEBUG_MODE, BULK_CHUNK_SIZE, admission
     
     # 设置DEBUG_MODE
     DEBUG_MODE = not args.no_api_debug
     
+    client_quotas = None
+    if args.quota_file:
+        with open(args.quota_file, "r", encoding="utf-8") as f:
+            client_quotas = json.load(f)
+    BULK_CHUNK_SIZE = max(1, args.bulk_chunk_size)
+    admission = AdmissionController(
+        rate=args.rate_limit,
+        burst=args.burst,
+        max_queue=args.max_queue,
+        max_queued_segments=args.max_queued_segments,
+        client_quotas=client_quotas,
+        bulk_chunk_size=BULK_CHUNK_SIZE
+    )
+    if args.model_budget_mb is not None:
+        get_registry().set_budget(args.model_budget_mb)
+    if args.thread_budget:
+        get_thread_budget().configure(ThreadBudget.load(args.thread_budget))
+    evaluator_config["bertscore_idf"] = args.bertscore_idf
+    evaluator_config["update_bertscore_idf"] = args.update_bertscore_idf
+    evaluator_config["token_cache_dir"] = args.token_cache_dir
+    evaluator_config["bertscore_lang"] = args.bertscore_lang
+    evaluator_config["bertscore_model"] = args.bertscore_model
+    evaluator_config["bertscore_precision"] = args.bertscore_precision
+    evaluator_config["bertscore_num_layers"] = args.bertscore_num_layers
+    qe_config.update({
+        "model": args.qe_model,
+        "max_batch_size": max(1, args.qe_batch_size),
+        "max_wait": max(0.0, args.qe_max_wait_ms) / 1000
+    })
+    
     # 初始化评估器（传递use_bleurt参数）
     # 如果命令行指定了--use-bleurt，使用命令行参数；否则使用配置中的默认值
     use_bleurt = args.use_bleurt if args.use_bleurt else evaluator_config.get("use_bleurt", False)
@@ -610,11 +1162,18 @@ if __name__ == "__main__":
     print(f"   配置中的 use_bleurt: {evaluator_config.get('use_bleurt', False)}")
     print(f"   最终使用: {use_bleurt}")
     init_evaluator(use_bleurt=use_bleurt)
-    
-    print(f"\n🚀 启动API服务器...")
+
+
+def print_startup_info(args, server_name, details=None):
+    """打印启动信息"""
+    print(f"\n🚀 启动API服务器 ({server_name})...")
     print(f"   地址: http://{args.host}:{args.port}")
-    print(f"   Flask调试模式: {args.debug}")
+    for line in details or []:
+        print(f"   {line}")
     print(f"   API请求调试日志: {'开启' if DEBUG_MODE else '关闭'}")
+    print(f"   客户端配额: {args.rate_limit} 样本/秒 (突发 {args.burst})")
+    print(f"   批量请求分块: {BULK_CHUNK_SIZE} 个样本")
+    print(f"   全局队列上限: {args.max_queue} 个请求 / {args.max_queued_segments} 个样本")
     print(f"   日志目录: {LOGS_DIR}")
     if DEBUG_MODE:
         log_file = LOGS_DIR / f"api_{datetime.now().strftime('%Y%m%d')}.log"
@@ -623,7 +1182,13 @@ if __name__ == "__main__":
     print(f"💚 健康检查: http://{args.host}:{args.port}/health")
     print(f"📊 评估接口: http://{args.host}:{args.port}/eval")
     print(f"📦 批量评估: http://{args.host}:{args.port}/eval/batch")
+    print(f"🥝 无参考QE: http://{args.host}:{args.port}/qe ({qe_config['model']})")
     print("\n按 Ctrl+C 停止服务器\n")
+
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    configure_from_args(args)
+    print_startup_info(args, "Flask", [f"Flask调试模式: {args.debug}"])
     
     app.run(host=args.host, port=args.port, debug=args.debug)
-
@@ -0,0 +1,403 @@
+"""
+翻译评估API服务器（ASGI版本）
+与eval_server.py提供相同的 /、/health、/eval、/eval/batch、/qe、/qe/batch 接口。
+事件循环只处理网络I/O，评估在有界线程池中执行，
+大量空闲或慢速连接不会占用工作线程
+
+运行:
+    python eval_server_asgi.py --port 5001          # 需要安装uvicorn
+    uvicorn eval_server_asgi:app --port 5001        # 或任意ASGI服务器
+"""
+
+import asyncio
+import os
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import eval_server as server
+from translation_evaluator.admission import AdmissionRejected
+from translation_evaluator.codec import MAX_BODY_SIZE, decode_body, encode_body, choose_encoding, wants_msgpack
+from translation_evaluator.references import has_reference
+from translation_evaluator.scheduler import INTERACTIVE, BULK
+
+# 评估线程池：交互式与批量请求分开，线程在调度器上等待执行槽位。
+# 准入控制限制了排队的请求数，因此线程池的任务队列也是有界的
+INTERACTIVE_WORKERS = 4
+BULK_WORKERS = 2
+
+_executors = {}
+
+
+def get_executor(priority):
+    """按优先级类别获取评估线程池（首次使用时创建）"""
+    if priority not in _executors:
+        if priority == INTERACTIVE:
+            _executors[priority] = ThreadPoolExecutor(INTERACTIVE_WORKERS, thread_name_prefix="eval-interactive")
+        else:
+            _executors[priority] = ThreadPoolExecutor(BULK_WORKERS, thread_name_prefix="eval-bulk")
+    return _executors[priority]
+
+
+def shutdown_executors():
+    """关闭评估线程池"""
+    for executor in _executors.values():
+        executor.shutdown(wait=False)
+    _executors.clear()
+
+
+class HTTPError(Exception):
+    """以JSON错误响应返回的请求错误"""
+
+    def __init__(self, status, message, headers=None, extra=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+        self.extra = extra or {}
+
+
+async def read_body(receive):
+    """读取请求体（超过上限时返回413）"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ConnectionResetError("客户端已断开")
+        body = message.get("body", b"")
+        size += len(body)
+        if size > MAX_BODY_SIZE:
+            raise HTTPError(413, f"请求体过大（上限 {MAX_BODY_SIZE} 字节）")
+        chunks.append(body)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+def header(scope, name):
+    """读取请求头（name为小写字节串）"""
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def send_response(send, status, payload, headers=None, scope=None):
+    """
+    发送响应（传入scope时按Accept/Accept-Encoding协商MessagePack和压缩）
+    """
+    binary, encoding = False, None
+    if scope is not None:
+        binary = wants_msgpack(header(scope, b"accept"))
+        encoding = choose_encoding(header(scope, b"accept-encoding"))
+    
+    if payload.get("count", 0) > 64:
+        # 大响应在线程中编码，不阻塞事件循环
+        body, body_headers = await asyncio.get_running_loop().run_in_executor(
+            None, encode_body, payload, binary, encoding
+        )
+    else:
+        body, body_headers = encode_body(payload, binary, encoding)
+    body_headers.update(headers or {})
+    
+    response_headers = [
+        (b"content-length", str(len(body)).encode()),
+        (b"access-control-allow-origin", b"*"),
+    ]
+    for key, value in body_headers.items():
+        response_headers.append((key.lower().encode(), str(value).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": response_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+def client_id(scope):
+    """客户端标识：优先使用X-API-Key请求头，否则使用客户端地址"""
+    api_key = header(scope, b"x-api-key")
+    if api_key:
+        return api_key
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def parse_body(scope, body):
+    """
+    解析请求体（支持gzip/zstd内容编码和MessagePack；大请求体在线程中解析，不阻塞事件循环）
+    """
+    if not body:
+        raise HTTPError(400, "请求体不能为空")
+    args = (body, header(scope, b"content-encoding"), header(scope, b"content-type"))
+    try:
+        if len(body) > 64 * 1024:
+            data = await asyncio.get_running_loop().run_in_executor(None, decode_body, *args)
+        else:
+            data = decode_body(*args)
+    except ValueError as e:
+        raise HTTPError(400, f"请求体格式错误: {e}")
+    if not data:
+        raise HTTPError(400, "请求体不能为空")
+    return data
+
+
+def admit(scope, cost, priority):
+    """准入控制（被拒绝时返回429和Retry-After，单个请求过大时返回413）"""
+    try:
+        return server.admission.admit(client_id(scope), cost, priority=priority)
+    except AdmissionRejected as e:
+        raise HTTPError(
+            e.status, e.message,
+            headers={"Retry-After": e.retry_after_header},
+            extra={"reason": e.reason, "retry_after": e.retry_after}
+        )
+
+
+def run_single(ticket, source, translation, reference, mqm_score, metrics, lang_pair):
+    """在评估线程中执行单样本评估"""
+    score = server.evaluate_single(ticket, source, translation, reference, mqm_score, metrics, lang_pair)
+    return server.score_to_dict(score, include_model_info=True)
+
+
+def run_batch(ticket, sources, translations, references, mqm_scores, checkpoint_path, metrics, lang_pairs):
+    """
+    在评估线程中执行批量评估（按分块申请执行槽位，合并进行中的相同样本）
+    
+    Returns:
+        (逐样本分数字典列表, 实际计算的指标)
+    """
+    results = server.evaluate_batch(
+        ticket, sources, translations, references, mqm_scores, checkpoint_path, metrics, lang_pairs
+    )
+    computed = results[0].metrics if results else server.evaluator._select_metrics(metrics)
+    return [server.score_to_dict(score) for score in results], computed
+
+
+def parse_metrics(data):
+    """请求的指标子集（不支持的指标返回400）"""
+    try:
+        return server.request_metrics(data)
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+
+
+def parse_lang_pairs(data, n=None):
+    """请求的语言对（格式不正确时返回400）"""
+    try:
+        return server.request_lang_pairs(data, n)
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+
+
+async def ensure_evaluator():
+    """确保评估器已初始化（在线程中初始化，不阻塞事件循环）"""
+    if server.evaluator is None:
+        await asyncio.get_running_loop().run_in_executor(get_executor(BULK), server.init_evaluator)
+
+
+async def handle_eval(scope, receive):
+    """单个样本评估"""
+    data = await parse_body(scope, await read_body(receive))
+    if "translation" not in data:
+        raise HTTPError(400, "缺少必需字段: translation")
+    if "reference" not in data:
+        raise HTTPError(400, "缺少必需字段: reference")
+    if not has_reference(data["reference"]):
+        raise HTTPError(400, "reference不能为空（BLEURT等评估器需要reference）")
+    metrics = parse_metrics(data)
+    lang_pair = parse_lang_pairs(data)
+
+    await ensure_evaluator()
+    ticket = admit(scope, 1, INTERACTIVE)
+    score_dict = await asyncio.get_running_loop().run_in_executor(
+        get_executor(INTERACTIVE), run_single, ticket,
+        data.get("source", ""), data["translation"], data["reference"], data.get("mqm_score"), metrics, lang_pair
+    )
+    return {"success": True, "score": score_dict}
+
+
+async def handle_batch(scope, receive):
+    """批量评估"""
+    data = await parse_body(scope, await read_body(receive))
+    if "translations" not in data:
+        raise HTTPError(400, "缺少必需字段: translations")
+    if "references" not in data:
+        raise HTTPError(400, "缺少必需字段: references")
+
+    translations = data["translations"]
+    references = data["references"]
+    sources = data.get("sources", [""] * len(translations))
+    mqm_scores = data.get("mqm_scores", [None] * len(translations))
+    response_format = data.get("response_format", "rows")
+    if response_format not in ("rows", "columnar"):
+        raise HTTPError(400, f"不支持的response_format: {response_format}（可选: rows, columnar）")
+    if len(translations) != len(references):
+        raise HTTPError(400, f"translations和references长度不匹配: {len(translations)} vs {len(references)}")
+    try:
+        checkpoint_path = server.checkpoint_path_for(data.get("job_id"))
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    metrics = parse_metrics(data)
+    lang_pairs = parse_lang_pairs(data, len(translations))
+
+    await ensure_evaluator()
+    ticket = admit(scope, len(translations), BULK)
+    scores_list, computed = await asyncio.get_running_loop().run_in_executor(
+        get_executor(BULK), run_batch, ticket,
+        sources, translations, references, mqm_scores, checkpoint_path, metrics, lang_pairs
+    )
+    return server.batch_payload(scores_list, response_format, computed)
+
+
+async def handle_qe(scope, receive):
+    """无参考质量评估（等待动态批处理的结果，不占用评估线程）"""
+    data = await parse_body(scope, await read_body(receive))
+    for field in ("source", "translation"):
+        if not isinstance(data.get(field), str):
+            raise HTTPError(400, f"缺少必需字段: {field}")
+
+    ticket = admit(scope, 1, INTERACTIVE)
+    estimator = server.get_quality_estimator()
+    with ticket:
+        score = await asyncio.wrap_future(estimator.submit(data["source"], data["translation"]))
+    return {"success": True, "score": {"comet_kiwi": score, "model": estimator.model_name}}
+
+
+async def handle_qe_batch(scope, receive):
+    """批量无参考质量评估"""
+    data = await parse_body(scope, await read_body(receive))
+    for field in ("sources", "translations"):
+        if not isinstance(data.get(field), list):
+            raise HTTPError(400, f"缺少必需字段: {field}")
+    sources, translations = data["sources"], data["translations"]
+    if len(sources) != len(translations):
+        raise HTTPError(400, f"sources和translations长度不匹配: {len(sources)} vs {len(translations)}")
+    response_format = data.get("response_format", "rows")
+    if response_format not in ("rows", "columnar"):
+        raise HTTPError(400, f"不支持的response_format: {response_format}（可选: rows, columnar）")
+
+    ticket = admit(scope, len(translations), BULK)
+    scores = await asyncio.get_running_loop().run_in_executor(
+        get_executor(BULK), server.evaluate_qe_batch, ticket, sources, translations
+    )
+    return server.batch_payload([{"comet_kiwi": score} for score in scores], response_format, ["comet_kiwi"])
+
+
+def index_info():
+    """API首页"""
+    return {
+        "service": "Translation Evaluator API (ASGI)",
+        "version": "1.0.0",
+        "endpoints": {
+            "/": "API信息",
+            "/health": "健康检查",
+            "/eval": "单个样本评估 (POST)",
+            "/eval/batch": "批量评估 (POST)",
+            "/qe": "无参考质量评估，只运行COMETKiwi (POST)",
+            "/qe/batch": "批量无参考质量评估 (POST)"
+        },
+        "usage": "请求/响应格式与eval_server.py相同"
+    }
+
+
+ROUTES = {
+    ("GET", "/"): lambda scope, receive: index_info(),
+    ("GET", "/health"): lambda scope, receive: server.health_status(),
+    ("POST", "/eval"): handle_eval,
+    ("POST", "/eval/batch"): handle_batch,
+    ("POST", "/qe"): handle_qe,
+    ("POST", "/qe/batch"): handle_qe_batch,
+}
+
+
+async def lifespan(receive, send):
+    """启动时在线程中初始化评估器，关闭时释放线程池"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await ensure_evaluator()
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            shutdown_executors()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI入口"""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"].rstrip("/") or "/"
+    if method == "OPTIONS":
+        # CORS预检
+        await send({"type": "http.response.start", "status": 204, "headers": [
+            (b"access-control-allow-origin", b"*"),
+            (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+            (b"access-control-allow-headers", b"Content-Type, X-API-Key"),
+        ]})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    handler = ROUTES.get((method, path))
+    if handler is None:
+        allowed = any(route_path == path for _, route_path in ROUTES)
+        status = 405 if allowed else 404
+        await send_response(send, status, {"success": False, "error": "不支持的请求方法" if allowed else "接口不存在"})
+        return
+
+    request_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    started = datetime.now()
+    try:
+        result = handler(scope, receive)
+        if asyncio.iscoroutine(result):
+            result = await result
+        await send_response(send, 200, result, scope=scope)
+        status = 200
+    except HTTPError as e:
+        payload = {"success": False, "error": e.message}
+        payload.update(e.extra)
+        await send_response(send, e.status, payload, e.headers)
+        status = e.status
+    except ConnectionResetError:
+        return
+    except Exception as e:
+        traceback_str = traceback.format_exc()
+        if server.DEBUG_MODE:
+            server.api_logger.error(f"[请求ID: {request_id}] ❌ 评估错误: {e}")
+            server.api_logger.error(f"[请求ID: {request_id}] 错误堆栈:\n{traceback_str}")
+        await send_response(send, 500, {"success": False, "error": str(e), "traceback": None})
+        status = 500
+
+    if server.DEBUG_MODE and method == "POST":
+        duration = (datetime.now() - started).total_seconds()
+        server.api_logger.info(f"[请求ID: {request_id}] {method} {path} -> {status} (耗时: {duration:.3f}秒)")
+
+
+if __name__ == "__main__":
+    parser = server.build_arg_parser("翻译评估API服务器（ASGI）")
+    parser.add_argument("--interactive-workers", type=int, default=INTERACTIVE_WORKERS, help=f"单样本评估线程数 (默认: {INTERACTIVE_WORKERS})")
+    parser.add_argument("--bulk-workers", type=int, default=BULK_WORKERS, help=f"批量评估线程数 (默认: {BULK_WORKERS})")
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ 运行ASGI服务器需要安装uvicorn: pip install uvicorn")
+        sys.exit(1)
+
+    INTERACTIVE_WORKERS = max(1, args.interactive_workers)
+    BULK_WORKERS = max(1, args.bulk_workers)
+    server.configure_from_args(args)
+    server.print_startup_info(args, "ASGI/uvicorn", [
+        f"评估线程: 交互式 {INTERACTIVE_WORKERS} / 批量 {BULK_WORKERS}"
+    ])
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="debug" if args.debug else "info")
@@ -27,6 +27,11 @@ setup(
         "Programming Language :: Python :: 3.10",
     ],
     python_requires=">=3.8",
+    entry_points={
+        "console_scripts": [
+            "translation-evaluator=translation_evaluator.cli:main",
+        ],
+    },
     install_requires=[
         "numpy>=1.20.0",
         "dataclasses; python_version<'3.7'",
@@ -39,6 +44,9 @@ setup(
         "comet": ["unbabel-comet>=2.0.0"],
         "bleurt": ["bleurt>=0.0.1"],
         "chrf": ["sacrebleu>=2.0.0"],
+        "zstd": ["zstandard>=0.15.0"],
+        "asgi": ["uvicorn>=0.20.0"],
+        "fast-io": ["orjson>=3.6.0", "msgpack>=1.0.0", "zstandard>=0.15.0"],
         "all": [
             "bert-score>=0.3.13",
             "unbabel-comet>=2.0.0",
@@ -199,6 +199,839 @@ def test_combined_scorer():
         return False
 
 
+def test_significance():
+    """测试配对Bootstrap显著性检验"""
+    print("\n" + "=" * 80)
+    print("测试6: 配对Bootstrap显著性检验")
+    print("=" * 80)
+
+    import numpy as np
+    from sacrebleu.metrics import CHRF
+    from translation_evaluator import paired_bootstrap, char_bleu_statistics
+    from translation_evaluator.chrf_scorer import ChrFScorer
+
+    rng = np.random.default_rng(0)
+    base = rng.normal(0.8, 0.1, 500)
+    better = base + 0.05 + rng.normal(0, 0.02, 500)
+
+    translations = ["机器学习是人工智能的一个子集。", "深度学习是机器学习的一个分支。"] * 250
+    references = ["机器学习是人工智能的子集。", "深度学习是机器学习的分支。"] * 250
+    bleu_stats = [char_bleu_statistics(t, r) for t, r in zip(translations, references)]
+
+    # 逐句ChrF充分统计量求和后的语料分数与sacrebleu的语料级ChrF一致
+    chrf = ChrFScorer()
+    chrf_stats = chrf.sentence_statistics(translations, references)
+    expected_chrf = CHRF(word_order=chrf.n, beta=chrf.beta).corpus_score(translations, [references]).score / 100.0
+    assert abs(chrf.corpus_score_from_statistics(chrf_stats) - expected_chrf) < 1e-9
+
+    result = paired_bootstrap(
+        {
+            "base": {"comet": base, "bleu": bleu_stats, "chrf": chrf_stats},
+            "better": {"comet": better, "bleu": bleu_stats, "chrf": chrf_stats}
+        },
+        n_resamples=500,
+        max_memory_mb=1
+    )
+
+    pair = result["metrics"]["comet"]["pairs"][0]
+    bleu_pair = result["metrics"]["bleu"]["pairs"][0]
+    chrf_result = result["metrics"]["chrf"]
+    print(f"   COMET差值: {pair['delta']:.4f}, p={pair['p_value']:.4f}")
+    print(f"   BLEU差值: {bleu_pair['delta']:.4f}, p={bleu_pair['p_value']:.4f}")
+    print(f"   ChrF: {chrf_result['systems']['base']['score']:.4f} (sacrebleu: {expected_chrf:.4f})")
+    # delta = system_a - system_b
+    assert pair["system_a"] == "base" and pair["delta"] < 0 and pair["p_value"] < 0.05
+    assert bleu_pair["delta"] == 0.0
+    assert abs(chrf_result["systems"]["base"]["score"] - expected_chrf) < 1e-9
+    assert chrf_result["pairs"][0]["delta"] == 0.0
+
+    print("✅ 显著性检验完成")
+    return True
+
+
+class _StubCOMET:
+    """记录调用参数的COMET替身（分数为 0.5 + 0.1 × 样本在本次调用中的位置）"""
+
+    model_name = "stub-comet-da"
+    requires_reference = True
+
+    def __init__(self):
+        self.calls = []
+
+    def score(self, sources, translations, references=None, aggregation="max"):
+        self.calls.append(references)
+        if self.requires_reference and references is None:
+            return {"scores": [], "error": "references required"}
+        return {"scores": [0.5 + 0.1 * i for i in range(len(translations))]}
+
+
+def test_mixed_reference_batch():
+    """测试批量评分中有参考与无参考样本混合时的COMET"""
+    print("\n" + "=" * 80)
+    print("测试7: 混合参考的批量COMET评分")
+    print("=" * 80)
+
+    from translation_evaluator import CombinedQualityScorer
+
+    scorer = CombinedQualityScorer(use_comet=False, use_bleurt=False, use_bertscore=False, use_chrf=False)
+    stub = _StubCOMET()
+    scorer.use_comet, scorer.comet_scorer = True, stub
+
+    sources = ["s1", "s2", "s3"]
+    translations = ["t1", "t2", "t3"]
+    results = scorer.batch_score(sources, translations, ["r1", "r2", ""], metrics=["comet"])
+    print(f"   COMET: {[r.comet for r in results]}")
+    # 有参考的样本带着参考推理，无参考的样本被跳过
+    assert stub.calls == [["r1", "r2"]]
+    assert [r.comet for r in results] == [0.5, 0.6, 0.0]
+
+    # 无参考模型（如CometKiwi）对无参考样本单独推理
+    stub.requires_reference = False
+    stub.calls.clear()
+    results = scorer.batch_score(sources, translations, ["r1", "", None], metrics=["comet"])
+    assert stub.calls == [["r1"], None]
+    assert [r.comet for r in results] == [0.5, 0.5, 0.6]
+
+    print("✅ 混合参考批量评分正确")
+    return True
+
+
+def test_document_alignment():
+    """测试文档切分与对齐"""
+    print("\n" + "=" * 80)
+    print("测试8: 文档切分与对齐")
+    print("=" * 80)
+
+    from translation_evaluator import split_sentences, align_document
+
+    assert split_sentences("今天天气很好。我们去公园吧！好的？", "zh") == ["今天天气很好。", "我们去公园吧！", "好的？"]
+    assert split_sentences("Mr. Smith arrived at 5 p.m. today. He left. Then A. B. Jones came.", "en") == [
+        "Mr. Smith arrived at 5 p.m. today.", "He left.", "Then A. B. Jones came."
+    ]
+    assert split_sentences("第一行\n\n第二行", "zh") == ["第一行", "第二行"]
+
+    # 一一对应的文档
+    source = "The weather is nice today. Let's go to the park. Sounds good."
+    reference = "今天天气很好。我们去公园吧。听起来不错。"
+    translation = "今天天气不错。我们去公园。好主意。"
+    segments = align_document(source, translation, reference, "en", "zh")
+    print(f"   对齐片段: {segments}")
+    assert len(segments) == 3
+    assert segments[0] == ("The weather is nice today.", "今天天气不错。", "今天天气很好。")
+
+    # 单句无标点的译文对50句参考：不应报错，译文和参考完整保留
+    reference = " ".join(f"This is reference sentence number {i}." for i in range(50))
+    translation = "one long hypothesis without any punctuation " * 20
+    segments = align_document("", translation, reference, "en", "en")
+    assert "".join(hyp for _, hyp, _ in segments) == translation.strip()
+    assert " ".join(ref for _, _, ref in segments) == reference
+
+    print("✅ 文档切分与对齐正确")
+    return True
+
+
+def test_checkpoint_resume():
+    """测试中断后从检查点恢复批量评估"""
+    print("\n" + "=" * 80)
+    print("测试9: 检查点断点续评")
+    print("=" * 80)
+
+    import os
+    import json
+    import tempfile
+    import threading
+    from contextlib import contextmanager
+    from translation_evaluator import UnifiedEvaluator
+    from translation_evaluator.checkpoint import COMPLETED_TTL, purge_expired
+
+    evaluator = UnifiedEvaluator(
+        use_bleu=True, use_comet=False, use_bleurt=False, use_bertscore=False, use_mqm=False, use_chrf=False
+    )
+    sources = [f"source {i}" for i in range(5)]
+    translations = [f"the cat sat on mat {i}" for i in range(5)]
+    references = [f"the cat sat on the mat {i}" for i in range(5)]
+    expected = [r.bleu for r in evaluator.batch_score(sources, translations, references)]
+
+    computed = []
+
+    @contextmanager
+    def interrupt_at(chunk_sizes, limit):
+        # 计算到第limit个分块时模拟中断
+        if limit is not None and len(computed) >= limit:
+            raise KeyboardInterrupt
+        computed.append(chunk_sizes)
+        yield
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "job")
+        try:
+            evaluator.batch_score(
+                sources, translations, references, checkpoint_path=path, chunk_size=2,
+                chunk_context=lambda size: interrupt_at(size, 2)
+            )
+        except KeyboardInterrupt:
+            pass
+        assert computed == [2, 2]
+        assert os.path.exists(path + ".index")
+
+        # 重新提交：只计算剩余的分块，结果与一次性评估一致
+        computed.clear()
+        results = evaluator.batch_score(
+            sources, translations, references, checkpoint_path=path, chunk_size=2,
+            chunk_context=lambda size: interrupt_at(size, None)
+        )
+        print(f"   恢复后计算的分块: {computed}")
+        assert computed == [1]
+        assert [r.bleu for r in results] == expected
+
+        # 完成后检查点保留：客户端断线后重新提交直接取回结果；相同任务的并发运行依次执行
+        computed.clear()
+        runs = [None, None]
+
+        def resubmit(i):
+            runs[i] = evaluator.batch_score(
+                sources, translations, references, checkpoint_path=path, chunk_size=2,
+                chunk_context=lambda size: interrupt_at(size, None)
+            )
+
+        threads = [threading.Thread(target=resubmit, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert computed == []
+        assert [r.bleu for r in runs[0]] == [r.bleu for r in runs[1]] == expected
+
+        # 过期的已完成检查点被清理，之后重新计算
+        assert purge_expired(directory) == 0
+        with open(path + ".index", "r", encoding="utf-8") as f:
+            index = json.load(f)
+        index["completed_at"] -= COMPLETED_TTL + 1
+        with open(path + ".index", "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        assert purge_expired(directory) == 1
+        assert not os.path.exists(path + ".index") and not os.path.exists(path + ".data")
+        evaluator.batch_score(
+            sources, translations, references, checkpoint_path=path, chunk_size=2,
+            chunk_context=lambda size: interrupt_at(size, None)
+        )
+        assert computed == [2, 2, 1]
+
+    print("✅ 检查点断点续评正确")
+    return True
+
+
+class _StubTokenizer:
+    """按空格分词的分词器替身（词 → 词表中的位置，CLS=0，SEP=1）"""
+
+    model_max_length = 512
+    cls_token_id = 0
+    sep_token_id = 1
+
+    def __init__(self, name="stub-bert"):
+        self.name_or_path = name
+        self.vocab = {}
+
+    def encode(self, text, add_special_tokens=True, max_length=None, truncation=False):
+        ids = [self.vocab.setdefault(word, len(self.vocab) + 2) for word in text.split()]
+        return [self.cls_token_id] + ids + [self.sep_token_id]
+
+
+def test_idf_table():
+    """测试IDF表的增量更新、持久化与分词器校验"""
+    print("\n" + "=" * 80)
+    print("测试10: IDF表")
+    print("=" * 80)
+
+    import math
+    import os
+    import tempfile
+    from translation_evaluator.idf import IDFTable
+
+    tokenizer = _StubTokenizer()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "idf.json")
+        table = IDFTable(path)
+
+        # 多参考的每个参考计为一篇文档，重复到达的参考不重复计数
+        assert table.add(["the cat", ["the dog", "a cat"]], tokenizer) == 3
+        assert table.add(["the cat", "", "the bird"], tokenizer) == 1
+        assert len(table) == 4 and table.dirty
+
+        weights = table.weights(tokenizer)
+        the, cat = tokenizer.vocab["the"], tokenizer.vocab["cat"]
+        assert math.isclose(weights[the], math.log(5 / 4))
+        assert math.isclose(weights[cat], math.log(5 / 3))
+        assert weights[tokenizer.cls_token_id] == 0 and weights[tokenizer.sep_token_id] == 0
+        assert math.isclose(weights.copy()[999], math.log(5))
+
+        # 保存后重新加载：计数、去重记录和分词器一致
+        table.save()
+        assert not table.dirty
+        loaded = IDFTable(path)
+        assert loaded.stats() == table.stats()
+        assert loaded.add(["the dog"], tokenizer) == 0
+        assert dict(loaded.weights(tokenizer)) == dict(weights)
+
+        # 其他分词器构建的表不能混用
+        try:
+            loaded.add(["the cat"], _StubTokenizer("other-bert"))
+            assert False, "分词器不一致时应抛出ValueError"
+        except ValueError as e:
+            print(f"   分词器不一致: {e}")
+
+    # 共享BERTScorer：同一IDF表增量更新后的调用不等待正在执行的调用，切换到不加权时才等待
+    import threading
+    from translation_evaluator.bertscore_scorer import _with_idf
+
+    class _Scorer:
+        _idf, _idf_dict = False, None
+
+    scorer = _Scorer()
+    old_weights = table.weights(tokenizer)
+    table.add(["a new reference"], tokenizer)
+    new_weights = table.weights(tokenizer)
+    assert new_weights is not old_weights
+    unweighted = threading.Event()
+
+    def score_unweighted():
+        with _with_idf(scorer, None):
+            unweighted.set()
+
+    with _with_idf(scorer, old_weights, table):
+        with _with_idf(scorer, new_weights, table):
+            assert scorer._idf and scorer._idf_dict is new_weights
+        other = threading.Thread(target=score_unweighted)
+        other.start()
+        assert not unweighted.wait(timeout=0.2)
+    other.join(timeout=5.0)
+    assert unweighted.is_set() and not scorer._idf
+
+    print("✅ IDF表正确")
+    return True
+
+
+class _StubKiwi:
+    """记录每次推理批次的COMETKiwi替身（分数为译文长度 / 10，fail时抛出异常）"""
+
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+
+    def score(self, sources, translations):
+        self.batches.append(list(translations))
+        if self.fail:
+            raise RuntimeError("stub inference failed")
+        return {"scores": [len(t) / 10 for t in translations]}
+
+
+def test_quality_estimator():
+    """测试QE的动态批处理、缓存与异常传递"""
+    print("\n" + "=" * 80)
+    print("测试11: QE动态批处理")
+    print("=" * 80)
+
+    import threading
+    from concurrent.futures import wait
+    from translation_evaluator.qe import QualityEstimator
+
+    qe = QualityEstimator(max_batch_size=4, max_wait=1.0)
+    stub = qe.scorer = _StubKiwi()
+    try:
+        # 并发提交的样本凑成一批推理（批满立即执行，不等max_wait）；在途的相同样本共享结果
+        futures = [None] * 5
+        barrier = threading.Barrier(5)
+
+        def submit(i, translation):
+            barrier.wait()
+            futures[i] = qe.submit("src", translation)
+
+        threads = [
+            threading.Thread(target=submit, args=(i, t)) for i, t in enumerate(["a", "bb", "ccc", "dddd", "a"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not wait(futures, timeout=2.0).not_done
+        print(f"   推理批次: {stub.batches}")
+        assert len(stub.batches) == 1 and sorted(stub.batches[0]) == ["a", "bb", "ccc", "dddd"]
+        assert [f.result() for f in futures] == [0.1, 0.2, 0.3, 0.4, 0.1]
+
+        # 缓存命中：不再推理，批量接口只推理未命中的唯一样本
+        assert qe.submit("src", "bb").result(timeout=0) == 0.2
+        assert qe.score_batch(["src"] * 3, ["ccc", "eeeee", "eeeee"]) == [0.3, 0.5, 0.5]
+        assert stub.batches[1:] == [["eeeee"]]
+        stats = qe.stats()
+        assert stats["cache_hits"] == 3 and stats["coalesced"] == 1
+
+        # 推理异常传递给同一批次中所有等待的Future
+        stub.fail = True
+        futures = [qe.submit("src", t) for t in ["w", "x", "y", "z"]]
+        for future in futures:
+            try:
+                future.result(timeout=2.0)
+                assert False, "推理失败时应抛出异常"
+            except RuntimeError as e:
+                assert "stub inference failed" in str(e)
+        # 失败的样本不进入缓存，恢复后重新推理
+        stub.fail = False
+        assert qe.score("src", "w", timeout=10.0) == 0.1
+    finally:
+        qe.close()
+
+    print("✅ QE动态批处理正确")
+    return True
+
+
+def test_admission():
+    """测试准入控制：大批次不挤占交互式请求，单个请求的透支有上限"""
+    print("\n" + "=" * 80)
+    print("测试12: 准入控制")
+    print("=" * 80)
+
+    from translation_evaluator.admission import AdmissionController, AdmissionRejected
+    from translation_evaluator.scheduler import BULK, INTERACTIVE
+
+    admission = AdmissionController(
+        max_queue=4, max_queued_segments=20000, bulk_chunk_size=64, interactive_reserve=2,
+        client_quotas={"team-a": {"rate": 500, "burst": 50000}}
+    )
+    # 50000样本的批次分块执行，队列中只计一个分块
+    bulk = admission.admit("team-a", 50000, priority=BULK)
+    assert admission.stats()["queued_segments"] == 64
+
+    # 大批次进行中，其他客户端的交互式请求仍可进入
+    alice = admission.admit("alice", 1, priority=INTERACTIVE)
+    bob = admission.admit("bob", 1, priority=INTERACTIVE)
+
+    # 批量请求不能占用为交互式请求保留的名额
+    admission.max_queued_segments = 100
+    try:
+        admission.admit("carol", 64, priority=BULK)
+        assert False, "队列样本数已满时应拒绝批量请求"
+    except AdmissionRejected as e:
+        assert e.reason == "queue_full" and e.status == 429
+    for ticket in (alice, bob):
+        ticket.release()
+    admission.max_queued_segments = 20000
+    carol = admission.admit("carol", 64, priority=BULK)
+    try:
+        admission.admit("dave", 1, priority=BULK)
+        assert False, "保留名额不应分给批量请求"
+    except AdmissionRejected as e:
+        assert e.reason == "queue_full"
+    admission.admit("erin", 1, priority=INTERACTIVE).release()
+    carol.release()
+    bulk.release()
+    assert admission.stats()["queued_segments"] == 0
+
+    # 单个请求最多透支一倍桶容量，更大的请求返回413
+    try:
+        admission.admit("team-a", 100001, priority=BULK)
+        assert False, "超过透支上限的请求应被拒绝"
+    except AdmissionRejected as e:
+        assert e.reason == "too_large" and e.status == 413 and e.retry_after_header == "1"
+    stats = admission.stats()
+    print(f"   准入统计: {stats}")
+    assert stats["rejected_too_large"] == 1 and stats["rejected_queue_full"] == 2
+
+    print("✅ 准入控制正确")
+    return True
+
+
+def test_embedding_cache_sharing():
+    """测试句向量磁盘缓存被多个实例（进程）共享"""
+    print("\n" + "=" * 80)
+    print("测试13: 句向量缓存共享")
+    print("=" * 80)
+
+    import os
+    import tempfile
+    import numpy as np
+    from translation_evaluator.embedding_cache import EmbeddingCache
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        first = EmbeddingCache("Unbabel/wmt22-comet-da", cache_dir)
+        second = EmbeddingCache("Unbabel/wmt22-comet-da", cache_dir)
+        first.put_many(["a", "b"], np.ones((2, 3)))
+        first.flush()
+        # 模拟中断的写入：数据文件末尾留下不完整的行
+        with open(os.path.join(first._disk_dir, "embeddings.f32"), "ab") as f:
+            f.write(b"\0\0")
+        # 另一个实例写入时读入已有记录，不重复写入也不覆盖对方的索引
+        second.put_many(["b", "c"], np.full((2, 3), 2.0))
+        second.flush()
+        assert second.get("a").tolist() == [1.0, 1.0, 1.0]
+        assert first.get("c").tolist() == [2.0, 2.0, 2.0]
+
+        reopened = EmbeddingCache("Unbabel/wmt22-comet-da", cache_dir)
+        assert [reopened.get(t).tolist()[0] for t in ["a", "b", "c"]] == [1.0, 1.0, 2.0]
+        stats = reopened.stats()
+        print(f"   缓存统计: {stats}")
+        assert stats["disk_items"] == 3 and stats["disk_hits"] == 3
+
+    print("✅ 句向量缓存共享正确")
+    return True
+
+
+def test_incremental_means():
+    """测试增量评估的均值只统计实际计算的样本，配置变化时拒绝恢复状态"""
+    print("\n" + "=" * 80)
+    print("测试14: 增量评估均值")
+    print("=" * 80)
+
+    import tempfile
+    from translation_evaluator import UnifiedEvaluator, IncrementalEvaluation
+
+    evaluator = UnifiedEvaluator(
+        use_bleu=True, use_comet=False, use_bleurt=False, use_bertscore=False, use_mqm=False, use_chrf=True
+    )
+    translations = ["the cat sat on the mat", "a dog", "the cat sat on mat"]
+    references = ["the cat sat on the mat", None, "the cat sat on the mat"]
+    expected = evaluator.batch_score(["s"] * 3, translations, references)
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        incremental = IncrementalEvaluation(evaluator, state_dir)
+        incremental.update(["s"] * 2, translations[:2], references[:2])
+        summary = incremental.append(["s"], translations[2:], references[2:])
+        print(f"   均值: bleu={summary['mean_bleu']:.4f} (n={summary['n_bleu']}), comet n={summary['n_comet']}")
+        # 无参考的样本不计入BLEU/ChrF均值，未启用的COMET没有样本
+        assert summary["n_segments"] == 3 and summary["n_bleu"] == 2 and summary["n_comet"] == 0
+        assert abs(summary["mean_bleu"] - (expected[0].bleu + expected[2].bleu) / 2) < 1e-9
+        assert abs(summary["mean_chrf"] - (expected[0].chrf + expected[2].chrf) / 2) < 1e-9
+        assert summary["n_final_score"] == 3
+
+        # 重启后恢复状态；启用的指标变化时拒绝恢复
+        assert IncrementalEvaluation(evaluator, state_dir).corpus_result() == summary
+        evaluator.use_chrf = False
+        try:
+            IncrementalEvaluation(evaluator, state_dir)
+            assert False, "指标配置变化时应拒绝恢复状态"
+        except ValueError:
+            pass
+
+    print("✅ 增量评估均值正确")
+    return True
+
+
+def test_chrf_missing_reference():
+    """测试ChrF批量评分中None或空参考的样本逐句记0，不影响其他样本"""
+    print("\n" + "=" * 80)
+    print("测试15: ChrF缺失参考")
+    print("=" * 80)
+
+    from translation_evaluator.chrf_scorer import ChrFScorer
+
+    scorer = ChrFScorer()
+    full = scorer.score(["a b", "the cat"], ["a b", "the cat"])
+    result = scorer.score(["a b", "c", "the cat", "d"], ["a b", None, ["the cat", ""], ""])
+    print(f"   逐句分数: {result['scores']}")
+    assert "error" not in result
+    assert result["scores"] == [full["scores"][0], 0.0, full["scores"][1], 0.0]
+    # 语料分数只统计有参考的样本；逐句统计量对齐输入，缺失参考的样本为0
+    assert result["corpus_score"] == full["corpus_score"]
+    stats = scorer.sentence_statistics(["a b", "c"], ["a b", None])
+    assert len(stats) == 2 and not any(stats[1]) and any(stats[0])
+
+    print("✅ ChrF缺失参考处理正确")
+    return True
+
+
+def test_cascade():
+    """测试级联评分的区间门控、无参考样本与统计"""
+    print("\n" + "=" * 80)
+    print("测试16: 级联评分")
+    print("=" * 80)
+
+    from translation_evaluator import UnifiedEvaluator
+
+    evaluator = UnifiedEvaluator(
+        use_bleu=True, use_comet=False, use_bleurt=False, use_bertscore=False, use_mqm=False, use_chrf=True
+    )
+    stub = _StubCOMET()
+    evaluator.use_comet, evaluator.comet_scorer = True, stub
+
+    sources = ["s1", "s2", "s3", "s4"]
+    translations = ["the cat sat on the mat", "xyz", "the cat sat on a mat", "anything"]
+    references = ["the cat sat on the mat", "the cat sat on the mat", "the cat sat on the mat", None]
+    cascade = evaluator.batch_score_cascade(sources, translations, references, band=(0.1, 0.9), gate_metric="chrf")
+    results, stats = cascade["scores"], cascade["stats"]
+    print(f"   ChrF: {[round(r.chrf, 3) for r in results]}，统计: {stats}")
+
+    # 样本0高于区间、样本1低于区间：只有词汇指标；样本2在区间内、样本3无参考：进入COMET
+    assert results[0].chrf > 0.9 and results[1].chrf < 0.1 and 0.1 <= results[2].chrf <= 0.9
+    assert stub.calls == [["the cat sat on the mat"]]
+    assert [r.skipped for r in results] == [["comet"], ["comet"], None, None]
+    assert results[2].comet == 0.5 and results[3].comet == 0.0
+    assert stats["neural_segments"] == 2 and stats["no_reference"] == 1
+    assert stats["skipped_low"] == 1 and stats["skipped_high"] == 1
+    assert stats["inference_avoided"] == 2 and stats["avoided_fraction"] == 0.5
+
+    # 没有启用神经网络指标：门控后的样本与其他样本一样skipped为None
+    cascade = evaluator.batch_score_cascade(
+        sources, translations, references, band=(0.1, 0.9), gate_metric="chrf", metrics=["chrf", "bleu"]
+    )
+    assert [r.skipped for r in cascade["scores"]] == [None] * 4
+    assert cascade["stats"]["neural_segments"] == 0 and cascade["stats"]["inference_avoided"] == 0
+    assert cascade["stats"]["avoided_fraction"] == 0.0
+
+    print("✅ 级联评分正确")
+    return True
+
+
+def test_model_registry():
+    """测试模型注册表的共享、引用计数固定与按LRU卸载"""
+    print("\n" + "=" * 80)
+    print("测试17: 模型注册表")
+    print("=" * 80)
+
+    from translation_evaluator import model_registry
+    from translation_evaluator.model_registry import ModelRegistry
+
+    # 用模拟的RSS计数代替进程内存：每个模型加载时占用固定大小
+    rss = [0]
+    mb = 1024 * 1024
+    unloaded = []
+
+    def loader(name, size_mb):
+        def load():
+            rss[0] += size_mb * mb
+            return f"model:{name}"
+        return load
+
+    def unloader(model):
+        unloaded.append(model)
+
+    original_rss = model_registry.current_rss
+    model_registry.current_rss = lambda: rss[0]
+    try:
+        registry = ModelRegistry(memory_budget_mb=250)
+        a = registry.acquire("a", loader("a", 100), unloader)
+        # 同一个键共享已加载的模型，不重复加载
+        assert registry.acquire("a", loader("a", 100), unloader) is a
+        assert registry.stats()["models"][0]["refcount"] == 2 and registry.loads == 1 and registry.hits == 1
+
+        with registry.use("b", loader("b", 100), unloader):
+            pass
+        registry.release("a")
+        # "a"仍被引用：加载"c"超出预算时只能卸载空闲的"b"
+        registry.acquire("c", loader("c", 100), unloader)
+        print(f"   已加载: {[m['key'] for m in registry.stats()['models']]}，已卸载: {unloaded}")
+        assert unloaded == ["model:b"] and registry.is_loaded("a") and registry.is_loaded("c")
+
+        # "a"释放后重新加载"b"：按最近最少使用顺序卸载"a"，不卸载刚用过的"c"
+        registry.release("a")
+        registry.release("c")
+        registry.peek("a")  # peek不更新最近使用时间
+        with registry.use("c", loader("c", 100), unloader):
+            pass
+        registry.acquire("b", loader("b", 100), unloader)
+        assert unloaded == ["model:b", "model:a"]
+        assert not registry.is_loaded("a") and registry.is_loaded("b") and registry.is_loaded("c")
+        assert registry.evictions == 2
+
+        # 使用中的模型不能卸载（除非force），空闲模型可以
+        assert not registry.unload("b") and registry.unload("c")
+        assert registry.unload("b", force=True) and registry.stats()["models"] == []
+    finally:
+        model_registry.current_rss = original_rss
+
+    print("✅ 模型注册表正确")
+    return True
+
+
+class _LoadingCOMET(_StubCOMET):
+    """加载过程可以阻塞的COMET替身（分数固定为0.9）"""
+
+    def __init__(self, model_name, gate, ok=True):
+        super().__init__()
+        self.model_name = model_name
+        self.gate = gate
+        self.ok = ok
+
+    def initialize(self):
+        assert self.gate.wait(timeout=5.0), "测试未放行模型加载"
+        return self.ok
+
+    def score(self, sources, translations, references=None, aggregation="max"):
+        self.calls.append(references)
+        return {"scores": [0.9] * len(translations)}
+
+
+def test_background_reconfigure():
+    """测试后台重新配置：新模型加载期间旧配置继续服务，加载完成后原子替换，失败时保持原配置"""
+    print("\n" + "=" * 80)
+    print("测试18: 后台重新配置")
+    print("=" * 80)
+
+    import threading
+    from translation_evaluator import CombinedQualityScorer
+
+    scorer = CombinedQualityScorer(use_comet=False, use_bleurt=False, use_bertscore=False, use_chrf=False)
+    old = _StubCOMET()
+    scorer.use_comet, scorer.comet_scorer, scorer.comet_model_name = True, old, old.model_name
+    gate = threading.Event()
+    created = []
+
+    def create_scorer(metric, comet_model=None, bertscore_profile=None):
+        created.append(_LoadingCOMET(comet_model, gate, ok=comet_model != "broken-comet"))
+        return created[-1]
+
+    scorer._create_scorer = create_scorer
+
+    thread = scorer.reconfigure(comet_model="new-comet", background=True)
+    # 加载期间请求仍由旧模型评分
+    assert scorer.reconfiguring == ["comet"]
+    result = scorer.batch_score(["s"], ["t"], ["r"], metrics=["comet"])
+    assert result[0].comet == 0.5 and len(old.calls) == 1 and scorer.comet_model_name == "stub-comet-da"
+
+    gate.set()
+    thread.join(timeout=5.0)
+    assert not thread.is_alive() and scorer.reconfiguring == []
+    assert scorer.comet_scorer is created[0] and scorer.comet_model_name == "new-comet"
+    assert scorer.batch_score(["s"], ["t"], ["r"], metrics=["comet"])[0].comet == 0.9
+    assert len(old.calls) == 1
+
+    # 加载失败：保持原配置
+    assert scorer.reconfigure(comet_model="broken-comet") == {"comet": False}
+    assert scorer.comet_scorer is created[0] and scorer.comet_model_name == "new-comet" and scorer.use_comet
+    # 模型名不变时不重新加载
+    assert scorer.reconfigure(comet_model="new-comet", background=True) is None and len(created) == 2
+
+    print("✅ 后台重新配置正确")
+    return True
+
+
+class _StubBERTScore:
+    """记录调用的BERTScore替身（F1固定为score）"""
+
+    lang = "zh"
+    model_type = "stub-bert"
+    idf_table = None
+    precision = "fp32"
+    num_layers = None
+
+    def __init__(self, score):
+        self.score_value = score
+        self.calls = []
+
+    def score(self, translations, references):
+        self.calls.append(list(translations))
+        return {"F1": [self.score_value] * len(translations)}
+
+    def score_single(self, translation, reference):
+        return self.score([translation], [reference])["F1"][0]
+
+
+def test_language_routing():
+    """测试按语言对分组：每个路由的模型只对本组样本批量推理一次，分数按原顺序合并"""
+    print("\n" + "=" * 80)
+    print("测试19: 语言路由分组")
+    print("=" * 80)
+
+    from translation_evaluator import CombinedQualityScorer
+
+    scorer = CombinedQualityScorer(
+        use_comet=False, use_bleurt=False, use_bertscore=False, use_chrf=False,
+        bertscore_lang="zh", comet_models={"en_de": "stub-comet-en-de"}
+    )
+    assert scorer.comet_models == {"en-de": "stub-comet-en-de"}
+    default_comet, de_comet = _StubCOMET(), _LoadingCOMET("stub-comet-en-de", None)
+    default_bertscore = _StubBERTScore(0.1)
+    scorer.use_comet, scorer.comet_scorer = True, default_comet
+    scorer.use_bertscore, scorer.bertscore_scorer = True, default_bertscore
+    # 预先放入路由评估器，避免加载真实模型
+    routed_bertscore = {"de": _StubBERTScore(0.2), "en": _StubBERTScore(0.3)}
+    scorer._routed_scorers = {("comet", "en-de"): de_comet}
+    scorer._routed_scorers.update({("bertscore", lang): stub for lang, stub in routed_bertscore.items()})
+
+    translations = ["t0", "t1", "t2", "t3", "t4"]
+    lang_pairs = ["en-de", "en-zh", "zh-en", "en_de", None]
+    results = scorer.batch_score(
+        ["s"] * 5, translations, ["r"] * 5, metrics=["comet", "bertscore"], lang_pairs=lang_pairs
+    )
+    print(f"   COMET: {[r.comet for r in results]}，BERTScore: {[r.bertscore_f1 for r in results]}")
+
+    # COMET：en-de走专用模型，其余语言对（含未指定）走默认模型，各调用一次
+    assert len(de_comet.calls) == 1 and len(default_comet.calls) == 1
+    assert [r.comet for r in results] == [0.9, 0.5, 0.6, 0.9, 0.7]
+    # BERTScore按目标语言分组：与bertscore_lang相同或未指定时用默认评估器
+    assert default_bertscore.calls == [["t1", "t4"]]
+    assert routed_bertscore["de"].calls == [["t0", "t3"]] and routed_bertscore["en"].calls == [["t2"]]
+    assert [r.bertscore_f1 for r in results] == [0.2, 0.1, 0.3, 0.2, 0.1]
+
+    # 单样本评分使用同样的路由
+    assert scorer.score("s", "t", "r", metrics=["bertscore"], lang_pair="zh-en").bertscore_f1 == 0.3
+    assert scorer.model_versions()["comet_models"] == {"en-de": "stub-comet-en-de"}
+    try:
+        scorer.parse_lang_pair("en-de-fr")
+        assert False, "格式不正确的语言对应抛出ValueError"
+    except ValueError:
+        pass
+
+    print("✅ 语言路由分组正确")
+    return True
+
+
+def test_thread_budget():
+    """测试线程预算按工作进程与指标划分核心"""
+    print("\n" + "=" * 80)
+    print("测试20: 线程预算划分")
+    print("=" * 80)
+
+    import json
+    import os
+    import tempfile
+    from translation_evaluator.thread_budget import ThreadBudget, TORCH_METRICS
+
+    config = {
+        "cores": list(range(16)),
+        "workers": 2,
+        "affinity": True,
+        "metrics": {
+            "comet": {"threads": 4},
+            "bertscore": {},
+            "bleurt": {"threads": 2, "inter_op": 1, "cores": [6, 7]}
+        }
+    }
+    with tempfile.TemporaryDirectory() as config_dir:
+        path = os.path.join(config_dir, "budget.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(config, f)
+        budget = ThreadBudget(ThreadBudget.load(path), worker=1)
+
+    # 第2个工作进程分得后一半核心；bertscore平分固定线程数之外的剩余核心
+    assert budget.worker_cores == list(range(8, 16))
+    assert [budget.threads(m) for m in ("comet", "bertscore", "bleurt")] == [4, 2, 2]
+    # 未指定cores的指标按顺序分得互不重叠的核心段，显式指定的保持不变
+    assert budget.cores("comet") == [8, 9, 10, 11] and budget.cores("bertscore") == [12, 13]
+    assert budget.cores("bleurt") == [6, 7]
+    # 未配置的指标使用本进程的全部核心，不设置亲和性
+    assert budget.threads("chrf") == 8 and budget.cores("chrf") is None
+    # torch指标共享进程级线程数：取预算最大值
+    assert budget.process_threads(TORCH_METRICS) == 4 and budget.process_threads(["chrf"]) == 8
+
+    # 工作进程序号按工作进程数取模；不启用亲和性时不分配核心
+    budget = ThreadBudget({"cores": list(range(16)), "workers": 2, "metrics": {"comet": {}}}, worker=2)
+    assert budget.worker_cores == list(range(8)) and budget.threads("comet") == 8 and budget.cores("comet") is None
+    with budget.limit("comet"):
+        pass
+    stats = budget.stats()
+    print(f"   统计: {stats}")
+    assert stats["enabled"] and stats["metrics"]["comet"]["runs"] == 1
+
+    # 未配置时不限制
+    budget.configure(None)
+    assert not budget.enabled and budget.metrics == {}
+    with budget.limit("comet"):
+        pass
+    assert budget.stats()["metrics"] == {}
+
+    print("✅ 线程预算划分正确")
+    return True
+
+
 def main():
     """主测试函数"""
     print("\n" + "=" * 80)
@@ -222,6 +1055,51 @@ def main():
     # 测试5: CombinedQualityScorer
     results.append(("CombinedQualityScorer", test_combined_scorer()))
     
+    # 测试6: 显著性检验
+    results.append(("显著性检验", test_significance()))
+    
+    # 测试7: 混合参考的批量评分
+    results.append(("混合参考批量评分", test_mixed_reference_batch()))
+    
+    # 测试8: 文档切分与对齐
+    results.append(("文档切分与对齐", test_document_alignment()))
+    
+    # 测试9: 检查点断点续评
+    results.append(("检查点断点续评", test_checkpoint_resume()))
+    
+    # 测试10: IDF表
+    results.append(("IDF表", test_idf_table()))
+    
+    # 测试11: QE动态批处理
+    results.append(("QE动态批处理", test_quality_estimator()))
+    
+    # 测试12: 准入控制
+    results.append(("准入控制", test_admission()))
+    
+    # 测试13: 句向量缓存共享
+    results.append(("句向量缓存共享", test_embedding_cache_sharing()))
+    
+    # 测试14: 增量评估均值
+    results.append(("增量评估均值", test_incremental_means()))
+    
+    # 测试15: ChrF缺失参考
+    results.append(("ChrF缺失参考", test_chrf_missing_reference()))
+    
+    # 测试16: 级联评分
+    results.append(("级联评分", test_cascade()))
+    
+    # 测试17: 模型注册表
+    results.append(("模型注册表", test_model_registry()))
+    
+    # 测试18: 后台重新配置
+    results.append(("后台重新配置", test_background_reconfigure()))
+    
+    # 测试19: 语言路由分组
+    results.append(("语言路由分组", test_language_routing()))
+    
+    # 测试20: 线程预算划分
+    results.append(("线程预算划分", test_thread_budget()))
+    
     # 总结
     print("\n" + "=" * 80)
     print("测试总结")
@@ -0,0 +1,433 @@
+"""
+测试API服务器与客户端
+用桩评估器/桩HTTP会话验证请求合并、优先级调度、客户端分块与重试等逻辑，不需要启动服务器或加载模型
+"""
+
+import sys
+import time
+import threading
+
+
+class _StubEvaluator:
+    """记录调用的评估器桩：批量评分可以阻塞，直到测试放行"""
+
+    def __init__(self):
+        self.batches = []
+        self.singles = []
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def score(self, source, translation, reference, mqm_score=None, metrics=None, lang_pair=None):
+        self.singles.append(translation)
+        return f"single:{translation}"
+
+    def batch_score(self, sources, translations, references, mqm_scores=None, metrics=None, lang_pairs=None,
+                    **kwargs):
+        self.batches.append(list(translations))
+        self.entered.set()
+        assert self.gate.wait(timeout=5.0), "测试未放行批量评分"
+        return [f"batch:{t}" for t in translations]
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.01)
+
+
+def _server(max_concurrency, chunk_size):
+    """替换服务器的评估器、准入控制和请求合并状态"""
+    import eval_server as server
+    from translation_evaluator.admission import AdmissionController
+    from translation_evaluator.singleflight import SingleFlight
+
+    server.evaluator = _StubEvaluator()
+    server.admission = AdmissionController(max_concurrency=max_concurrency, bulk_chunk_size=chunk_size)
+    server.single_flight = SingleFlight()
+    server.BULK_CHUNK_SIZE = chunk_size
+    return server
+
+
+def _run_batch(server, translations, results, name):
+    from translation_evaluator.scheduler import BULK
+
+    ticket = server.admission.admit(name, len(translations), priority=BULK)
+    references = ["ref"] * len(translations)
+    results[name] = server.evaluate_batch(ticket, ["src"] * len(translations), translations, references, None)
+
+
+class _ScoringStub(_StubEvaluator):
+    """返回评分对象的评估器桩（ASGI接口测试用）"""
+
+    use_bleu = True
+    use_comet = use_bleurt = use_bertscore = use_chrf = use_mqm = False
+    comet_scorer = bleurt_scorer = bertscore_scorer = chrf_scorer = None
+    reconfiguring = ()
+
+    def score(self, source, translation, reference, mqm_score=None, metrics=None, lang_pair=None):
+        from translation_evaluator.unified_evaluator import PaperGradeScore
+
+        self.singles.append(translation)
+        return PaperGradeScore(bleu=len(translation), model_info={}, metrics=["bleu"])
+
+    def batch_score(self, sources, translations, references, mqm_scores=None, metrics=None, lang_pairs=None,
+                    **kwargs):
+        from translation_evaluator.unified_evaluator import PaperGradeScore
+
+        self.batches.append(list(translations))
+        return [PaperGradeScore(bleu=len(t), metrics=["bleu"]) for t in translations]
+
+
+def _asgi_request(app, method, path, body=b"", chunk=None, api_key="client"):
+    """用伪造的scope/receive/send调用ASGI应用，返回(状态码, 响应头, 响应JSON)"""
+    import asyncio
+    import json
+
+    chunk = chunk or max(len(body), 1)
+    messages = [
+        {"type": "http.request", "body": body[i:i + chunk], "more_body": i + chunk < len(body)}
+        for i in range(0, max(len(body), 1), chunk)
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": method, "path": path, "client": ("127.0.0.1", 0),
+        "headers": [(b"content-type", b"application/json"), (b"x-api-key", api_key.encode())]
+    }
+    asyncio.run(app(scope, receive, send))
+    start, response = sent
+    headers = {key.decode(): value.decode() for key, value in start["headers"]}
+    return start["status"], headers, json.loads(response["body"])
+
+
+def test_batch_coalescing():
+    """测试并发批量请求中相同的样本只计算一次"""
+    print("=" * 80)
+    print("测试1: 批量请求合并")
+    print("=" * 80)
+
+    server = _server(max_concurrency=2, chunk_size=64)
+    stub = server.evaluator
+    stub.gate.clear()
+    results = {}
+
+    first = threading.Thread(target=_run_batch, args=(server, ["a", "b", "a"], results, "first"))
+    first.start()
+    assert stub.entered.wait(timeout=5.0)
+    # "b"正在由第一个请求计算：第二个请求只计算"c"，然后等待"b"的结果
+    second = threading.Thread(target=_run_batch, args=(server, ["b", "c"], results, "second"))
+    second.start()
+    _wait_until(lambda: len(stub.batches) == 2)
+    stub.gate.set()
+    first.join(timeout=5.0)
+    second.join(timeout=5.0)
+
+    print(f"   计算批次: {stub.batches}")
+    assert stub.batches == [["a", "b"], ["c"]]
+    assert results["first"] == ["batch:a", "batch:b", "batch:a"]
+    assert results["second"] == ["batch:b", "batch:c"]
+    assert server.single_flight.stats() == {"in_flight": 0, "computed": 3, "coalesced": 1}
+
+    print("✅ 批量请求合并正确")
+    return True
+
+
+def test_interactive_not_blocked_by_bulk():
+    """测试单样本请求不等待批量请求中尚未执行的分块"""
+    print("\n" + "=" * 80)
+    print("测试2: 请求合并与优先级")
+    print("=" * 80)
+
+    from translation_evaluator.scheduler import INTERACTIVE
+
+    server = _server(max_concurrency=1, chunk_size=2)
+    stub = server.evaluator
+    stub.gate.clear()
+    results = {}
+
+    bulk = threading.Thread(target=_run_batch, args=(server, ["x1", "x2", "x3", "x4", "k", "x5"], results, "bulk"))
+    bulk.start()
+    assert stub.entered.wait(timeout=5.0)
+
+    # 批量请求的第一个分块执行中，"k"在第三个分块：单样本请求不应等待它，而是在下一个槽位自行计算
+    def interactive():
+        ticket = server.admission.admit("alice", 1, priority=INTERACTIVE)
+        results["interactive"] = server.evaluate_single(ticket, "src", "k", "ref", None)
+
+    single = threading.Thread(target=interactive)
+    single.start()
+    _wait_until(lambda: server.admission.scheduler.stats()["interactive"]["waiting"] == 1)
+    # 批量请求只认领了执行中的分块，"k"由单样本请求认领
+    assert server.single_flight.stats()["in_flight"] == 3
+    stub.gate.set()
+    single.join(timeout=5.0)
+    bulk.join(timeout=5.0)
+
+    print(f"   单样本计算: {stub.singles}，批量分块: {stub.batches}")
+    assert results["interactive"] == "single:k"
+    assert stub.singles == ["k"]
+    # 单样本请求先于第二个分块执行，完成后不再占用"k"，第三个分块照常计算
+    assert stub.batches == [["x1", "x2"], ["x3", "x4"], ["k", "x5"]]
+    assert results["bulk"] == ["batch:x1", "batch:x2", "batch:x3", "batch:x4", "batch:k", "batch:x5"]
+    assert server.single_flight.stats()["coalesced"] == 0
+
+    print("✅ 单样本请求不被批量请求阻塞")
+    return True
+
+
+def test_request_body_limits():
+    """测试请求体大小上限与内容编码校验"""
+    print("\n" + "=" * 80)
+    print("测试3: 请求体校验")
+    print("=" * 80)
+
+    import gzip
+    import json
+    from translation_evaluator.codec import decode_body
+
+    server = _server(max_concurrency=1, chunk_size=64)
+    client = server.app.test_client()
+    body = json.dumps({"source": "s", "translation": "t", "reference": "r"}).encode("utf-8")
+
+    # 声明了gzip编码但数据未压缩：返回400而不是按未压缩处理
+    headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    response = client.post("/eval", data=body, headers=headers)
+    print(f"   未压缩的gzip请求: {response.status_code} {response.get_json()['error']}")
+    assert response.status_code == 400
+    assert decode_body(gzip.compress(body), "gzip") == json.loads(body)
+    # 客户端解码响应时HTTP库可能已经自动解压
+    assert decode_body(body, "gzip", allow_decoded=True) == json.loads(body)
+
+    # 超过上限的请求体返回413
+    limit = server.app.config["MAX_CONTENT_LENGTH"]
+    server.app.config["MAX_CONTENT_LENGTH"] = len(body) - 1
+    try:
+        for path in ("/eval", "/eval/batch"):
+            response = client.post(path, data=body, headers={"Content-Type": "application/json"})
+            assert response.status_code == 413, (path, response.status_code)
+    finally:
+        server.app.config["MAX_CONTENT_LENGTH"] = limit
+
+    print("✅ 请求体校验正确")
+    return True
+
+
+class _StubResponse:
+    """requests响应的替身"""
+
+    def __init__(self, status_code, payload=None, headers=None):
+        import json
+
+        self.status_code = status_code
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self.content = json.dumps(payload or {}).encode("utf-8")
+
+    def raise_for_status(self):
+        import requests
+
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"HTTP {self.status_code}")
+
+
+class _StubSession:
+    """按翻译内容决定响应的HTTP会话替身：script中的状态码依次返回，用完后返回200"""
+
+    def __init__(self, script):
+        self.script = {key: list(statuses) for key, statuses in script.items()}
+        self.posts = []
+        self.headers = {}
+        self._lock = threading.Lock()
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        import json
+
+        translations = json.loads(data)["translations"]
+        with self._lock:
+            self.posts.append(list(translations))
+            statuses = self.script.get(translations[0], [])
+            status = statuses.pop(0) if statuses else 200
+        if status != 200:
+            return _StubResponse(status, {"success": False, "error": "busy"}, {"Retry-After": "0"})
+        return _StubResponse(200, {"success": True, "scores": [{"bleu": len(t)} for t in translations]})
+
+    def close(self):
+        pass
+
+
+def test_asgi_endpoints():
+    """测试ASGI服务器的接口、请求体上限与准入拒绝"""
+    print("\n" + "=" * 80)
+    print("测试4: ASGI接口")
+    print("=" * 80)
+
+    import json
+    import eval_server_asgi as asgi
+    from translation_evaluator.admission import AdmissionController
+
+    server = _server(max_concurrency=2, chunk_size=2)
+    server.evaluator = stub = _ScoringStub()
+    server.admission = AdmissionController(rate=0.001, burst=4, max_concurrency=2, bulk_chunk_size=2)
+    app = asgi.app
+
+    status, _, payload = _asgi_request(app, "GET", "/health")
+    assert status == 200 and payload["evaluator_initialized"] and payload["evaluator_status"]["use_bleu"]
+
+    body = json.dumps({"translation": "abc", "reference": "ref"}).encode()
+    status, _, payload = _asgi_request(app, "POST", "/eval", body)
+    assert status == 200 and payload["score"]["bleu"] == 3 and payload["score"]["metrics"] == ["bleu"]
+
+    # 请求体分多条消息到达
+    body = json.dumps({"translations": ["a", "bb", "ccc"], "references": ["r"] * 3}).encode()
+    status, _, payload = _asgi_request(app, "POST", "/eval/batch", body, chunk=7)
+    print(f"   批量响应: {payload}")
+    assert status == 200 and payload["count"] == 3 and payload["metrics"] == ["bleu"]
+    assert [score["bleu"] for score in payload["scores"]] == [1, 2, 3]
+    assert stub.batches == [["a", "bb"], ["ccc"]]
+
+    # 令牌用完后返回429和Retry-After
+    status, headers, payload = _asgi_request(app, "POST", "/eval/batch", body)
+    print(f"   限流响应: {status} {payload}")
+    assert status == 429 and payload["reason"] == "quota" and int(headers["retry-after"]) >= 1
+
+    # 超过令牌桶容量的请求无论等多久都不会被接受：413
+    body = json.dumps({"translations": ["a"] * 20, "references": ["r"] * 20}).encode()
+    status, _, payload = _asgi_request(app, "POST", "/eval/batch", body, api_key="other")
+    assert status == 413 and payload["reason"] == "too_large"
+
+    # 请求体超过上限：413，不解析
+    original_max = asgi.MAX_BODY_SIZE
+    asgi.MAX_BODY_SIZE = 16
+    try:
+        status, _, payload = _asgi_request(app, "POST", "/eval", b"x" * 32, chunk=8)
+    finally:
+        asgi.MAX_BODY_SIZE = original_max
+    assert status == 413
+
+    status, _, _ = _asgi_request(app, "POST", "/eval", b"{not json")
+    assert status == 400
+    status, _, _ = _asgi_request(app, "GET", "/eval")
+    assert status == 405
+    status, _, _ = _asgi_request(app, "GET", "/missing")
+    assert status == 404
+
+    print("✅ ASGI接口正确")
+    return True
+
+
+def test_client_pooled_batches():
+    """测试客户端的连接池、并发数与asyncio批量接口"""
+    print("\n" + "=" * 80)
+    print("测试5: 客户端并发批量")
+    print("=" * 80)
+
+    import asyncio
+    from eval_client import EvaluationClient
+
+    client = EvaluationClient(
+        chunk_size=2, max_workers=4, adaptive_chunking=False, compression=None, binary=False, columnar=False
+    )
+    # 连接池大小与并发数一致，keep-alive连接在分块之间复用
+    assert client.session.get_adapter("http://localhost").poolmanager.connection_pool_kw["maxsize"] == 4
+    # 并发数不超过分块数
+    assert client._worker_count(client._new_batch_state(3, None)) == 2
+    assert client._worker_count(client._new_batch_state(100, None)) == 4
+    assert client._worker_count(client._new_batch_state(100, 60)) == 2
+
+    client.session = _StubSession({})
+    translations = [c * (i + 1) for i, c in enumerate("abcdefg")]
+    result = asyncio.run(client.evaluate_batch_async(translations, ["r"] * 7, chunk_size=3))
+    print(f"   请求: {sorted(map(tuple, client.session.posts))}")
+    assert result["success"] and result["chunks"] == 3
+    assert [s["bleu"] for s in result["scores"]] == [1, 2, 3, 4, 5, 6, 7]
+
+    print("✅ 客户端并发批量正确")
+    return True
+
+
+def test_client_chunking_and_retry():
+    """测试客户端的分块、Retry-After重试与部分失败"""
+    print("\n" + "=" * 80)
+    print("测试6: 客户端分块与重试")
+    print("=" * 80)
+
+    from eval_client import EvaluationClient, AdaptiveChunkSizer
+
+    translations = ["a", "bb", "ccc", "dddd", "eeeee"]
+    references = ["r"] * 5
+
+    def client(script, workers):
+        instance = EvaluationClient(
+            chunk_size=2, max_workers=workers, adaptive_chunking=False, max_retries=2, backoff_base=0.0,
+            compression=None, binary=False, columnar=False
+        )
+        instance.session = _StubSession(script)
+        return instance
+
+    # 第二个分块先被429拒绝后重试成功；第三个分块一直503，重试用完后只有该分块失败
+    stub_client = client({"ccc": [429], "eeeee": [503, 503, 503]}, workers=1)
+    result = stub_client.evaluate_batch(translations, references)
+    posts = stub_client.session.posts
+    print(f"   请求: {posts}")
+    assert posts == [["a", "bb"], ["ccc", "dddd"], ["ccc", "dddd"]] + [["eeeee"]] * 3
+    assert not result["success"] and result["chunks"] == 3
+    assert result["scores"] == [{"bleu": 1}, {"bleu": 2}, {"bleu": 3}, {"bleu": 4}, None]
+    assert result["failed_ranges"] == [[4, 5]] and result["error"] == "服务器繁忙 (HTTP 503)"
+
+    # 并发分块按原顺序拼接
+    stub_client = client({}, workers=3)
+    result = stub_client.evaluate_batch(translations, references)
+    assert result["success"] and [s["bleu"] for s in result["scores"]] == [1, 2, 3, 4, 5]
+    assert sorted(map(tuple, stub_client.session.posts)) == [("a", "bb"), ("ccc", "dddd"), ("eeeee",)]
+
+    # Retry-After优先于指数退避（秒数或HTTP日期）
+    assert stub_client._backoff_delay(0, 3.0) == 3.0
+    assert EvaluationClient._parse_retry_after("2") == 2.0
+    assert EvaluationClient._parse_retry_after("Thu, 01 Jan 1970 00:00:00 GMT") == 0.0
+    assert EvaluationClient._parse_retry_after("soon") is None
+
+    # 自适应分块：按延迟放大（每次最多翻倍），过载时减半
+    sizer = AdaptiveChunkSizer(initial_size=256, max_size=2048, target_latency=10.0)
+    sizer.record_success(256, 1.0)
+    assert sizer.next_size() == 512
+    sizer.record_overload()
+    assert sizer.next_size() == 256
+    # 延迟变长（滑动平均后约0.12秒/样本）：缩小到目标延迟内能完成的大小
+    sizer.record_success(256, 100.0)
+    assert sizer.next_size() == int(10.0 / sizer.per_item_latency) == 83
+
+    print("✅ 客户端分块与重试正确")
+    return True
+
+
+def main():
+    """主测试函数"""
+    results = []
+    results.append(("批量请求合并", test_batch_coalescing()))
+    results.append(("请求合并与优先级", test_interactive_not_blocked_by_bulk()))
+    results.append(("请求体校验", test_request_body_limits()))
+    results.append(("ASGI接口", test_asgi_endpoints()))
+    results.append(("客户端并发批量", test_client_pooled_batches()))
+    results.append(("客户端分块与重试", test_client_chunking_and_retry()))
+
+    print("\n" + "=" * 80)
+    print("测试总结")
+    print("=" * 80)
+    passed = sum(1 for _, result in results if result)
+    for name, result in results:
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"  {name}: {status}")
+    print(f"\n总计: {passed}/{len(results)} 通过")
+    return passed == len(results)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
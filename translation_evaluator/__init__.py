@@ -9,6 +9,16 @@ from .bertscore_scorer import BERTScoreScorer
 from .chrf_scorer import ChrFScorer, ChrF1Scorer, ChrF2Scorer, ChrF3Scorer
 from .combined_scorer import CombinedQualityScorer, ComprehensiveScore
 from .unified_evaluator import UnifiedEvaluator, PaperGradeScore
+from .embedding_cache import EmbeddingCache
+from .model_registry import ModelRegistry, get_registry
+from .qe import QualityEstimator
+from .idf import IDFTable
+from .token_store import TokenStore
+from .thread_budget import ThreadBudget, get_thread_budget
+from .sufficient_stats import char_bleu_statistics, bleu_from_statistics, chrf_from_statistics
+from .significance import paired_bootstrap, segment_scores_from_results
+from .incremental import IncrementalEvaluation
+from .document import split_sentences, align_document
 
 __version__ = "1.0.0"
 
@@ -25,4 +35,20 @@ __all__ = [
     "ComprehensiveScore",
     "UnifiedEvaluator",
     "PaperGradeScore",
+    "EmbeddingCache",
+    "ModelRegistry",
+    "get_registry",
+    "QualityEstimator",
+    "IDFTable",
+    "TokenStore",
+    "ThreadBudget",
+    "get_thread_budget",
+    "char_bleu_statistics",
+    "bleu_from_statistics",
+    "chrf_from_statistics",
+    "paired_bootstrap",
+    "segment_scores_from_results",
+    "IncrementalEvaluation",
+    "split_sentences",
+    "align_document",
 ]
@@ -0,0 +1,304 @@
+"""
+API准入控制
+按API Key/客户端的令牌桶配额 + 有界的全局工作队列。
+配额用尽或队列已满时立即拒绝（HTTP 429 + Retry-After），
+避免过载时在内存中无限堆积请求。
+批量请求按分块执行，在队列中只按一个分块计样本数；队列为交互式请求保留名额，
+因此大批次进行中时单样本请求仍能进入
+"""
+
+from typing import Dict, Optional, Tuple
+from contextlib import contextmanager
+import math
+import threading
+import time
+
+from .scheduler import PriorityScheduler, BULK, INTERACTIVE
+
+
+class AdmissionRejected(Exception):
+    """请求被准入控制拒绝"""
+
+    def __init__(self, reason: str, retry_after: float, message: str, status: int = 429):
+        """
+        Args:
+            reason: "quota"（客户端配额用尽）、"queue_full"（全局队列已满）
+                或 "too_large"（单个请求超过配额允许的最大透支，需要拆分）
+            retry_after: 建议的重试等待时间（秒）
+            message: 错误信息
+            status: HTTP状态码（too_large为413，其余为429）
+        """
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.message = message
+        self.status = status
+
+    @property
+    def retry_after_header(self) -> str:
+        """Retry-After响应头（整数秒，至少1秒）"""
+        return str(max(1, int(math.ceil(self.retry_after))))
+
+
+class TokenBucket:
+    """令牌桶（单位：样本数）"""
+
+    def __init__(self, rate: float, capacity: float, max_overdraft: float = 1.0):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 桶容量（允许的突发量）
+            max_overdraft: 令牌最多透支到 -max_overdraft × capacity
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.max_overdraft = max_overdraft
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_consume(self, cost: float) -> Tuple[bool, float]:
+        """
+        尝试消耗令牌
+
+        超过桶容量的大批次在桶满时仍可放行，令牌记为负数（透支，最多max_overdraft倍桶容量），
+        之后该客户端需要等待相应时间才能再次提交
+
+        Returns:
+            (是否放行, 不放行时建议的等待秒数)
+        """
+        self._refill(time.monotonic())
+        needed = min(cost, self.capacity)
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return True, 0.0
+        if self.rate <= 0:
+            return False, float("inf")
+        return False, (needed - self.tokens) / self.rate
+
+    def max_cost(self) -> float:
+        """单个请求允许的最大样本数（桶满时透支到上限）"""
+        return self.capacity * (1 + self.max_overdraft)
+
+    def is_idle(self) -> bool:
+        """桶已满（客户端长时间未请求）"""
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class AdmissionTicket:
+    """
+    已准入的请求
+
+    用with包裹整个请求的处理过程（结束时释放队列名额），
+    实际评估放在slot()中执行；批量请求可以按分块多次申请slot()
+    """
+
+    def __init__(self, controller: "AdmissionController", client_id: str, cost: int, priority: int, queued: int):
+        self.controller = controller
+        self.client_id = client_id
+        self.cost = cost
+        self.priority = priority
+        # 在全局队列中占用的样本数（批量请求为一个分块）
+        self.queued = queued
+        self._done = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    @contextmanager
+    def slot(self, segments: Optional[int] = None):
+        """
+        按请求的优先级等待执行槽位
+
+        Args:
+            segments: 本次执行的样本数（默认为整个请求的样本数），用于估计处理速度
+        """
+        with self.controller.scheduler.slot(self.priority):
+            self.controller._start(self)
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                self.controller._stop(self, time.monotonic() - started, segments or self.cost)
+
+    def release(self):
+        """释放队列名额（重复调用无副作用）"""
+        if not self._done:
+            self._done = True
+            self.controller._finish(self)
+
+
+class AdmissionController:
+    """准入控制器（线程安全）"""
+
+    # 超过该数量时清理空闲客户端的令牌桶
+    MAX_IDLE_BUCKETS = 10000
+
+    def __init__(
+        self,
+        rate: float = 100.0,
+        burst: float = 2000.0,
+        max_queue: int = 64,
+        max_queued_segments: int = 20000,
+        max_concurrency: int = 1,
+        client_quotas: Optional[Dict[str, Dict[str, float]]] = None,
+        scheduler: Optional[PriorityScheduler] = None,
+        bulk_chunk_size: int = 64,
+        interactive_reserve: int = 8,
+        max_overdraft: float = 1.0
+    ):
+        """
+        初始化准入控制器
+
+        Args:
+            rate: 每个客户端的默认配额（样本/秒）
+            burst: 每个客户端的默认突发量（样本数）
+            max_queue: 全局队列中（等待+执行中）的最大请求数
+            max_queued_segments: 全局队列中批量请求的最大样本数（队列为空时单个分块仍可进入）；
+                交互式请求不受此限制
+            max_concurrency: 同时执行评估的请求数（评估器共享模型，默认串行）
+            client_quotas: 按API Key覆盖配额，如 {"team-a": {"rate": 500, "burst": 50000}}
+            scheduler: 执行槽位的优先级调度器（默认按max_concurrency创建）
+            bulk_chunk_size: 批量请求的执行分块大小（批量请求同一时间只执行一个分块，在队列中按一个分块计）
+            interactive_reserve: 为交互式请求保留的队列名额（批量请求最多占 max_queue - interactive_reserve 个）
+            max_overdraft: 单个请求最多透支多少倍的桶容量（更大的请求返回413，需要拆分）
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_queued_segments = max_queued_segments
+        self.bulk_chunk_size = max(1, bulk_chunk_size)
+        self.interactive_reserve = max(0, min(interactive_reserve, max_queue - 1))
+        self.max_overdraft = max_overdraft
+        self.client_quotas = client_quotas or {}
+        self.scheduler = scheduler or PriorityScheduler(max_concurrency)
+        self.max_concurrency = self.scheduler.max_concurrency
+
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+
+        # 已准入未完成的请求数/样本数（等待中 + 执行中）
+        self.active_requests = 0
+        self.queued_segments = 0
+        self.running_requests = 0
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = {"quota": 0, "queue_full": 0, "too_large": 0}
+        # 单样本平均处理耗时（滑动平均），用于估计队列已满时的Retry-After
+        self._seconds_per_segment = None
+
+    def _bucket(self, client_id: str) -> TokenBucket:
+        bucket = self._buckets.get(client_id)
+        if bucket is None:
+            if len(self._buckets) >= self.MAX_IDLE_BUCKETS:
+                self._buckets = {k: b for k, b in self._buckets.items() if not b.is_idle()}
+            quota = self.client_quotas.get(client_id, {})
+            bucket = TokenBucket(quota.get("rate", self.rate), quota.get("burst", self.burst), self.max_overdraft)
+            self._buckets[client_id] = bucket
+        return bucket
+
+    def _estimated_wait(self) -> float:
+        """按当前排队样本数估计队列腾出空间的时间"""
+        if self._seconds_per_segment is None:
+            return 1.0
+        return max(1.0, self._seconds_per_segment * self.queued_segments / self.max_concurrency)
+
+    def admit(self, client_id: str, cost: int = 1, priority: int = BULK) -> AdmissionTicket:
+        """
+        准入检查（不阻塞）
+
+        Args:
+            client_id: API Key或客户端地址
+            cost: 请求的样本数
+            priority: 优先级类别（scheduler.INTERACTIVE 或 scheduler.BULK）
+
+        Returns:
+            AdmissionTicket: 用with包裹评估过程
+
+        Raises:
+            AdmissionRejected: 队列已满或客户端配额用尽
+        """
+        cost = max(1, int(cost))
+        interactive = priority == INTERACTIVE
+        # 批量请求分块执行，队列中只计一个分块
+        queued = cost if interactive else min(cost, self.bulk_chunk_size)
+        with self._lock:
+            total = self.active_requests
+            if interactive:
+                full = total >= self.max_queue
+            else:
+                full = total >= self.max_queue - self.interactive_reserve or (
+                    total > 0 and self.queued_segments + queued > self.max_queued_segments
+                )
+            if full:
+                self.rejected["queue_full"] += 1
+                raise AdmissionRejected(
+                    "queue_full", self._estimated_wait(),
+                    f"服务器繁忙：队列已满（{total}个请求，{self.queued_segments}个样本）"
+                )
+
+            bucket = self._bucket(client_id)
+            if cost > bucket.max_cost():
+                self.rejected["too_large"] += 1
+                raise AdmissionRejected(
+                    "too_large", 0.0,
+                    f"请求过大：{cost}个样本超过客户端 {client_id} 单次允许的 {int(bucket.max_cost())} 个，请拆分后提交",
+                    status=413
+                )
+            allowed, wait = bucket.try_consume(cost)
+            if not allowed:
+                self.rejected["quota"] += 1
+                raise AdmissionRejected("quota", wait, f"超出配额：客户端 {client_id} 请求过于频繁")
+
+            self.active_requests += 1
+            self.queued_segments += queued
+            self.admitted += 1
+            return AdmissionTicket(self, client_id, cost, priority, queued)
+
+    def _start(self, ticket: AdmissionTicket):
+        """请求（或其一个分块）获得执行槽位"""
+        with self._lock:
+            self.running_requests += 1
+
+    def _stop(self, ticket: AdmissionTicket, seconds: float, segments: int):
+        """执行槽位释放，更新单样本耗时估计"""
+        with self._lock:
+            self.running_requests -= 1
+            per_segment = seconds / max(1, segments)
+            if self._seconds_per_segment is None:
+                self._seconds_per_segment = per_segment
+            else:
+                self._seconds_per_segment = 0.8 * self._seconds_per_segment + 0.2 * per_segment
+
+    def _finish(self, ticket: AdmissionTicket):
+        """释放队列名额"""
+        with self._lock:
+            self.active_requests -= 1
+            self.queued_segments -= ticket.queued
+            self.completed += 1
+
+    def stats(self) -> Dict:
+        """队列深度与拒绝计数"""
+        scheduler_stats = self.scheduler.stats()
+        with self._lock:
+            return {
+                "queue_depth": self.active_requests - self.running_requests,
+                "running": self.running_requests,
+                "queued_segments": self.queued_segments,
+                "max_queue": self.max_queue,
+                "max_queued_segments": self.max_queued_segments,
+                "admitted": self.admitted,
+                "completed": self.completed,
+                "rejected_quota": self.rejected["quota"],
+                "rejected_queue_full": self.rejected["queue_full"],
+                "rejected_too_large": self.rejected["too_large"],
+                "clients": len(self._buckets),
+                "scheduler": scheduler_stats
+            }
@@ -3,15 +3,132 @@ BERTScore
 基于BERT embedding的语义相似度评估
 """
 
-from typing import List, Dict
+from typing import List, Dict, Optional, Union
+from contextlib import contextmanager, nullcontext
+import atexit
+import threading
+import time
 import warnings
+import weakref
 warnings.filterwarnings('ignore')
 
+from .references import as_reference_list, is_multi_reference
+from .model_registry import get_registry
+from .idf import IDFTable
+from .thread_budget import get_thread_budget
+from .token_store import CachedTokenizer, flush_all, resolve_cache_dir
+
+
+# 共享的BERTScorer → 其当前idf权重的状态（见_IDFState）
+_idf_states = weakref.WeakKeyDictionary()
+_idf_states_lock = threading.Lock()
+
+# 推理精度：fp32（默认）、int8（线性层动态量化，仅CPU）、bf16（自动混合精度）
+PRECISIONS = ("fp32", "int8", "bf16")
+
+
+def cpu_supports_bf16() -> bool:
+    """CPU是否有原生bfloat16指令（AVX512-BF16或AMX），没有时bf16推理反而比fp32慢"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def _ranks(values):
+    """名次（并列取平均名次），用于Spearman相关"""
+    import numpy as np
+    
+    order = np.argsort(values, kind="mergesort")
+    ranks = np.empty(len(values))
+    ranks[order] = np.arange(len(values))
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    return (np.bincount(inverse, weights=ranks) / counts)[inverse]
+
+
+def _pearson(x, y) -> Optional[float]:
+    """Pearson相关系数（样本少于2个或方差为0时返回None）"""
+    import numpy as np
+    
+    if len(x) < 2 or np.std(x) == 0 or np.std(y) == 0:
+        return None
+    return float(np.corrcoef(x, y)[0, 1])
+
+
+class _IDFState:
+    """
+    共享BERTScorer上生效的idf权重：使用同一权重来源（同一IDF表，或都不加权）的调用并发执行，
+    需要切换来源时等待正在执行的调用结束（等待切换期间新到达的调用排在其后，避免切换方饿死）。
+    同一IDF表增量更新后的新权重直接替换：BERTScorer.score在开始时读取一次_idf_dict，
+    正在执行的调用继续使用各自读到的权重快照
+    """
+    
+    def __init__(self, scorer):
+        self.scorer = scorer
+        self.source = None
+        self.active = 0
+        self.switching = 0
+        self._condition = threading.Condition()
+    
+    @contextmanager
+    def use(self, weights, source=None):
+        with self._condition:
+            switching = False
+            while self.active and not (self.source is source and self.switching == switching):
+                if self.source is not source and not switching:
+                    switching = True
+                    self.switching += 1
+                self._condition.wait()
+            if switching:
+                self.switching -= 1
+            if weights is not None:
+                self.scorer._idf, self.scorer._idf_dict = True, weights
+            else:
+                self.scorer._idf = False
+            if not self.active:
+                self.source = source
+                # 与新来源相同的等待者可以并发执行
+                self._condition.notify_all()
+            self.active += 1
+        try:
+            yield self.scorer
+        finally:
+            with self._condition:
+                self.active -= 1
+                if not self.active:
+                    self._condition.notify_all()
+
+
+def _with_idf(scorer, weights, source=None):
+    """
+    打分期间为共享的BERTScorer设置idf权重（weights为None表示不加权）
+
+    Args:
+        source: 权重来源（如IDFTable），来源相同的调用不互相等待；None时以weights本身为来源
+    """
+    with _idf_states_lock:
+        state = _idf_states.get(scorer)
+        if state is None:
+            state = _idf_states[scorer] = _IDFState(scorer)
+    return state.use(weights, source if weights is not None and source is not None else weights)
+
 
 class BERTScoreScorer:
     """BERTScore评估模型"""
     
-    def __init__(self, lang: str = "zh", model_type: str = None):
+    def __init__(
+        self,
+        lang: str = "zh",
+        model_type: str = None,
+        idf_path: Optional[str] = None,
+        update_idf: bool = False,
+        idf_save_interval: float = 60.0,
+        token_cache_dir: Optional[str] = None,
+        precision: str = "fp32",
+        num_layers: Optional[int] = None
+    ):
         """
         初始化BERTScore
         
@@ -20,36 +137,124 @@ class BERTScoreScorer:
             model_type: BERT模型类型（可选）
                 - 中文: "bert-base-chinese"
                 - 多语言: "bert-base-multilingual-cased"
+                - 蒸馏模型（更快）: "distilbert-base-multilingual-cased"
+            idf_path: 预先计算的IDF表路径（见build_idf），指定后使用idf加权的BERTScore
+            update_idf: 打分时把新到达的参考增量加入IDF表
+            idf_save_interval: 增量更新后写回IDF表的最短间隔（秒）
+            token_cache_dir: 分词缓存目录（None时读取环境变量TRANSLATION_EVALUATOR_TOKEN_CACHE，
+                都没有则不启用）
+            precision: 推理精度（快速模式）
+                - "fp32": 全精度（默认）
+                - "int8": 线性层动态int8量化（仅CPU）
+                - "bf16": bfloat16自动混合精度（CPU需要AVX512-BF16/AMX，否则回退到fp32）
+            num_layers: 使用的隐藏层（默认为bert_score为该模型调好的层，取更浅的层可以减少计算）
         """
+        if precision not in PRECISIONS:
+            raise ValueError(f"不支持的精度: {precision}（可选: {', '.join(PRECISIONS)}）")
         self.lang = lang
         self.model_type = model_type
+        self.precision = precision
+        self.num_layers = num_layers
+        self.token_cache_dir = token_cache_dir
         self._initialized = False
+        
+        self.idf_table = IDFTable(idf_path) if idf_path else None
+        self.update_idf = update_idf
+        self.idf_save_interval = idf_save_interval
+        self._idf_saved_at = time.monotonic()
+        if self.idf_table is not None and update_idf:
+            atexit.register(self._flush_idf)
+    
+    @property
+    def _registry_key(self):
+        return ("bertscore", self.lang, self.model_type, self.precision, self.num_layers)
+    
+    def profile(self) -> Dict:
+        """模型与精度配置（速度/精度档位）"""
+        return {
+            "lang": self.lang,
+            "model_type": self.model_type,
+            "precision": self.precision,
+            "num_layers": self.num_layers
+        }
+    
+    def _load_scorer(self):
+        from bert_score import BERTScorer
+        
+        print(f"正在加载BERTScore模型: {self.model_type or self.lang} ({self.precision})...")
+        scorer = BERTScorer(lang=self.lang, model_type=self.model_type, num_layers=self.num_layers)
+        scorer._precision = self._apply_precision(scorer)
+        
+        # bert_score逐句调用tokenizer.encode，换成带缓存的代理（IDF表构建同样受益）
+        cache_dir = resolve_cache_dir(self.token_cache_dir)
+        if cache_dir:
+            scorer._tokenizer = CachedTokenizer(scorer._tokenizer, cache_dir)
+            print(f"✓ BERTScore分词缓存: {cache_dir}")
+        return scorer
+    
+    def _apply_precision(self, scorer) -> str:
+        """按配置量化模型，返回实际使用的精度（设备不支持时回退到fp32）"""
+        if self.precision == "fp32":
+            return "fp32"
+        import torch
+        
+        on_gpu = str(scorer.device).startswith("cuda")
+        if self.precision == "int8":
+            if on_gpu:
+                print("⚠️  int8动态量化只支持CPU，使用fp32")
+                return "fp32"
+            scorer._model = torch.quantization.quantize_dynamic(scorer._model, {torch.nn.Linear}, dtype=torch.qint8)
+            return "int8"
+        
+        supported = torch.cuda.is_bf16_supported() if on_gpu else cpu_supports_bf16()
+        if not supported:
+            print("⚠️  当前设备不支持bfloat16，使用fp32")
+            return "fp32"
+        return "bf16"
+    
+    @staticmethod
+    def _autocast(scorer):
+        """bf16模式下在自动混合精度中推理"""
+        if getattr(scorer, "_precision", "fp32") != "bf16":
+            return nullcontext()
+        import torch
+        
+        device_type = "cuda" if str(scorer.device).startswith("cuda") else "cpu"
+        return torch.autocast(device_type=device_type, dtype=torch.bfloat16)
     
     def initialize(self):
-        """检查依赖"""
+        """加载BERTScorer（由进程级注册表持有，相同语言/模型的实例在所有评估器间共享）"""
         if self._initialized:
             return True
         
         try:
-            import bert_score
+            with get_registry().use(self._registry_key, self._load_scorer):
+                pass
             self._initialized = True
             print(f"✓ BERTScore已就绪")
             return True
         except ImportError:
             print("❌ 请安装BERTScore: pip install bert-score")
             return False
+        except Exception as e:
+            print(f"❌ BERTScore模型加载失败: {e}")
+            return False
     
     def score(
         self,
         translations: List[str],
-        references: List[str]
+        references: List[Union[str, List[str]]]
     ) -> Dict:
         """
         计算BERTScore
         
+        复用已加载的BERTScorer（不再每次调用都重新加载模型）；
+        多参考时一次批量计算所有参考，每个样本取最高分的参考；
+        bert_score内部对句子去重，被多个样本共享的参考只编码一次
+        
         Args:
             translations: 翻译文本列表
-            references: 参考翻译列表
+            references: 参考翻译列表（每项可以是字符串或多个参考的列表）
             
         Returns:
             Dict: 包含P, R, F1的字典
@@ -59,30 +264,142 @@ class BERTScoreScorer:
                 return {"P": [], "R": [], "F1": [], "error": "Not initialized"}
         
         try:
-            from bert_score import score
+            if is_multi_reference(references):
+                references = [as_reference_list(ref) for ref in references]
             
-            P, R, F1 = score(
-                translations,
-                references,
-                lang=self.lang,
-                model_type=self.model_type,
-                verbose=False
-            )
+            with get_registry().use(self._registry_key, self._load_scorer) as scorer:
+                with _with_idf(scorer, self._idf_weights(scorer, references), self.idf_table), \
+                        get_thread_budget().limit("bertscore"), self._autocast(scorer):
+                    P, R, F1 = scorer.score(translations, references, verbose=False)
+            flush_all()
+            P, R, F1 = P.float(), R.float(), F1.float()
             
             return {
                 "P": P.tolist(),  # Precision
                 "R": R.tolist(),  # Recall
                 "F1": F1.tolist(),  # F1 score
                 "mean_F1": F1.mean().item(),
-                "lang": self.lang
+                "lang": self.lang,
+                "precision": getattr(scorer, "_precision", "fp32")
             }
             
         except Exception as e:
             return {"P": [], "R": [], "F1": [], "error": str(e)}
     
-    def score_single(self, translation: str, reference: str) -> float:
+    def _idf_weights(self, scorer, references) -> Optional[Dict[int, float]]:
+        """当前IDF表的权重（未配置IDF表或表为空时返回None）；按需先加入新的参考"""
+        if self.idf_table is None:
+            return None
+        if self.update_idf:
+            self.idf_table.add(references, scorer._tokenizer)
+            if self.idf_table.dirty and time.monotonic() - self._idf_saved_at >= self.idf_save_interval:
+                self.save_idf()
+        if not len(self.idf_table):
+            return None
+        return self.idf_table.weights(scorer._tokenizer)
+    
+    def build_idf(
+        self,
+        references: List[Union[str, List[str]]],
+        path: Optional[str] = None,
+        save: bool = True
+    ) -> Dict:
+        """
+        用参考语料构建（或增量扩充）IDF表并保存
+        
+        Args:
+            references: 参考翻译列表（每项可以是字符串或多个参考的列表）
+            path: 保存路径（默认为idf_path）
+            save: 是否立即保存（分块构建大语料时可以最后再调用save_idf）
+            
+        Returns:
+            Dict: IDF表统计（文档数、子词数）
+        """
+        if self.idf_table is None:
+            if not path:
+                raise ValueError("未指定IDF表路径")
+            self.idf_table = IDFTable(path)
+        if not self._initialized and not self.initialize():
+            raise RuntimeError("BERTScore未初始化")
+        
+        with get_registry().use(self._registry_key, self._load_scorer) as scorer:
+            added = self.idf_table.add(references, scorer._tokenizer)
+        if save:
+            self.save_idf(path)
+            print(f"✓ IDF表已更新: 新增 {added} 个参考，共 {len(self.idf_table)} 个")
+        return self.idf_table.stats()
+    
+    def save_idf(self, path: Optional[str] = None):
+        """写回IDF表"""
+        if self.idf_table is not None:
+            self.idf_table.save(path)
+            self._idf_saved_at = time.monotonic()
+    
+    def _flush_idf(self):
+        if self.idf_table is not None and self.idf_table.dirty:
+            self.save_idf()
+    
+    def drift_report(
+        self,
+        translations: List[str],
+        references: List[Union[str, List[str]]],
+        baseline_model_type: Optional[str] = None
+    ) -> Dict:
+        """
+        与全精度模型比较分数漂移，用于按部署选择速度/精度档位
+        
+        基线为fp32、默认层数的baseline_model_type（默认为bert_score为该语言选择的模型）；
+        基线与当前模型相同时共用IDF表。两者各自预热后计时
+        
+        Args:
+            translations: 翻译文本列表（应有代表性，建议数百句以上）
+            references: 参考翻译列表
+            baseline_model_type: 基线模型（评估蒸馏模型时通常保持默认）
+            
+        Returns:
+            Dict: F1的Pearson/Spearman相关、平均/最大绝对差、两者耗时与加速比
+        """
+        import numpy as np
+        
+        baseline = BERTScoreScorer(lang=self.lang, model_type=baseline_model_type, token_cache_dir=self.token_cache_dir)
+        if baseline_model_type == self.model_type:
+            baseline.idf_table = self.idf_table
+        # 基线模型只为本次比较加载（已被其他评分器加载的不卸载）
+        registry = get_registry()
+        unload_baseline = baseline._registry_key != self._registry_key and not registry.is_loaded(baseline._registry_key)
+        
+        f1 = {}
+        seconds = {}
+        try:
+            for name, scorer in (("baseline", baseline), ("fast", self)):
+                scorer.score(translations[:1], references[:1])  # 预热（加载模型）
+                started = time.monotonic()
+                result = scorer.score(translations, references)
+                seconds[name] = time.monotonic() - started
+                if result.get("error"):
+                    return {"error": f"{name}: {result['error']}"}
+                f1[name] = np.asarray(result["F1"], dtype=float)
+        finally:
+            if unload_baseline:
+                registry.unload(baseline._registry_key)
+        
+        diff = np.abs(f1["fast"] - f1["baseline"])
+        return {
+            "profile": self.profile(),
+            "baseline": baseline.profile(),
+            "segments": len(translations),
+            "pearson": _pearson(f1["baseline"], f1["fast"]),
+            "spearman": _pearson(_ranks(f1["baseline"]), _ranks(f1["fast"])),
+            "mean_abs_diff": float(diff.mean()) if len(diff) else 0.0,
+            "max_abs_diff": float(diff.max()) if len(diff) else 0.0,
+            "baseline_seconds": round(seconds["baseline"], 3),
+            "seconds": round(seconds["fast"], 3),
+            "speedup": round(seconds["baseline"] / seconds["fast"], 2) if seconds["fast"] > 0 else None
+        }
+    
+    def score_single(self, translation: str, reference: Union[str, List[str]]) -> float:
         """
-        计算单个样本的BERTScore F1
+        计算单个样本的BERTScore F1（reference可以是多个参考的列表）
         
         Returns:
             float: F1分数
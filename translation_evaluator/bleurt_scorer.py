@@ -3,7 +3,7 @@ BLEURT (Bilingual Evaluation Understudy with Representations from Transformers)
 基于BERT的翻译质量评估模型
 """
 
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 import os
 import sys
 import zipfile
@@ -11,6 +11,11 @@ import tempfile
 import warnings
 warnings.filterwarnings('ignore')
 
+from .references import flatten_references, aggregate_by_segment
+from .model_registry import get_registry
+from .thread_budget import get_thread_budget
+from .token_store import CachedWordTokenizer, flush_all, resolve_cache_dir
+
 # 尝试导入下载相关的库
 try:
     import urllib.request
@@ -28,7 +33,7 @@ except ImportError:
 class BLEURTScorer:
     """BLEURT质量评估模型"""
     
-    def __init__(self, checkpoint: str = "BLEURT-20", auto_download: bool = True):
+    def __init__(self, checkpoint: str = "BLEURT-20", auto_download: bool = True, token_cache_dir: Optional[str] = None):
         """
         初始化BLEURT模型
         
@@ -39,14 +44,47 @@ class BLEURTScorer:
                 - 或本地路径，如: "./BLEURT-20" 或 "/path/to/BLEURT-20"
             auto_download: 如果检查点不存在，是否自动下载（默认True）
                 需要网络连接。如果为False，将提示手动下载。
+            token_cache_dir: 分词缓存目录（None时读取环境变量TRANSLATION_EVALUATOR_TOKEN_CACHE，
+                都没有则不启用）
                 
         注意: 如果检查点不存在且auto_download=True，将自动尝试下载。
         下载地址: https://storage.googleapis.com/bleurt-oss-21/BLEURT-20.zip
         """
         self.checkpoint = checkpoint
-        self.scorer = None
+        self._checkpoint_path = None
         self._initialized = False
         self._auto_download = auto_download
+        self.token_cache_dir = token_cache_dir
+    
+    @property
+    def _registry_key(self):
+        return ("bleurt", os.path.abspath(self._checkpoint_path or self.checkpoint))
+    
+    @property
+    def scorer(self):
+        """已加载的BleurtScorer（由进程级注册表持有，同一检查点在所有评估器间共享）"""
+        return get_registry().peek(self._registry_key)
+    
+    def _load_scorer(self):
+        # TensorFlow的线程数只能在运行时初始化（加载模型）前设置
+        get_thread_budget().configure_tensorflow("bleurt")
+        from bleurt import score as bleurt_score
+        
+        print(f"正在加载BLEURT模型: {self._checkpoint_path}...")
+        scorer = bleurt_score.BleurtScorer(self._checkpoint_path)
+        
+        # BLEURT在图外逐句调用tokenizer.tokenize，缓存需要能把id还原成子词
+        cache_dir = resolve_cache_dir(self.token_cache_dir)
+        tokenizer = getattr(scorer, "tokenizer", None)
+        if cache_dir and tokenizer is not None:
+            inverse = CachedWordTokenizer.inverse_mapping(tokenizer)
+            if inverse is None:
+                print("⚠️  BLEURT分词器不支持id还原，不启用分词缓存")
+            else:
+                tokenizer_id = f"bleurt:{os.path.basename(os.path.normpath(self._checkpoint_path))}"
+                scorer.tokenizer = CachedWordTokenizer(tokenizer, inverse, tokenizer_id, cache_dir)
+                print(f"✓ BLEURT分词缓存: {cache_dir}")
+        return scorer
     
     def _download_checkpoint(self, checkpoint_name: str, download_dir: str = ".") -> Optional[str]:
         """
@@ -195,8 +233,9 @@ class BLEURTScorer:
                     print("\n   更多信息: https://github.com/google-research/bleurt")
                     return False
             
-            print(f"正在加载BLEURT模型: {checkpoint_path}...")
-            self.scorer = bleurt_score.BleurtScorer(checkpoint_path)
+            self._checkpoint_path = checkpoint_path
+            with get_registry().use(self._registry_key, self._load_scorer):
+                pass
             
             self._initialized = True
             print(f"✓ BLEURT模型加载成功")
@@ -243,14 +282,16 @@ class BLEURTScorer:
     def score(
         self,
         translations: List[str],
-        references: List[str]
+        references: List[Union[str, List[str]]],
+        aggregation: str = "max"
     ) -> Dict:
         """
         计算BLEURT分数
         
         Args:
             translations: 翻译文本列表
-            references: 参考翻译列表
+            references: 参考翻译列表（每项可以是字符串或多个参考的列表）
+            aggregation: 多参考分数的聚合方式（"max" 或 "mean"）
             
         Returns:
             Dict: 包含scores的字典
@@ -263,15 +304,37 @@ class BLEURTScorer:
                 print(f"        [BLEURT.score] ❌ 初始化失败")
                 return {"scores": [], "error": "Model not initialized"}
         
-        if not self.scorer:
-            print(f"        [BLEURT.score] ❌ scorer为None")
-            return {"scores": [], "error": "Scorer not initialized"}
-        
         try:
-            print(f"        [BLEURT.score] 调用bleurt.scorer.score...")
-            scores = self.scorer.score(
-                references=references,
-                candidates=translations
+            # 推理期间固定模型（超出内存预算被卸载后会在此重新加载）
+            with get_registry().use(self._registry_key, self._load_scorer) as scorer, \
+                    get_thread_budget().limit("bleurt"):
+                return self._score(scorer, translations, references, aggregation)
+        except Exception as e:
+            print(f"        [BLEURT.score] ❌ 异常: {e}")
+            import traceback
+            traceback.print_exc()
+            return {"scores": [], "error": str(e)}
+        finally:
+            flush_all()
+    
+    def _score(self, scorer, translations: List[str], references: List[Union[str, List[str]]], aggregation: str) -> Dict:
+        """在模型已固定时计算BLEURT分数"""
+        try:
+            # 展开多参考，并对重复的(翻译, 参考)对去重，每对只推理一次
+            segment_ids, flat_translations, flat_references, _ = flatten_references(translations, references)
+            unique_pairs = list(dict.fromkeys(zip(flat_translations, flat_references)))
+            
+            print(f"        [BLEURT.score] 调用bleurt.scorer.score... (去重后{len(unique_pairs)}对)")
+            unique_scores = scorer.score(
+                references=[ref for _, ref in unique_pairs],
+                candidates=[cand for cand, _ in unique_pairs]
+            ) if unique_pairs else []
+            pair_scores = dict(zip(unique_pairs, unique_scores))
+            scores = aggregate_by_segment(
+                segment_ids,
+                [pair_scores[pair] for pair in zip(flat_translations, flat_references)],
+                len(translations),
+                aggregation
             )
             print(f"        [BLEURT.score] ✅ 计算完成，返回{len(scores) if scores else 0}个分数")
             print(f"        [BLEURT.score] 分数值: {scores[:3] if scores and len(scores) > 3 else scores}")
@@ -288,16 +351,16 @@ class BLEURTScorer:
             traceback.print_exc()
             return {"scores": [], "error": str(e)}
     
-    def score_single(self, translation: str, reference: str) -> float:
+    def score_single(self, translation: str, reference: Union[str, List[str]]) -> float:
         """
-        计算单个样本的BLEURT分数
+        计算单个样本的BLEURT分数（reference可以是多个参考的列表）
         
         Returns:
             float: BLEURT分数
         """
         print(f"      [BLEURT] 调用score_single")
         print(f"      [BLEURT] 初始化状态: {self._initialized}")
-        print(f"      [BLEURT] scorer存在: {self.scorer is not None}")
+        print(f"      [BLEURT] 模型已加载: {self.scorer is not None}")
         
         if not self._initialized:
             print(f"      [BLEURT] 评估器未初始化，尝试初始化...")
@@ -305,10 +368,6 @@ class BLEURTScorer:
                 print(f"      [BLEURT] ❌ 初始化失败")
                 return 0.0
         
-        if not self.scorer:
-            print(f"      [BLEURT] ❌ scorer为None")
-            return 0.0
-        
         try:
             print(f"      [BLEURT] 调用score方法...")
             result = self.score([translation], [reference])
@@ -0,0 +1,229 @@
+"""
+批量评估检查点
+追加写入的数据文件记录已完成分块的分数，索引文件记录每个分块的偏移量。
+中断后重新运行同一批次时，从第一个未完成的分块继续；
+输入或模型版本不一致时丢弃旧的部分结果。
+全部完成的检查点保留一段时间（客户端断线后重新提交可以直接取回结果），过期后丢弃
+"""
+
+from typing import List, Dict, Optional
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# 已完成检查点的保留时间（秒）
+COMPLETED_TTL = 24 * 3600
+
+# 进程内的任务锁（按检查点路径），与文件锁配合使用
+_job_locks: Dict[str, threading.Lock] = {}
+_job_locks_guard = threading.Lock()
+
+
+def fingerprint(*parts) -> str:
+    """计算输入数据与配置的指纹（SHA-256）"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+class BatchCheckpoint:
+    """批量评估检查点（追加写入的数据文件 + 索引）"""
+
+    def __init__(self, path: str, fingerprint: str, chunk_size: int, ttl: float = COMPLETED_TTL):
+        """
+        打开（或创建）检查点
+
+        Args:
+            path: 检查点路径前缀（生成 <path>.data 和 <path>.index）
+            fingerprint: 输入数据与模型版本的指纹
+            chunk_size: 分块大小（属于检查点的一部分，不一致时同样丢弃旧结果）
+            ttl: 全部完成后的保留时间（秒），过期后重新开始
+        """
+        self.path = path
+        self.fingerprint = fingerprint
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+        self.completed_at = None
+        self._chunks = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def _data_path(self) -> str:
+        return self.path + ".data"
+
+    @property
+    def _index_path(self) -> str:
+        return self.path + ".index"
+
+    def _load(self):
+        """加载索引，校验指纹"""
+        if not os.path.exists(self._index_path):
+            self._reset()
+            return
+
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except Exception as e:
+            print(f"⚠️  检查点索引损坏，重新开始: {e}")
+            self._reset()
+            return
+
+        if index.get("fingerprint") != self.fingerprint or index.get("chunk_size") != self.chunk_size:
+            print(f"⚠️  检查点与当前输入/模型版本不一致，丢弃旧结果: {self.path}")
+            self._reset()
+            return
+
+        if is_expired(index, self.ttl):
+            print(f"⚠️  检查点已过期，重新开始: {self.path}")
+            self._reset()
+            return
+        self.completed_at = index.get("completed_at")
+
+        # 只保留数据文件中完整写入的分块
+        data_size = os.path.getsize(self._data_path) if os.path.exists(self._data_path) else 0
+        self._chunks = {
+            int(chunk_id): (offset, length)
+            for chunk_id, (offset, length) in index.get("chunks", {}).items()
+            if offset + length <= data_size
+        }
+
+    def _reset(self):
+        """清空检查点"""
+        self._chunks = {}
+        self.completed_at = None
+        with open(self._data_path, "wb"):
+            pass
+        self._save_index()
+
+    def _save_index(self):
+        """原子写入索引"""
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "fingerprint": self.fingerprint,
+                "chunk_size": self.chunk_size,
+                "completed_at": self.completed_at,
+                "chunks": {str(k): list(v) for k, v in self._chunks.items()}
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._index_path)
+
+    def completed_chunks(self) -> List[int]:
+        """已完成的分块编号"""
+        return sorted(self._chunks)
+
+    def get(self, chunk_id: int) -> Optional[List[Dict]]:
+        """读取已完成分块的分数（未完成或记录损坏时返回None）"""
+        if chunk_id not in self._chunks:
+            return None
+
+        offset, length = self._chunks[chunk_id]
+        try:
+            with open(self._data_path, "rb") as f:
+                f.seek(offset)
+                record = json.loads(f.read(length).decode("utf-8"))
+            if record.get("chunk") != chunk_id:
+                return None
+            return record["scores"]
+        except Exception:
+            return None
+
+    def put(self, chunk_id: int, scores: List[Dict]):
+        """记录一个已完成分块（先持久化数据，再更新索引）"""
+        line = (json.dumps({"chunk": chunk_id, "scores": scores}, ensure_ascii=False) + "\n").encode("utf-8")
+        with open(self._data_path, "ab") as f:
+            offset = f.tell()
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._chunks[chunk_id] = (offset, len(line))
+        self._save_index()
+
+    def mark_complete(self):
+        """记录批次全部完成的时间（保留ttl秒后过期）"""
+        self.completed_at = time.time()
+        self._save_index()
+
+    def remove(self):
+        """删除检查点文件"""
+        for path in (self._data_path, self._index_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def is_expired(index: Dict, ttl: float = COMPLETED_TTL) -> bool:
+    """检查点索引是否为已完成且超过保留时间"""
+    completed_at = index.get("completed_at")
+    return completed_at is not None and time.time() - completed_at > ttl
+
+
+@contextmanager
+def job_lock(path: str):
+    """
+    同一检查点的任务互斥（进程内锁 + <path>.lock文件锁）：
+    相同job_id的并发运行依次执行，后运行的直接读取先完成的分块
+    """
+    key = os.path.abspath(path)
+    with _job_locks_guard:
+        lock = _job_locks.setdefault(key, threading.Lock())
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with lock, open(path + ".lock", "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def purge_expired(directory: str, ttl: float = COMPLETED_TTL) -> int:
+    """删除目录中已完成且过期的检查点，返回删除的数量（正在运行的任务不受影响）"""
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    for name in os.listdir(directory):
+        if not name.endswith(".index"):
+            continue
+        path = os.path.join(directory, name[:-len(".index")])
+        try:
+            with open(path + ".index", "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except Exception:
+            continue
+        if not is_expired(index, ttl):
+            continue
+        with job_lock(path):
+            # 取得锁后重新确认（期间可能有任务重新开始了这个检查点）
+            try:
+                with open(path + ".index", "r", encoding="utf-8") as f:
+                    index = json.load(f)
+            except Exception:
+                continue
+            if is_expired(index, ttl):
+                # 锁文件保留：删除后其他进程可能在不同的文件上加锁
+                for suffix in (".data", ".index"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+                removed += 1
+    return removed
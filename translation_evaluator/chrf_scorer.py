@@ -4,10 +4,12 @@ ChrF (Character n-gram F-score)
 对形态变化丰富的语言（如中文）更友好
 """
 
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 import warnings
 warnings.filterwarnings('ignore')
 
+from .references import as_reference_list
+
 
 class ChrFScorer:
     """ChrF质量评估模型"""
@@ -22,6 +24,7 @@ class ChrFScorer:
         """
         self.n = n
         self.beta = beta
+        self.char_order = 6  # sacrebleu默认字符n-gram阶数
         self._initialized = False
     
     def initialize(self):
@@ -41,17 +44,17 @@ class ChrFScorer:
     def score(
         self,
         translations: List[str],
-        references: List[str]
+        references: List[Union[str, List[str]]]
     ) -> Dict:
         """
         计算ChrF分数
         
         Args:
             translations: 翻译文本列表
-            references: 参考翻译列表
+            references: 参考翻译列表（每项可以是字符串或多个参考的列表）
             
         Returns:
-            Dict: 包含scores和mean_score的字典
+            Dict: 包含scores和mean_score的字典（没有参考的样本为0.0，不计入corpus_score）
         """
         if not self._initialized:
             if not self.initialize():
@@ -62,25 +65,17 @@ class ChrFScorer:
             
             chrf = CHRF(word_order=self.n, beta=self.beta)
             
-            # sacrebleu需要列表的列表（支持多个参考翻译）
-            refs = [[ref] for ref in references]
-            
-            # 计算分数
-            result = chrf.corpus_score(translations, refs)
-            
-            # 转换为0-1范围（sacrebleu返回0-100）
-            scores = [result.score / 100.0] * len(translations)  # 简化：所有样本使用相同分数
-            
-            # 如果需要每个样本的分数，需要逐个计算
-            individual_scores = []
-            for trans, ref in zip(translations, references):
-                individual_result = chrf.sentence_score(trans, [ref])
-                individual_scores.append(individual_result.score / 100.0)
+            # 逐句统计量只提取一次，句子分数和语料分数都由它计算
+            indices, stats = self._statistics(chrf, translations, references)
+            individual_scores = [0.0] * len(translations)
+            for i, seg_stats in zip(indices, stats):
+                individual_scores[i] = chrf._compute_f_score(seg_stats) / 100.0
+            corpus_score = self.corpus_score_from_statistics(stats) if stats else 0.0
             
             return {
                 "scores": individual_scores,
                 "mean_score": sum(individual_scores) / len(individual_scores) if individual_scores else 0.0,
-                "corpus_score": result.score / 100.0,
+                "corpus_score": corpus_score,
                 "n": self.n,
                 "beta": self.beta
             }
@@ -88,9 +83,76 @@ class ChrFScorer:
         except Exception as e:
             return {"scores": [], "mean_score": 0.0, "error": str(e)}
     
-    def score_single(self, translation: str, reference: str) -> float:
+    def _statistics(self, chrf, translations: List[str], references: List[Union[str, List[str]]]):
+        """
+        有参考的样本的逐句统计量（None或空参考的样本跳过）
+
+        Returns:
+            (样本索引列表, 对应的统计量列表)
+        """
+        # sacrebleu需要参考流的列表（支持多个参考翻译，缺失的参考用None填充）
+        ref_lists = [as_reference_list(ref) for ref in references]
+        indices = [i for i, refs in enumerate(ref_lists) if refs]
+        if not indices:
+            return [], []
+        stats = chrf._extract_corpus_statistics(
+            [translations[i] for i in indices],
+            self._reference_streams([ref_lists[i] for i in indices])
+        )
+        return indices, stats
+    
+    @staticmethod
+    def _reference_streams(ref_lists: List[List[str]]) -> List[List[Optional[str]]]:
+        """将逐句的参考列表转置为sacrebleu的参考流（多参考数量不一致时用None填充）"""
+        num_streams = max((len(refs) for refs in ref_lists), default=1) or 1
+        return [
+            [refs[k] if k < len(refs) else None for refs in ref_lists]
+            for k in range(num_streams)
+        ]
+    
+    def sentence_statistics(
+        self,
+        translations: List[str],
+        references: List[Union[str, List[str]]]
+    ) -> List[List[int]]:
+        """
+        提取逐句ChrF充分统计量（用于显著性检验和增量评估）
+        
+        Args:
+            translations: 翻译文本列表
+            references: 参考翻译列表（每项可以是字符串或多个参考的列表）
+            
+        Returns:
+            List[List[int]]: 每个样本的 [hyp, ref, match] * order 计数（没有参考的样本全为0）
+        """
+        if not self._initialized:
+            if not self.initialize():
+                return []
+        
+        from sacrebleu.metrics import CHRF
+        
+        chrf = CHRF(word_order=self.n, beta=self.beta)
+        indices, stats = self._statistics(chrf, translations, references)
+        result = [[0] * (3 * (self.char_order + self.n)) for _ in translations]
+        for i, seg_stats in zip(indices, stats):
+            result[i] = seg_stats
+        return result
+    
+    def corpus_score_from_statistics(self, stats) -> float:
+        """
+        由逐句统计量（或其和）计算语料级ChrF分数 (0-1)
+        """
+        import numpy as np
+        from .sufficient_stats import chrf_from_statistics
+        
+        stats = np.asarray(stats, dtype=np.float64)
+        if stats.ndim == 2:
+            stats = stats.sum(axis=0)
+        return chrf_from_statistics(stats, char_order=self.char_order, word_order=self.n, beta=self.beta)
+    
+    def score_single(self, translation: str, reference: Union[str, List[str]]) -> float:
         """
-        计算单个样本的ChrF分数
+        计算单个样本的ChrF分数（reference可以是多个参考的列表）
         
         Returns:
             float: ChrF分数 (0-1)
@@ -0,0 +1,400 @@
+"""
+命令行语料评估器
+流式读取TSV/JSONL/平行纯文本文件（支持gzip/zstd压缩），按固定大小分块评估，
+逐块写出逐句结果，最后输出语料级汇总。内存占用与语料大小无关
+"""
+
+from typing import List, Dict, Optional, Iterator, Tuple, IO
+import argparse
+import gzip
+import io
+import json
+import sys
+from itertools import islice
+
+# (source, translation, reference) 其中reference可以是字符串、列表或None
+Segment = Tuple[str, str, object]
+
+ALL_METRICS = ["bleu", "chrf", "comet", "bleurt", "bertscore"]
+
+
+def open_text(path: str, mode: str = "r", compression: str = "auto") -> IO:
+    """
+    打开（可能压缩的）文本文件
+
+    Args:
+        path: 文件路径（"-" 表示标准输入/输出）
+        mode: "r" 或 "w"
+        compression: auto（按扩展名判断）、none、gzip、zstd
+    """
+    if path == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+
+    if compression == "auto":
+        if path.endswith(".gz"):
+            compression = "gzip"
+        elif path.endswith(".zst") or path.endswith(".zstd"):
+            compression = "zstd"
+        else:
+            compression = "none"
+
+    if compression == "gzip":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("读取/写入zstd文件需要安装zstandard: pip install zstandard")
+        if mode == "r":
+            stream = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+        return io.TextIOWrapper(stream, encoding="utf-8")
+
+    return open(path, mode, encoding="utf-8")
+
+
+def _reference_value(refs: List[str]):
+    """单参考返回字符串，多参考返回列表"""
+    refs = [ref for ref in refs if ref]
+    if not refs:
+        return None
+    return refs[0] if len(refs) == 1 else refs
+
+
+def read_tsv(path: str, compression: str = "auto") -> Iterator[Segment]:
+    """读取TSV: source<TAB>translation[<TAB>reference...]（多列参考视为多参考）"""
+    f = open_text(path, "r", compression)
+    try:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 2:
+                continue
+            yield fields[0], fields[1], _reference_value(fields[2:])
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def read_jsonl(path: str, compression: str = "auto") -> Iterator[Segment]:
+    """读取JSONL: {"source", "translation", "reference"}（reference可以是列表）"""
+    f = open_text(path, "r", compression)
+    try:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            reference = item.get("reference", item.get("references"))
+            if isinstance(reference, list):
+                reference = _reference_value(reference)
+            yield item.get("source", ""), item["translation"], reference
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def read_parallel(
+    src_path: Optional[str],
+    hyp_path: str,
+    ref_paths: List[str],
+    compression: str = "auto"
+) -> Iterator[Segment]:
+    """逐行读取平行纯文本文件（多个参考文件视为多参考）"""
+    files = []
+    try:
+        hyp_file = open_text(hyp_path, "r", compression)
+        files.append(hyp_file)
+        src_file = open_text(src_path, "r", compression) if src_path else None
+        if src_file:
+            files.append(src_file)
+        ref_files = [open_text(path, "r", compression) for path in ref_paths]
+        files.extend(ref_files)
+
+        line_no = 0
+        for line_no, hyp in enumerate(hyp_file, 1):
+            src = src_file.readline() if src_file else ""
+            refs = [ref_file.readline() for ref_file in ref_files]
+            if (src_file and not src) or any(not ref for ref in refs):
+                raise ValueError(f"平行文件行数不一致（第{line_no}行）")
+            yield src.rstrip("\n"), hyp.rstrip("\n"), _reference_value([ref.rstrip("\n") for ref in refs])
+        # 译文文件较短：源文本/参考文件还有剩余行
+        if (src_file and src_file.readline()) or any(ref_file.readline() for ref_file in ref_files):
+            raise ValueError(f"平行文件行数不一致（译文只有{line_no}行，源文本或参考文件更长）")
+    finally:
+        for f in files:
+            if f is not sys.stdin:
+                f.close()
+
+
+def iter_chunks(segments: Iterator[Segment], chunk_size: int) -> Iterator[List[Segment]]:
+    """按固定大小分块"""
+    while True:
+        chunk = list(islice(segments, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="translation-evaluator",
+        description="流式语料评估（BLEU, ChrF, COMET, BLEURT, BERTScore）"
+    )
+    parser.add_argument("--input", "-i", help="TSV或JSONL输入文件（'-'表示标准输入）")
+    parser.add_argument("--format", choices=["auto", "tsv", "jsonl"], default="auto", help="输入格式 (默认: 按扩展名判断)")
+    parser.add_argument("--src", help="源文本文件（平行文件模式）")
+    parser.add_argument("--hyp", help="翻译文件（平行文件模式）")
+    parser.add_argument("--ref", action="append", default=[], help="参考翻译文件（可重复指定以使用多参考）")
+    parser.add_argument("--compression", choices=["auto", "none", "gzip", "zstd"], default="auto", help="输入/输出压缩格式 (默认: 按扩展名判断)")
+    parser.add_argument("--output", "-o", help="逐句结果输出文件（JSONL，'-'表示标准输出）")
+    parser.add_argument("--summary", help="语料级汇总输出文件（JSON，默认打印到标准错误）")
+    parser.add_argument("--metrics", default="bleu,chrf,comet,bertscore", help=f"逗号分隔的指标列表 (可选: {','.join(ALL_METRICS)})")
+    parser.add_argument("--batch-size", type=int, default=256, help="每块样本数 (默认: 256)")
+    parser.add_argument("--comet-model", default="Unbabel/wmt22-comet-da", help="COMET模型名称")
+    parser.add_argument("--multi-ref-aggregation", choices=["max", "mean"], default="max", help="多参考时COMET/BLEURT的聚合方式")
+    parser.add_argument("--bertscore-lang", default="zh", help="BERTScore的目标语言 (默认: zh)")
+    parser.add_argument("--bertscore-idf", help="BERTScore的IDF表路径（指定后使用idf加权的BERTScore）")
+    parser.add_argument("--build-bertscore-idf", action="store_true", help="用输入的参考翻译构建/扩充--bertscore-idf指定的IDF表后退出")
+    parser.add_argument("--bertscore-model", help="BERTScore模型（默认为bert_score为目标语言选择的模型，可选蒸馏模型）")
+    parser.add_argument("--bertscore-precision", choices=["fp32", "int8", "bf16"], default="fp32", help="BERTScore推理精度：int8动态量化（CPU）或bf16混合精度 (默认: fp32)")
+    parser.add_argument("--bertscore-num-layers", type=int, help="BERTScore使用的隐藏层（更浅的层更快）")
+    parser.add_argument("--bertscore-drift", action="store_true", help="用输入的第一块样本比较当前BERTScore配置与全精度默认模型的分数漂移后退出")
+    parser.add_argument("--thread-budget", help="按指标分配torch/TF/BLAS线程数与CPU亲和性的JSON配置")
+    parser.add_argument("--benchmark-threads", metavar="CONFIG", help="用输入的第一块样本搜索本机最优的线程划分，写入CONFIG后退出")
+    parser.add_argument("--token-cache-dir", help="神经指标的分词缓存目录（重复运行跳过分词，多个进程可共享）")
+    return parser
+
+
+def _open_segments(args) -> Iterator[Segment]:
+    """根据命令行参数选择输入读取器"""
+    if args.input:
+        fmt = args.format
+        if fmt == "auto":
+            name = args.input
+            for suffix in (".gz", ".zst", ".zstd"):
+                if name.endswith(suffix):
+                    name = name[:-len(suffix)]
+            fmt = "jsonl" if name.endswith(".jsonl") or name.endswith(".json") else "tsv"
+        reader = read_jsonl if fmt == "jsonl" else read_tsv
+        return reader(args.input, args.compression)
+    if args.hyp:
+        return read_parallel(args.src, args.hyp, args.ref, args.compression)
+    raise SystemExit("请指定 --input 或 --hyp")
+
+
+def build_idf(args) -> int:
+    """用输入语料的参考翻译构建BERTScore的IDF表（逐块加入，结束时保存一次）"""
+    from .bertscore_scorer import BERTScoreScorer
+
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        scorer = BERTScoreScorer(
+            lang=args.bertscore_lang,
+            model_type=args.bertscore_model,
+            idf_path=args.bertscore_idf,
+            token_cache_dir=args.token_cache_dir
+        )
+        for chunk in iter_chunks(_open_segments(args), args.batch_size):
+            scorer.build_idf([seg[2] for seg in chunk], save=False)
+        scorer.save_idf()
+    finally:
+        sys.stdout = stdout
+
+    stats = scorer.idf_table.stats()
+    print(f"✓ IDF表已保存: {stats['path']} ({stats['num_docs']} 个参考, {stats['vocab_size']} 个子词)", file=sys.stderr)
+    return 0
+
+
+def _bertscore_scorer(args):
+    """按命令行参数创建BERTScore评估器（模型、精度、层数）"""
+    from .bertscore_scorer import BERTScoreScorer
+
+    return BERTScoreScorer(
+        lang=args.bertscore_lang,
+        model_type=args.bertscore_model,
+        idf_path=args.bertscore_idf,
+        token_cache_dir=args.token_cache_dir,
+        precision=args.bertscore_precision,
+        num_layers=args.bertscore_num_layers
+    )
+
+
+def bertscore_drift(args) -> int:
+    """比较当前BERTScore配置（模型/精度/层数）与全精度默认模型的分数漂移，报告输出到标准输出"""
+    chunk = next(iter_chunks(_open_segments(args), args.batch_size), [])
+    if not chunk:
+        print("❌ 输入为空", file=sys.stderr)
+        return 2
+
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        report = _bertscore_scorer(args).drift_report([seg[1] for seg in chunk], [seg[2] for seg in chunk])
+    finally:
+        sys.stdout = stdout
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if report.get("error") else 0
+
+
+def benchmark_threads(args, metrics: List[str]) -> int:
+    """并发运行神经指标，搜索本机最优的线程划分并保存为线程预算配置"""
+    from .thread_budget import get_thread_budget
+
+    chunk = next(iter_chunks(_open_segments(args), args.batch_size), [])
+    if not chunk:
+        print("❌ 输入为空", file=sys.stderr)
+        return 2
+    sources = [seg[0] for seg in chunk]
+    translations = [seg[1] for seg in chunk]
+    references = [seg[2] for seg in chunk]
+
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        # 关闭缓存，每次测量都执行完整推理
+        scorers = {}
+        if "comet" in metrics:
+            from .comet_scorer import COMETScorer
+            scorer = COMETScorer(args.comet_model, use_embedding_cache=False)
+            scorers["comet"] = lambda scorer=scorer: scorer.score(sources, translations, references)
+        if "bertscore" in metrics:
+            scorer = _bertscore_scorer(args)
+            scorers["bertscore"] = lambda scorer=scorer: scorer.score(translations, references)
+        if "bleurt" in metrics:
+            from .bleurt_scorer import BLEURTScorer
+            scorer = BLEURTScorer()
+            scorers["bleurt"] = lambda scorer=scorer: scorer.score(translations, references)
+        if not scorers:
+            print("❌ --benchmark-threads 需要至少一个神经指标 (comet, bleurt, bertscore)", file=sys.stderr)
+            return 2
+
+        workloads = {}
+        for metric, run in scorers.items():
+            result = run()  # 预热（加载模型）
+            if result.get("error"):
+                print(f"⚠️  {metric}不可用，跳过: {result['error']}")
+            else:
+                workloads[metric] = run
+        if not workloads:
+            return 1
+
+        print(f"🔍 在 {len(get_thread_budget().worker_cores)} 个核心上搜索线程划分（{len(chunk)} 个样本）...")
+        report = get_thread_budget().benchmark(workloads)
+    finally:
+        sys.stdout = stdout
+
+    with open(args.benchmark_threads, "w", encoding="utf-8") as f:
+        json.dump(report["config"], f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2), file=sys.stderr)
+    print(f"✓ 线程预算已保存: {args.benchmark_threads}", file=sys.stderr)
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    args = build_parser().parse_args(argv)
+
+    metrics = [m.strip() for m in args.metrics.split(",") if m.strip()]
+    unknown = [m for m in metrics if m not in ALL_METRICS]
+    if unknown:
+        print(f"❌ 未知指标: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    if args.build_bertscore_idf:
+        if not args.bertscore_idf:
+            print("❌ --build-bertscore-idf 需要同时指定 --bertscore-idf", file=sys.stderr)
+            return 2
+        return build_idf(args)
+
+    if args.thread_budget:
+        from .thread_budget import ThreadBudget, get_thread_budget
+        get_thread_budget().configure(ThreadBudget.load(args.thread_budget))
+
+    if args.benchmark_threads:
+        return benchmark_threads(args, metrics)
+
+    if args.bertscore_drift:
+        return bertscore_drift(args)
+
+    from .unified_evaluator import UnifiedEvaluator
+    from .incremental import IncrementalEvaluation
+
+    # 评估器的进度信息输出到标准错误，避免污染标准输出上的结果
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        evaluator = UnifiedEvaluator(
+            use_bleu="bleu" in metrics,
+            use_comet="comet" in metrics,
+            use_bleurt="bleurt" in metrics,
+            use_bertscore="bertscore" in metrics,
+            use_mqm=False,
+            use_chrf="chrf" in metrics,
+            comet_model=args.comet_model,
+            multi_ref_aggregation=args.multi_ref_aggregation,
+            bertscore_idf=args.bertscore_idf,
+            bertscore_lang=args.bertscore_lang,
+            bertscore_models={args.bertscore_lang: args.bertscore_model} if args.bertscore_model else None,
+            token_cache_dir=args.token_cache_dir,
+            bertscore_precision=args.bertscore_precision,
+            bertscore_num_layers=args.bertscore_num_layers
+        )
+        evaluator.initialize()
+    finally:
+        sys.stdout = stdout
+
+    accumulator = IncrementalEvaluation(evaluator)
+    output = open_text(args.output, "w", args.compression) if args.output else None
+
+    try:
+        index = 0
+        for chunk in iter_chunks(_open_segments(args), args.batch_size):
+            sources = [seg[0] for seg in chunk]
+            translations = [seg[1] for seg in chunk]
+            references = [seg[2] for seg in chunk]
+
+            sys.stdout = sys.stderr
+            try:
+                results = accumulator.update(sources, translations, references)
+            finally:
+                sys.stdout = stdout
+
+            if output:
+                for result in results:
+                    record = {"index": index}
+                    record.update({
+                        "bleu": result.bleu,
+                        "chrf": result.chrf,
+                        "comet": result.comet,
+                        "bleurt": result.bleurt,
+                        "bertscore_f1": result.bertscore_f1,
+                        "final_score": result.final_score
+                    })
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    index += 1
+                output.flush()
+            else:
+                index += len(results)
+
+            print(f"已评估 {index} 个样本", file=sys.stderr)
+    finally:
+        if output and output is not sys.stdout:
+            output.close()
+
+    summary = accumulator.corpus_result()
+    summary["metrics"] = metrics
+    summary_text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(summary_text + "\n")
+    else:
+        print(summary_text, file=sys.stderr)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+API负载编码
+- 快速JSON编码（安装orjson时使用，否则回退到标准库json）
+- gzip/zstd内容编码（zstd需要安装zstandard）
+- 列式响应：每个指标一个数组，替代逐样本重复键的字典列表；
+  请求Accept: application/msgpack时以MessagePack二进制返回（需要安装msgpack）
+"""
+
+from typing import Dict, List, Optional, Tuple
+import gzip
+import io
+import json
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+JSON_TYPE = "application/json"
+MSGPACK_TYPE = "application/msgpack"
+
+# 小于该大小的响应不压缩
+MIN_COMPRESS_SIZE = 1024
+
+# 请求体大小上限（字节），解压后的大小同样受此限制
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+# 流式解压每次读取的字节数
+_CHUNK_SIZE = 1024 * 1024
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def supported_encodings() -> List[str]:
+    """本机支持的内容编码（按优先顺序）"""
+    return (["zstd"] if zstandard is not None else []) + ["gzip"]
+
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def dumps_json(obj) -> bytes:
+    """JSON编码为UTF-8字节（优先使用orjson）"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def loads_json(data: bytes):
+    """JSON解码（优先使用orjson）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def compress(data: bytes, encoding: Optional[str]) -> bytes:
+    """按内容编码压缩（None/identity表示不压缩）"""
+    if not encoding or encoding == "identity":
+        return data
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=5)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd编码需要安装zstandard: pip install zstandard")
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    raise ValueError(f"不支持的内容编码: {encoding}")
+
+
+def _read_limited(stream, max_size: int) -> bytes:
+    """分块读取解压流，超过max_size时抛出ValueError（防止压缩炸弹）"""
+    chunks = []
+    total = 0
+    while True:
+        chunk = stream.read(min(_CHUNK_SIZE, max_size + 1 - total))
+        if not chunk:
+            return b"".join(chunks)
+        total += len(chunk)
+        if total > max_size:
+            raise ValueError(f"解压后的数据过大（上限 {max_size} 字节）")
+        chunks.append(chunk)
+
+
+def decompress(data: bytes, encoding: Optional[str], max_size: int = MAX_BODY_SIZE) -> bytes:
+    """
+    按内容编码解压（不认识的编码、损坏或截断的数据、解压后超过max_size都抛出ValueError）
+    """
+    encoding = (encoding or "").strip().lower()
+    if not encoding or encoding == "identity":
+        return data
+    if encoding in ("gzip", "x-gzip"):
+        try:
+            with gzip.GzipFile(fileobj=io.BytesIO(data)) as stream:
+                return _read_limited(stream, max_size)
+        except (OSError, EOFError, zlib.error) as e:
+            raise ValueError(f"gzip数据损坏: {e}")
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd编码需要安装zstandard: pip install zstandard")
+        try:
+            with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)) as stream:
+                return _read_limited(stream, max_size)
+        except (OSError, EOFError, zstandard.ZstdError) as e:
+            raise ValueError(f"zstd数据损坏: {e}")
+    raise ValueError(f"不支持的内容编码: {encoding}")
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """根据Accept-Encoding选择响应的内容编码（优先zstd，其次gzip）"""
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(name.strip().lower())
+    for encoding in supported_encodings():
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    """客户端是否接受MessagePack响应（且服务器已安装msgpack）"""
+    return msgpack is not None and bool(accept) and MSGPACK_TYPE in accept
+
+
+def decode_body(
+    data: bytes,
+    content_encoding: Optional[str] = None,
+    content_type: Optional[str] = None,
+    max_size: int = MAX_BODY_SIZE,
+    allow_decoded: bool = False
+):
+    """
+    解码请求/响应体（先按内容编码解压，解压后最多max_size字节，再按类型解析JSON或MessagePack）
+
+    Args:
+        allow_decoded: 声明了gzip/zstd编码但数据没有对应的魔数时按未压缩处理
+            （客户端解码响应时使用：HTTP库可能已经自动解压）；默认抛出ValueError
+    """
+    encoding = (content_encoding or "").lower()
+    magic = _ZSTD_MAGIC if "zstd" in encoding else b"\x1f\x8b" if "gzip" in encoding else None
+    if magic is not None and not data.startswith(magic):
+        if not allow_decoded:
+            raise ValueError(f"声明了{content_encoding}编码，但数据不是{content_encoding}格式")
+        content_encoding = None
+    data = decompress(data, content_encoding, max_size)
+    if not data:
+        return None
+    if content_type and MSGPACK_TYPE in content_type:
+        if msgpack is None:
+            raise ValueError("MessagePack负载需要安装msgpack: pip install msgpack")
+        return msgpack.unpackb(data, raw=False)
+    return loads_json(data)
+
+
+def encode_body(
+    payload,
+    binary: bool = False,
+    encoding: Optional[str] = None,
+    min_compress_size: int = MIN_COMPRESS_SIZE
+) -> Tuple[bytes, Dict[str, str]]:
+    """
+    编码请求/响应体
+
+    Args:
+        payload: 要编码的对象
+        binary: 使用MessagePack（未安装msgpack时回退到JSON）
+        encoding: 内容编码（gzip/zstd/None）
+        min_compress_size: 小于该大小时不压缩
+
+    Returns:
+        (body, headers) headers包含Content-Type和（压缩时的）Content-Encoding
+    """
+    if binary and msgpack is not None:
+        body = msgpack.packb(payload, use_bin_type=True)
+        headers = {"Content-Type": MSGPACK_TYPE}
+    else:
+        body = dumps_json(payload)
+        headers = {"Content-Type": f"{JSON_TYPE}; charset=utf-8"}
+
+    if encoding and len(body) >= min_compress_size:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+        headers["Vary"] = "Accept-Encoding"
+    return body, headers
+
+
+def to_columnar(scores: List[Dict]) -> Dict[str, List]:
+    """逐样本的分数字典列表 → {指标: 数组}"""
+    columns: Dict[str, List] = {}
+    for i, score in enumerate(scores):
+        for key, value in score.items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [None] * i
+            column.append(value)
+        for key, column in columns.items():
+            if len(column) <= i:
+                column.append(None)
+    return columns
+
+
+def from_columnar(columns: Dict[str, List], count: Optional[int] = None) -> List[Dict]:
+    """{指标: 数组} → 逐样本的分数字典列表"""
+    if count is None:
+        count = max((len(column) for column in columns.values()), default=0)
+    keys = list(columns)
+    return [{key: columns[key][i] for key in keys} for i in range(count)]
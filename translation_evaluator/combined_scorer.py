@@ -3,8 +3,11 @@
 整合多种专业评估模型和自定义MQM评分
 """
 
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union, Tuple
 from dataclasses import dataclass
+import threading
+
+from .references import as_reference_list, has_reference
 
 
 @dataclass
@@ -30,18 +33,40 @@ class ComprehensiveScore:
     
     # 元数据
     model_info: Dict = None
+    metrics: List[str] = None  # 实际计算的指标
+    skipped: List[str] = None  # 级联模式下未计算的神经网络指标
 
 
 class CombinedQualityScorer:
     """组合质量评估器"""
     
+    # 可按请求选择的指标
+    METRICS = ("bleu", "chrf", "comet", "bleurt", "bertscore", "mqm")
+    
+    # 可在运行时重新配置的指标 → (开关属性, 评估器属性)
+    RECONFIGURABLE_METRICS = {
+        "comet": ("use_comet", "comet_scorer"),
+        "bleurt": ("use_bleurt", "bleurt_scorer"),
+        "bertscore": ("use_bertscore", "bertscore_scorer"),
+        "chrf": ("use_chrf", "chrf_scorer"),
+    }
+    
     def __init__(
         self,
         use_comet: bool = True,
         use_bleurt: bool = False,  # BLEURT较难安装，默认关闭
         use_bertscore: bool = True,
         use_chrf: bool = True,
-        comet_model: str = "Unbabel/wmt22-comet-da"
+        comet_model: str = "Unbabel/wmt22-comet-da",
+        multi_ref_aggregation: str = "max",
+        bertscore_idf: Optional[Union[str, Dict[str, str]]] = None,
+        update_bertscore_idf: bool = False,
+        bertscore_lang: str = "zh",
+        bertscore_models: Optional[Dict[str, str]] = None,
+        comet_models: Optional[Dict[str, str]] = None,
+        token_cache_dir: Optional[str] = None,
+        bertscore_precision: str = "fp32",
+        bertscore_num_layers: Optional[int] = None
     ):
         """
         初始化组合评估器
@@ -52,6 +77,17 @@ class CombinedQualityScorer:
             use_bertscore: 是否使用BERTScore
             use_chrf: 是否使用ChrF
             comet_model: COMET模型名称
+            multi_ref_aggregation: 多参考时COMET/BLEURT分数的聚合方式（"max" 或 "mean"）
+            bertscore_idf: BERTScore的IDF表路径（指定后使用idf加权，见BERTScoreScorer.build_idf）。
+                IDF表与分词器绑定：字符串只用于bertscore_lang的模型，
+                按语言路由的模型需要以字典指定各目标语言的表（如 {"zh": "idf/zh.json", "en": "idf/en.json"}）
+            update_bertscore_idf: 打分时把新到达的参考增量加入IDF表
+            bertscore_lang: 未指定语言对的样本使用的BERTScore目标语言
+            bertscore_models: 目标语言 → BERTScore模型（如 {"en": "roberta-large"}，未列出的语言使用bert_score的默认模型）
+            comet_models: 语言对 → COMET模型（如 {"en-de": "Unbabel/wmt22-comet-da"}，未列出的语言对使用comet_model）
+            token_cache_dir: COMET/BLEURT/BERTScore共用的分词缓存目录（见token_store）
+            bertscore_precision: BERTScore推理精度（"fp32"、"int8"、"bf16"，见BERTScoreScorer）
+            bertscore_num_layers: BERTScore使用的隐藏层（None为模型默认层）
         """
         self.use_comet = use_comet
         self.use_bleurt = use_bleurt
@@ -65,6 +101,25 @@ class CombinedQualityScorer:
         self.chrf_scorer = None
         
         self.comet_model_name = comet_model
+        self.multi_ref_aggregation = multi_ref_aggregation
+        self.bertscore_idf = bertscore_idf
+        self.update_bertscore_idf = update_bertscore_idf
+        self.token_cache_dir = token_cache_dir
+        
+        # 按语言路由：其他目标语言的BERTScore、按语言对指定的COMET模型（首次用到时创建，模型由注册表共享）
+        self.bertscore_lang = bertscore_lang
+        self.bertscore_models = dict(bertscore_models or {})
+        self.bertscore_precision = bertscore_precision
+        self.bertscore_num_layers = bertscore_num_layers
+        self.comet_models = {
+            "-".join(self.parse_lang_pair(pair)): model for pair, model in (comet_models or {}).items()
+        }
+        self._routed_scorers: Dict[Tuple[str, str], object] = {}
+        self._routed_lock = threading.Lock()
+        
+        # 串行执行重新配置；reconfiguring为正在后台加载的指标
+        self._reconfigure_lock = threading.Lock()
+        self.reconfiguring: List[str] = []
     
     def initialize(self):
         """初始化所有评估模型"""
@@ -83,7 +138,7 @@ class CombinedQualityScorer:
                 print(f"   [DEBUG] 导入COMETScorer...")
                 from .comet_scorer import COMETScorer
                 print(f"   [DEBUG] 创建COMETScorer实例...")
-                self.comet_scorer = COMETScorer(self.comet_model_name)
+                self.comet_scorer = COMETScorer(self.comet_model_name, token_cache_dir=self.token_cache_dir)
                 print(f"   [DEBUG] 调用initialize()...")
                 init_result = self.comet_scorer.initialize()
                 print(f"   [DEBUG] initialize()返回: {init_result}")
@@ -117,7 +172,7 @@ class CombinedQualityScorer:
                 print(f"   [DEBUG] 导入BLEURTScorer...")
                 from .bleurt_scorer import BLEURTScorer
                 print(f"   [DEBUG] 创建BLEURTScorer实例...")
-                self.bleurt_scorer = BLEURTScorer()
+                self.bleurt_scorer = BLEURTScorer(token_cache_dir=self.token_cache_dir)
                 print(f"   [DEBUG] 调用initialize()...")
                 init_result = self.bleurt_scorer.initialize()
                 print(f"   [DEBUG] initialize()返回: {init_result}")
@@ -146,8 +201,7 @@ class CombinedQualityScorer:
         # 初始化BERTScore
         if self.use_bertscore:
             try:
-                from .bertscore_scorer import BERTScoreScorer
-                self.bertscore_scorer = BERTScoreScorer(lang="zh")
+                self.bertscore_scorer = self._create_scorer("bertscore")
                 if self.bertscore_scorer.initialize():
                     print("✅ BERTScore已就绪")
                 else:
@@ -180,12 +234,282 @@ class CombinedQualityScorer:
         
         return success
     
+    def _create_scorer(self, metric: str, comet_model: Optional[str] = None, bertscore_profile: Optional[Dict] = None):
+        """创建（未初始化的）单个指标评估器（bertscore_profile可覆盖BERTScore的precision/num_layers）"""
+        if metric == "comet":
+            from .comet_scorer import COMETScorer
+            return COMETScorer(comet_model or self.comet_model_name, token_cache_dir=self.token_cache_dir)
+        if metric == "bleurt":
+            from .bleurt_scorer import BLEURTScorer
+            return BLEURTScorer(token_cache_dir=self.token_cache_dir)
+        if metric == "bertscore":
+            from .bertscore_scorer import BERTScoreScorer
+            return self._create_bertscore(self.bertscore_lang, **(bertscore_profile or {}))
+        if metric == "chrf":
+            from .chrf_scorer import ChrF2Scorer
+            return ChrF2Scorer()
+        raise ValueError(f"不支持重新配置的指标: {metric}")
+    
+    def _bertscore_idf_path(self, lang: str) -> Optional[str]:
+        """目标语言的IDF表路径（字符串形式的bertscore_idf只属于bertscore_lang）"""
+        if isinstance(self.bertscore_idf, dict):
+            return self.bertscore_idf.get(lang)
+        return self.bertscore_idf if lang == self.bertscore_lang else None
+    
+    def _create_bertscore(self, lang: str, precision: Optional[str] = None, num_layers: Optional[int] = None):
+        """创建目标语言的BERTScore评估器（精度、层数默认取当前配置）"""
+        from .bertscore_scorer import BERTScoreScorer
+        return BERTScoreScorer(
+            lang=lang,
+            model_type=self.bertscore_models.get(lang),
+            idf_path=self._bertscore_idf_path(lang),
+            update_idf=self.update_bertscore_idf,
+            token_cache_dir=self.token_cache_dir,
+            precision=precision or self.bertscore_precision,
+            num_layers=num_layers if num_layers is not None else self.bertscore_num_layers
+        )
+    
+    def reconfigure(
+        self,
+        use_comet: Optional[bool] = None,
+        use_bleurt: Optional[bool] = None,
+        use_bertscore: Optional[bool] = None,
+        use_chrf: Optional[bool] = None,
+        comet_model: Optional[str] = None,
+        bertscore_precision: Optional[str] = None,
+        bertscore_num_layers: Optional[int] = None,
+        background: bool = False
+    ):
+        """
+        增量重新配置（只加载受影响的评估器，其他模型不受影响）
+        
+        关闭指标立即生效；开启指标、更换COMET模型或BERTScore精度/层数时，新评估器加载完成前
+        旧配置继续服务，加载成功后原子替换（加载失败则保持原配置）。
+        被替换的模型空闲时从模型注册表卸载；按语言路由的BERTScore评估器随之丢弃，下次用到时按新配置创建
+        
+        Args:
+            use_comet/use_bleurt/use_bertscore/use_chrf: 开启/关闭指标（None表示不变）
+            comet_model: 更换COMET模型（None表示不变）
+            bertscore_precision: 更换BERTScore推理精度（None表示不变）
+            bertscore_num_layers: 更换BERTScore使用的隐藏层（None表示不变）
+            background: 在后台线程中加载新评估器
+            
+        Returns:
+            background=True时返回加载线程，否则返回 {指标: 是否成功}
+        """
+        requested = {"comet": use_comet, "bleurt": use_bleurt, "bertscore": use_bertscore, "chrf": use_chrf}
+        if comet_model == self.comet_model_name:
+            comet_model = None
+        bertscore_profile = {}
+        if bertscore_precision is not None:
+            from .bertscore_scorer import PRECISIONS
+            if bertscore_precision not in PRECISIONS:
+                raise ValueError(f"不支持的精度: {bertscore_precision}（可选: {', '.join(PRECISIONS)}）")
+        if bertscore_precision is not None and bertscore_precision != self.bertscore_precision:
+            bertscore_profile["precision"] = bertscore_precision
+        if bertscore_num_layers is not None and bertscore_num_layers != self.bertscore_num_layers:
+            bertscore_profile["num_layers"] = bertscore_num_layers
+        
+        to_load = []
+        for metric, enable in requested.items():
+            flag, attr = self.RECONFIGURABLE_METRICS[metric]
+            enabled = getattr(self, flag) and getattr(self, attr) is not None
+            if enable is False and getattr(self, flag):
+                # 只关闭开关：进行中的请求仍持有旧评估器，模型交给注册表按需卸载
+                setattr(self, flag, False)
+                self._retire_scorer(getattr(self, attr))
+                print(f"⏹️  已关闭{metric}")
+            elif enable and not enabled:
+                to_load.append(metric)
+            elif metric == "comet" and comet_model and (enabled or enable):
+                to_load.append(metric)
+            elif metric == "bertscore" and bertscore_profile and (enabled or enable):
+                to_load.append(metric)
+        
+        if comet_model and "comet" not in to_load:
+            # COMET未启用：只记录模型名，下次开启时加载
+            self.comet_model_name = comet_model
+        if bertscore_profile and "bertscore" not in to_load:
+            self._apply_bertscore_profile(bertscore_profile)
+        if not to_load:
+            return None if background else {}
+        
+        def load():
+            results = {}
+            with self._reconfigure_lock:
+                for metric in to_load:
+                    results[metric] = self._swap_in(
+                        metric,
+                        comet_model if metric == "comet" else None,
+                        bertscore_profile if metric == "bertscore" else None
+                    )
+            return results
+        
+        if not background:
+            return load()
+        
+        self.reconfiguring.extend(to_load)
+        
+        def run():
+            try:
+                load()
+            finally:
+                for metric in to_load:
+                    self.reconfiguring.remove(metric)
+        
+        thread = threading.Thread(target=run, name="evaluator-reconfigure", daemon=True)
+        thread.start()
+        print(f"🔄 正在后台加载: {', '.join(to_load)}（当前配置继续服务）")
+        return thread
+    
+    def _swap_in(self, metric: str, comet_model: Optional[str] = None, bertscore_profile: Optional[Dict] = None) -> bool:
+        """加载新评估器并原子替换旧评估器"""
+        flag, attr = self.RECONFIGURABLE_METRICS[metric]
+        try:
+            scorer = self._create_scorer(metric, comet_model, bertscore_profile)
+            if not scorer.initialize():
+                print(f"⚠️  {metric}加载失败，保持原配置")
+                return False
+        except Exception as e:
+            print(f"⚠️  {metric}加载失败，保持原配置: {e}")
+            return False
+        
+        old = getattr(self, attr)
+        # 先替换评估器再打开开关，并发请求看到的总是完整可用的评估器
+        setattr(self, attr, scorer)
+        if comet_model:
+            self.comet_model_name = comet_model
+        if bertscore_profile:
+            self._apply_bertscore_profile(bertscore_profile)
+        setattr(self, flag, True)
+        if old is not None and old is not scorer:
+            self._retire_scorer(old, keep=getattr(scorer, "_registry_key", None))
+        print(f"✅ {metric}已切换" + (f": {comet_model}" if comet_model else ""))
+        return True
+    
+    def _apply_bertscore_profile(self, profile: Dict):
+        """记录新的BERTScore精度/层数，丢弃按旧配置创建的路由评估器"""
+        self.bertscore_precision = profile.get("precision", self.bertscore_precision)
+        self.bertscore_num_layers = profile.get("num_layers", self.bertscore_num_layers)
+        with self._routed_lock:
+            retired = [scorer for (metric, _), scorer in self._routed_scorers.items() if metric == "bertscore"]
+            self._routed_scorers = {
+                key: scorer for key, scorer in self._routed_scorers.items() if key[0] != "bertscore"
+            }
+        for scorer in retired:
+            self._retire_scorer(scorer)
+    
+    @staticmethod
+    def _retire_scorer(scorer, keep=None):
+        """从模型注册表卸载不再使用的评估器模型（正在推理或与新评估器共用时保留）"""
+        key = getattr(scorer, "_registry_key", None)
+        if key is None or key == keep:
+            return
+        from .model_registry import get_registry
+        get_registry().unload(key)
+    
+    @staticmethod
+    def parse_lang_pair(lang_pair) -> Tuple[Optional[str], Optional[str]]:
+        """
+        解析语言对："en-zh"、"en_zh"、("en", "zh")，只有目标语言时可写作 "-zh" 或 "zh"
+        
+        Returns:
+            (源语言, 目标语言)，未指定的部分为None
+        
+        Raises:
+            ValueError: 格式不正确
+        """
+        if lang_pair is None:
+            return None, None
+        if isinstance(lang_pair, str):
+            parts = lang_pair.replace("_", "-").split("-")
+            if len(parts) == 1:
+                parts = [None] + parts
+        else:
+            parts = list(lang_pair)
+        if len(parts) != 2:
+            raise ValueError(f"无效的语言对: {lang_pair!r}（格式如 \"en-zh\"）")
+        source_lang, target_lang = [str(part).strip().lower() if part else "" for part in parts]
+        return source_lang or None, target_lang or None
+    
+    def _route(self, metric: str, lang_pair) -> Optional[str]:
+        """样本在该指标上的路由键（None表示使用默认评估器）"""
+        source_lang, target_lang = self.parse_lang_pair(lang_pair)
+        if metric == "bertscore":
+            return target_lang if target_lang and target_lang != self.bertscore_lang else None
+        if metric == "comet":
+            pair = f"{source_lang}-{target_lang}"
+            return pair if pair in self.comet_models else None
+        return None
+    
+    def _routed_scorer(self, metric: str, route: Optional[str]):
+        """路由键对应的评估器（未初始化时首次打分才加载模型）"""
+        if route is None:
+            return self.bertscore_scorer if metric == "bertscore" else self.comet_scorer
+        key = (metric, route)
+        with self._routed_lock:
+            scorer = self._routed_scorers.get(key)
+            if scorer is None:
+                if metric == "bertscore":
+                    scorer = self._create_bertscore(route)
+                else:
+                    from .comet_scorer import COMETScorer
+                    scorer = COMETScorer(self.comet_models[route], token_cache_dir=self.token_cache_dir)
+                self._routed_scorers[key] = scorer
+                print(f"🌐 {metric}按语言路由: {route}")
+        return scorer
+    
+    @classmethod
+    def parse_metrics(cls, metrics: Optional[Union[str, List[str]]]) -> Optional[List[str]]:
+        """
+        解析指标子集（列表或逗号分隔的字符串，None表示所有已启用的指标）
+        
+        Raises:
+            ValueError: 包含不支持的指标
+        """
+        if metrics is None:
+            return None
+        if isinstance(metrics, str):
+            metrics = metrics.split(",")
+        names = []
+        for name in metrics:
+            name = str(name).strip().lower()
+            if name == "bertscore_f1":
+                name = "bertscore"
+            if not name:
+                continue
+            if name not in cls.METRICS:
+                raise ValueError(f"不支持的指标: {name}（可选: {', '.join(cls.METRICS)}）")
+            if name not in names:
+                names.append(name)
+        return names
+    
+    def _select_metrics(self, metrics: Optional[Union[str, List[str]]]) -> List[str]:
+        """
+        本次请求要计算的指标：请求的子集与已启用指标的交集。
+        显式请求的神经网络指标已启用但尚未加载时，此时才加载（未请求的模型不会被初始化）
+        """
+        requested = self.parse_metrics(metrics)
+        if requested is None:
+            return [metric for metric in self.METRICS if self._metric_available(metric)]
+        
+        for metric in requested:
+            if metric in self.RECONFIGURABLE_METRICS:
+                flag, attr = self.RECONFIGURABLE_METRICS[metric]
+                if getattr(self, flag) and getattr(self, attr) is None:
+                    with self._reconfigure_lock:
+                        if getattr(self, attr) is None and not self._swap_in(metric):
+                            setattr(self, flag, False)
+        return [metric for metric in requested if self._metric_available(metric)]
+    
     def score(
         self,
         source: str,
         translation: str,
-        reference: Optional[str] = None,
-        mqm_score: Optional[Dict] = None
+        reference: Optional[Union[str, List[str]]] = None,
+        mqm_score: Optional[Dict] = None,
+        metrics: Optional[Union[str, List[str]]] = None,
+        lang_pair: Optional[Union[str, Tuple[str, str]]] = None
     ) -> ComprehensiveScore:
         """
         综合评分
@@ -193,93 +517,111 @@ class CombinedQualityScorer:
         Args:
             source: 源文本
             translation: 翻译文本
-            reference: 参考翻译（可选）
+            reference: 参考翻译（可选，可以是多个参考的列表）
             mqm_score: MQM评分（来自Checker）
+            metrics: 只计算这些指标（如 ["bleu", "chrf"]，None表示所有已启用的指标），
+                综合评分只基于这些指标
+            lang_pair: 语言对（如 "en-zh"），BERTScore按目标语言、COMET按comet_models选择模型
             
         Returns:
             ComprehensiveScore: 综合评分
         """
-        result = ComprehensiveScore()
+        selected = self._select_metrics(metrics)
+        result = ComprehensiveScore(metrics=selected)
+        # 未指定子集时保留原有的逐指标诊断输出
+        checked = selected if metrics is not None else self.METRICS
+        
+        # 多参考时保留列表，单参考保持字符串
+        references = as_reference_list(reference)
+        if not references:
+            reference = None
+        elif len(references) == 1:
+            reference = references[0]
+        else:
+            reference = references
         
         # 1. 传统指标：BLEU
-        if reference:
+        if reference and "bleu" in selected:
             result.bleu = self._calculate_bleu(translation, reference)
         
         # 2. COMET评分
-        print(f"\n🔍 [DEBUG] COMET计算检查:")
-        print(f"   use_comet: {self.use_comet}")
-        print(f"   comet_scorer存在: {self.comet_scorer is not None}")
-        print(f"   source存在: {source is not None}")
-        print(f"   source不为空: {source and source.strip() if source else False}")
-        
-        if self.use_comet and self.comet_scorer:
-            if source and source.strip():  # COMET需要source
-                try:
-                    print(f"   ✅ 开始计算COMET分数...")
-                    print(f"   source: {source[:50]}..." if len(source) > 50 else f"   source: {source}")
-                    print(f"   translation: {translation[:50]}..." if len(translation) > 50 else f"   translation: {translation}")
-                    comet_score = self.comet_scorer.score_single(source, translation, reference)
-                    print(f"   ✅ COMET计算完成: {comet_score:.4f}")
-                    result.comet = comet_score
-                except Exception as e:
-                    print(f"   ❌ COMET计算出错: {e}")
-                    import traceback
-                    traceback.print_exc()
+        if "comet" in checked:
+            print(f"\n🔍 [DEBUG] COMET计算检查:")
+            print(f"   use_comet: {self.use_comet}")
+            print(f"   comet_scorer存在: {self.comet_scorer is not None}")
+            print(f"   source存在: {source is not None}")
+            print(f"   source不为空: {source and source.strip() if source else False}")
+        
+            if self.use_comet and self.comet_scorer:
+                if source and source.strip():  # COMET需要source
+                    try:
+                        print(f"   ✅ 开始计算COMET分数...")
+                        print(f"   source: {source[:50]}..." if len(source) > 50 else f"   source: {source}")
+                        print(f"   translation: {translation[:50]}..." if len(translation) > 50 else f"   translation: {translation}")
+                        comet_score = self._comet_score_single(source, translation, reference, lang_pair)
+                        print(f"   ✅ COMET计算完成: {comet_score:.4f}")
+                        result.comet = comet_score
+                    except Exception as e:
+                        print(f"   ❌ COMET计算出错: {e}")
+                        import traceback
+                        traceback.print_exc()
+                        result.comet = 0.0
+                else:
                     result.comet = 0.0
+                    print(f"   ⚠️  COMET需要source，但source为空，跳过COMET计算")
+                    print(f"   source值: {repr(source)}")
             else:
                 result.comet = 0.0
-                print(f"   ⚠️  COMET需要source，但source为空，跳过COMET计算")
-                print(f"   source值: {repr(source)}")
-        else:
-            result.comet = 0.0
-            if not self.use_comet:
-                print(f"   ⚠️  COMET未启用 (use_comet=False)")
-            if not self.comet_scorer:
-                print(f"   ⚠️  COMET评估器不存在 (comet_scorer=None)")
+                if not self.use_comet:
+                    print(f"   ⚠️  COMET未启用 (use_comet=False)")
+                if not self.comet_scorer:
+                    print(f"   ⚠️  COMET评估器不存在 (comet_scorer=None)")
         
         # 3. BLEURT评分
-        print(f"\n🔍 [DEBUG] BLEURT计算检查:")
-        print(f"   use_bleurt: {self.use_bleurt}")
-        print(f"   bleurt_scorer存在: {self.bleurt_scorer is not None}")
-        print(f"   reference存在: {reference is not None}")
-        print(f"   reference不为空: {reference and reference.strip() if reference else False}")
-        
-        if self.use_bleurt and self.bleurt_scorer:
-            if reference and reference.strip():  # 确保reference不为空且不是空白字符串
-                try:
-                    print(f"   ✅ 开始计算BLEURT分数...")
-                    print(f"   translation: {translation[:50]}..." if len(translation) > 50 else f"   translation: {translation}")
-                    print(f"   reference: {reference[:50]}..." if len(reference) > 50 else f"   reference: {reference}")
-                    bleurt_score = self.bleurt_scorer.score_single(translation, reference)
-                    print(f"   ✅ BLEURT计算完成: {bleurt_score:.4f}")
-                    result.bleurt = bleurt_score
-                except Exception as e:
-                    print(f"   ❌ BLEURT计算出错: {e}")
-                    import traceback
-                    traceback.print_exc()
+        if "bleurt" in checked:
+            print(f"\n🔍 [DEBUG] BLEURT计算检查:")
+            print(f"   use_bleurt: {self.use_bleurt}")
+            print(f"   bleurt_scorer存在: {self.bleurt_scorer is not None}")
+            print(f"   reference存在: {reference is not None}")
+            print(f"   reference不为空: {has_reference(reference)}")
+        
+            if self.use_bleurt and self.bleurt_scorer:
+                if has_reference(reference):  # 确保reference不为空且不是空白字符串
+                    try:
+                        print(f"   ✅ 开始计算BLEURT分数...")
+                        print(f"   translation: {translation[:50]}..." if len(translation) > 50 else f"   translation: {translation}")
+                        print(f"   reference: {str(reference)[:50]}..." if len(str(reference)) > 50 else f"   reference: {reference}")
+                        bleurt_score = self._bleurt_score_single(translation, reference)
+                        print(f"   ✅ BLEURT计算完成: {bleurt_score:.4f}")
+                        result.bleurt = bleurt_score
+                    except Exception as e:
+                        print(f"   ❌ BLEURT计算出错: {e}")
+                        import traceback
+                        traceback.print_exc()
+                        result.bleurt = 0.0
+                else:
+                    # reference为空，BLEURT需要reference，所以设为0
                     result.bleurt = 0.0
+                    print(f"   ⚠️  BLEURT需要reference，但reference为空，跳过BLEURT计算")
+                    print(f"   reference值: {repr(reference)}")
             else:
-                # reference为空，BLEURT需要reference，所以设为0
                 result.bleurt = 0.0
-                print(f"   ⚠️  BLEURT需要reference，但reference为空，跳过BLEURT计算")
-                print(f"   reference值: {repr(reference)}")
-        else:
-            result.bleurt = 0.0
-            if not self.use_bleurt:
-                print(f"   ⚠️  BLEURT未启用 (use_bleurt=False)")
-            if not self.bleurt_scorer:
-                print(f"   ⚠️  BLEURT评估器不存在 (bleurt_scorer=None)")
+                if not self.use_bleurt:
+                    print(f"   ⚠️  BLEURT未启用 (use_bleurt=False)")
+                if not self.bleurt_scorer:
+                    print(f"   ⚠️  BLEURT评估器不存在 (bleurt_scorer=None)")
         
         # 4. BERTScore评分
-        if self.use_bertscore and self.bertscore_scorer and reference:
-            result.bertscore_f1 = self.bertscore_scorer.score_single(translation, reference)
+        if "bertscore" in selected and reference:
+            scorer = self._routed_scorer("bertscore", self._route("bertscore", lang_pair))
+            result.bertscore_f1 = scorer.score_single(translation, reference)
         
         # 5. ChrF评分
-        if self.use_chrf and self.chrf_scorer and reference:
+        if "chrf" in selected and reference:
             result.chrf = self.chrf_scorer.score_single(translation, reference)
         
         # 6. MQM评分
-        if mqm_score:
+        if mqm_score and "mqm" in selected:
             result.mqm_adequacy = mqm_score.get('adequacy', 0.0)
             result.mqm_fluency = mqm_score.get('fluency', 0.0)
             result.mqm_terminology = mqm_score.get('terminology', 0.0)
@@ -290,26 +632,237 @@ class CombinedQualityScorer:
         
         return result
     
-    def _calculate_bleu(self, candidate: str, reference: str) -> float:
-        """计算BLEU分数（字符级）"""
+    def model_versions(self) -> Dict:
+        """
+        当前启用的指标及模型版本（用于校验检查点、缓存等持久化结果）
+        """
+        versions = {"multi_ref_aggregation": self.multi_ref_aggregation}
+        
+        if self._metric_available("bleu"):
+            versions["bleu"] = "char"
+        if self._metric_available("comet"):
+            versions["comet"] = self.comet_scorer.model_name
+        if self._metric_available("bleurt"):
+            versions["bleurt"] = self.bleurt_scorer.checkpoint
+        if self._metric_available("bertscore"):
+            versions["bertscore"] = f"{self.bertscore_scorer.lang}:{self.bertscore_scorer.model_type}"
+            if self.bertscore_scorer.idf_table is not None:
+                versions["bertscore"] += f":idf={self.bertscore_scorer.idf_table.path}"
+            if self.bertscore_scorer.precision != "fp32":
+                versions["bertscore"] += f":precision={self.bertscore_scorer.precision}"
+            if self.bertscore_scorer.num_layers is not None:
+                versions["bertscore"] += f":layers={self.bertscore_scorer.num_layers}"
+        if self._metric_available("chrf"):
+            versions["chrf"] = f"n={self.chrf_scorer.n},beta={self.chrf_scorer.beta}"
+        if self.bertscore_models:
+            versions["bertscore_models"] = dict(sorted(self.bertscore_models.items()))
+        if isinstance(self.bertscore_idf, dict):
+            versions["bertscore_idf"] = dict(sorted(self.bertscore_idf.items()))
+        if self.comet_models:
+            versions["comet_models"] = dict(sorted(self.comet_models.items()))
+        
+        # 依赖库版本
+        for package in ("comet", "bert_score", "bleurt", "sacrebleu"):
+            try:
+                module = __import__(package)
+                versions[f"{package}_version"] = getattr(module, "__version__", "unknown")
+            except Exception:
+                pass
+        
+        return versions
+    
+    def _metric_available(self, metric: str) -> bool:
+        """指标是否已启用且评估器可用"""
+        if metric == "bleu":
+            return getattr(self, "use_bleu", True)
+        if metric == "comet":
+            return self.use_comet and self.comet_scorer is not None
+        if metric == "bleurt":
+            return self.use_bleurt and self.bleurt_scorer is not None
+        if metric == "bertscore":
+            return self.use_bertscore and self.bertscore_scorer is not None
+        if metric == "chrf":
+            return self.use_chrf and self.chrf_scorer is not None
+        if metric == "mqm":
+            return getattr(self, "use_mqm", True)
+        return False
+    
+    def _metric_scores(
+        self,
+        metric: str,
+        sources: List[str],
+        translations: List[str],
+        references: Optional[List[Union[str, List[str]]]] = None,
+        lang_pairs: Optional[List] = None,
+        raise_errors: bool = False
+    ) -> List[float]:
+        """
+        批量计算单个指标的逐句分数（每个评估器只调用一次）
+        
+        指定语言对时，COMET/BERTScore按路由（目标语言、语言对）分组，每组对各自的模型批量推理一次
+        
+        Args:
+            metric: 指标名称（bleu, chrf, comet, bleurt, bertscore）
+            sources: 源文本列表
+            translations: 翻译文本列表
+            references: 参考翻译列表（可选，每项可以是字符串或多个参考的列表）
+            lang_pairs: 每个样本的语言对（可选，如 "en-zh"）
+            raise_errors: 评分出错时抛出RuntimeError（默认记录日志并把出错的样本记为0.0）
+            
+        Returns:
+            List[float]: 逐句分数，不满足计算条件（如缺少reference/source）或出错时为0.0
+        """
+        n = len(translations)
+        scores = [0.0] * n
+        if not self._metric_available(metric):
+            return scores
+        
+        references = references or [None] * n
+        
+        # COMET需要source，其余指标需要reference
+        if metric == "comet":
+            indices = [i for i in range(n) if sources[i] and sources[i].strip()]
+        else:
+            indices = [i for i in range(n) if has_reference(references[i])]
+        if not indices:
+            return scores
+        
+        # 按路由分组（未指定语言对时整个批次一组）
+        groups: Dict[Optional[str], List[int]] = {}
+        for i in indices:
+            route = self._route(metric, lang_pairs[i]) if lang_pairs and metric in ("comet", "bertscore") else None
+            groups.setdefault(route, []).append(i)
+        if len(groups) > 1:
+            print(f"🌐 {metric}按语言分组: " + ", ".join(
+                f"{route or '默认'}={len(group)}" for route, group in groups.items()
+            ))
+        
+        for route, group in groups.items():
+            try:
+                values = self._group_scores(
+                    metric,
+                    self._routed_scorer(metric, route) if metric in ("comet", "bertscore") else None,
+                    [sources[i] for i in group],
+                    [translations[i] for i in group],
+                    [references[i] for i in group]
+                )
+            except Exception as e:
+                print(f"   ❌ {metric}批量计算出错: {e}")
+                if raise_errors:
+                    raise RuntimeError(f"{metric}批量计算出错: {e}") from e
+                values = []
+            
+            for i, value in zip(group, values):
+                scores[i] = float(value)
+        
+        return scores
+    
+    def _group_scores(
+        self,
+        metric: str,
+        scorer,
+        sources: List[str],
+        translations: List[str],
+        references: List[Union[str, List[str]]]
+    ) -> List[float]:
+        """对一组样本批量推理（scorer为路由到的COMET/BERTScore评估器）"""
+        if metric == "bleu":
+            return [self._calculate_bleu(t, r) for t, r in zip(translations, references)]
+        if metric == "chrf":
+            return self.chrf_scorer.score(translations, references).get("scores", [])
+        if metric == "comet":
+            # 有参考与无参考的样本分开推理；必须有参考的模型跳过无参考的样本（保持0.0）
+            values = [0.0] * len(translations)
+            with_ref = [i for i, ref in enumerate(references) if has_reference(ref)]
+            without_ref = [i for i, ref in enumerate(references) if not has_reference(ref)]
+            subsets = [(with_ref, True)]
+            if without_ref and scorer.requires_reference:
+                print(f"   ⚠️  {scorer.model_name}需要reference，跳过{len(without_ref)}个无参考样本")
+            elif without_ref:
+                subsets.append((without_ref, False))
+            
+            for subset, use_refs in subsets:
+                if not subset:
+                    continue
+                result = self._checked(scorer.score(
+                    [sources[i] for i in subset],
+                    [translations[i] for i in subset],
+                    [references[i] for i in subset] if use_refs else None,
+                    aggregation=self.multi_ref_aggregation
+                ))
+                for i, value in zip(subset, result.get("scores", [])):
+                    values[i] = value
+            return values
+        if metric == "bleurt":
+            return self._checked(self.bleurt_scorer.score(
+                translations, references, aggregation=self.multi_ref_aggregation
+            )).get("scores", [])
+        if metric == "bertscore":
+            return self._checked(scorer.score(translations, references)).get("F1", [])
+        return []
+    
+    @staticmethod
+    def _checked(result: Dict) -> Dict:
+        """评分器以返回值中的error报告失败，转换为异常"""
+        if result.get("error"):
+            raise RuntimeError(result["error"])
+        return result
+    
+    def _comet_score_single(
+        self,
+        source: str,
+        translation: str,
+        reference: Optional[Union[str, List[str]]],
+        lang_pair=None
+    ) -> float:
+        """计算单个样本的COMET分数（多参考按multi_ref_aggregation聚合，按语言对选择模型）"""
+        scorer = self._routed_scorer("comet", self._route("comet", lang_pair))
+        if isinstance(reference, list):
+            result = scorer.score(
+                [source], [translation], [reference], aggregation=self.multi_ref_aggregation
+            )
+            scores = result.get("scores", [])
+            return scores[0] if scores and not result.get("error") else 0.0
+        return scorer.score_single(source, translation, reference)
+    
+    def _bleurt_score_single(self, translation: str, reference: Union[str, List[str]]) -> float:
+        """计算单个样本的BLEURT分数（多参考按multi_ref_aggregation聚合）"""
+        if isinstance(reference, list):
+            scores = self.bleurt_scorer.score(
+                [translation], [reference], aggregation=self.multi_ref_aggregation
+            ).get("scores", [])
+            return scores[0] if scores else 0.0
+        return self.bleurt_scorer.score_single(translation, reference)
+    
+    def _calculate_bleu(self, candidate: str, reference: Union[str, List[str]]) -> float:
+        """计算BLEU分数（字符级，支持多参考）"""
+        references = as_reference_list(reference)
+        if not references:
+            return 0.0
+        
         try:
             from nltk.translate.bleu_score import sentence_bleu
             
-            ref_tokens = list(reference)
+            ref_tokens = [list(ref) for ref in references]
             cand_tokens = list(candidate)
             
-            return sentence_bleu([ref_tokens], cand_tokens)
+            return sentence_bleu(ref_tokens, cand_tokens)
         except:
-            # 简化版：字符匹配率
-            ref_chars = set(reference)
-            cand_chars = set(candidate)
-            if not cand_chars:
-                return 0.0
-            precision = len(ref_chars & cand_chars) / len(cand_chars)
-            recall = len(ref_chars & cand_chars) / len(ref_chars) if ref_chars else 0.0
-            if precision + recall == 0:
-                return 0.0
-            return 2 * (precision * recall) / (precision + recall)
+            # 简化版：字符匹配率（多参考取最大值）
+            return max(self._char_overlap_f1(candidate, ref) for ref in references)
+    
+    @staticmethod
+    def _char_overlap_f1(candidate: str, reference: str) -> float:
+        """字符集合重叠F1（BLEU不可用时的简化版）"""
+        ref_chars = set(reference)
+        cand_chars = set(candidate)
+        if not cand_chars:
+            return 0.0
+        precision = len(ref_chars & cand_chars) / len(cand_chars)
+        recall = len(ref_chars & cand_chars) / len(ref_chars) if ref_chars else 0.0
+        if precision + recall == 0:
+            return 0.0
+        return 2 * (precision * recall) / (precision + recall)
     
     def _calculate_final_score(self, result: ComprehensiveScore) -> float:
         """
@@ -390,29 +943,107 @@ class CombinedQualityScorer:
         
         return final
     
+    @staticmethod
+    def _deduplicate(
+        sources: List[str],
+        translations: List[str],
+        references: List[Union[str, List[str], None]],
+        lang_pairs: Optional[List] = None
+    ) -> Tuple[List[int], List[int]]:
+        """
+        批内去重（指定语言对时语言对也需相同）
+        
+        Returns:
+            (unique_index, positions): 每个唯一样本在原批次中首次出现的位置，
+            以及原批次每个样本对应的唯一样本序号
+        """
+        seen: Dict[Tuple, int] = {}
+        unique_index, positions = [], []
+        for i, (source, translation, reference) in enumerate(zip(sources, translations, references)):
+            ref_key = tuple(reference) if isinstance(reference, (list, tuple)) else reference
+            key = (source, translation, ref_key)
+            if lang_pairs:
+                key += (CombinedQualityScorer.parse_lang_pair(lang_pairs[i]),)
+            position = seen.get(key)
+            if position is None:
+                position = seen[key] = len(unique_index)
+                unique_index.append(i)
+            positions.append(position)
+        return unique_index, positions
+    
     def batch_score(
         self,
         sources: List[str],
         translations: List[str],
-        references: Optional[List[str]] = None,
-        mqm_scores: Optional[List[Dict]] = None
+        references: Optional[List[Union[str, List[str]]]] = None,
+        mqm_scores: Optional[List[Dict]] = None,
+        metrics: Optional[Union[str, List[str]]] = None,
+        lang_pairs: Optional[List] = None
     ) -> List[ComprehensiveScore]:
         """
         批量评分
         
+        每个指标对整个批次只调用一次评估器（批量推理），再按样本组装结果；
+        混合语言的批次按目标语言/语言对分组，每组对各自的模型批量推理
+        
+        Args:
+            sources: 源文本列表
+            translations: 翻译文本列表
+            references: 参考翻译列表（可选，每项可以是字符串或多个参考的列表）
+            mqm_scores: MQM评分列表（可选）
+            metrics: 只计算这些指标（None表示所有已启用的指标），综合评分只基于这些指标
+            lang_pairs: 每个样本的语言对（可选，如 ["en-zh", "zh-en", ...]，None项使用默认模型）
+        
         Returns:
             List[ComprehensiveScore]: 每个样本的综合评分
         """
-        results = []
+        selected = self._select_metrics(metrics)
+        n = len(translations)
+        sources = [sources[i] if sources and i < len(sources) else "" for i in range(n)]
+        references = [references[i] if references and i < len(references) else None for i in range(n)]
+        if lang_pairs:
+            lang_pairs = [lang_pairs[i] if i < len(lang_pairs) else None for i in range(n)]
+        
+        # 完全相同的 (源文本, 翻译, 参考) 只评估一次，结果再按原位置分发
+        unique_index, positions = self._deduplicate(sources, translations, references, lang_pairs)
+        if len(unique_index) < n:
+            print(f"🔁 批内去重: {n} 个样本 → {len(unique_index)} 个唯一样本")
+        unique_sources = [sources[i] for i in unique_index]
+        unique_translations = [translations[i] for i in unique_index]
+        unique_references = [references[i] for i in unique_index]
+        unique_lang_pairs = [lang_pairs[i] for i in unique_index] if lang_pairs else None
+        
+        unique_scores = {
+            metric: (
+                self._metric_scores(metric, unique_sources, unique_translations, unique_references, unique_lang_pairs)
+                if metric in selected else [0.0] * len(unique_index)
+            )
+            for metric in ("bleu", "comet", "bleurt", "bertscore", "chrf")
+        }
+        metric_scores = {
+            metric: [scores[position] for position in positions]
+            for metric, scores in unique_scores.items()
+        }
         
-        for i in range(len(translations)):
-            source = sources[i]
-            translation = translations[i]
-            reference = references[i] if references and i < len(references) else None
+        results = []
+        for i in range(n):
+            result = ComprehensiveScore(
+                bleu=metric_scores["bleu"][i],
+                chrf=metric_scores["chrf"][i],
+                comet=metric_scores["comet"][i],
+                bleurt=metric_scores["bleurt"][i],
+                bertscore_f1=metric_scores["bertscore"][i],
+                metrics=list(selected)
+            )
+            
             mqm = mqm_scores[i] if mqm_scores and i < len(mqm_scores) else None
+            if mqm and "mqm" in selected:
+                result.mqm_adequacy = mqm.get('adequacy', 0.0)
+                result.mqm_fluency = mqm.get('fluency', 0.0)
+                result.mqm_terminology = mqm.get('terminology', 0.0)
+                result.mqm_overall = mqm.get('overall', 0.0)
             
-            score = self.score(source, translation, reference, mqm)
-            results.append(score)
+            result.final_score = self._calculate_final_score(result)
+            results.append(result)
         
         return results
-
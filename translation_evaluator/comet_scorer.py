@@ -3,15 +3,31 @@ COMET (Crosslingual Optimized Metric for Evaluation of Translation)
 基于神经网络的翻译质量评估模型
 """
 
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 import warnings
 warnings.filterwarnings('ignore')
 
+from .references import is_multi_reference, flatten_references, aggregate_by_segment
+from .model_registry import get_registry
+from .thread_budget import get_thread_budget
+from .token_store import comet_prepare_sample, flush_all, get_token_store, resolve_cache_dir
+
 
 class COMETScorer:
     """COMET质量评估模型"""
     
-    def __init__(self, model_name: str = "Unbabel/wmt22-comet-da"):
+    # 线程预算中的指标名（见thread_budget）
+    budget_metric = "comet"
+    
+    def __init__(
+        self,
+        model_name: str = "Unbabel/wmt22-comet-da",
+        use_embedding_cache: bool = True,
+        embedding_cache_dir: Optional[str] = None,
+        embedding_cache_size: int = 50000,
+        batch_size: int = 8,
+        token_cache_dir: Optional[str] = None
+    ):
         """
         初始化COMET模型
         
@@ -20,10 +36,57 @@ class COMETScorer:
                 - "Unbabel/wmt22-comet-da" (推荐，有参考翻译)
                 - "Unbabel/wmt22-cometkiwi-da" (无参考翻译)
                 - "Unbabel/XCOMET-XL" (最新，最强)
+            use_embedding_cache: 是否缓存src/ref句向量（仅对wmt22-comet-da这类
+                分别编码src/mt/ref的回归模型生效）
+            embedding_cache_dir: 句向量磁盘缓存目录（None表示仅内存缓存）
+            embedding_cache_size: 内存LRU缓存条目数
+            batch_size: 推理批大小
+            token_cache_dir: 分词缓存目录（子词id序列持久化，重复的文本跳过分词；
+                None时读取环境变量TRANSLATION_EVALUATOR_TOKEN_CACHE，都没有则不启用）
         """
         self.model_name = model_name
-        self.model = None
         self._initialized = False
+        self.batch_size = batch_size
+        
+        self.use_embedding_cache = use_embedding_cache
+        self.embedding_cache_dir = embedding_cache_dir
+        self.embedding_cache_size = embedding_cache_size
+        self.embedding_cache = None
+        self.token_cache_dir = token_cache_dir
+    
+    @property
+    def _registry_key(self):
+        return ("comet", self.model_name)
+    
+    @property
+    def requires_reference(self) -> bool:
+        """模型是否必须提供参考翻译（CometKiwi是纯QE模型，XCOMET也支持无参考模式）"""
+        name = self.model_name.lower()
+        return "kiwi" not in name and "xcomet" not in name
+    
+    @property
+    def model(self):
+        """已加载的模型（由进程级注册表持有，同名模型在所有评估器间共享）"""
+        return get_registry().peek(self._registry_key)
+    
+    def _load_model(self):
+        from comet import download_model, load_from_checkpoint
+        
+        print(f"正在下载COMET模型: {self.model_name}...")
+        model_path = download_model(self.model_name)
+        
+        print(f"正在加载模型...")
+        model = load_from_checkpoint(model_path)
+        
+        # 模型由注册表共享，分词缓存在加载时安装一次（所有使用该模型的评估器共用）
+        cache_dir = resolve_cache_dir(self.token_cache_dir)
+        encoder = getattr(model, "encoder", None)
+        if cache_dir and encoder is not None and hasattr(encoder, "tokenizer"):
+            max_length = getattr(encoder, "max_positions", encoder.tokenizer.model_max_length + 2) - 2
+            store = get_token_store(f"comet:{encoder.tokenizer.name_or_path}:{max_length}", cache_dir)
+            encoder.prepare_sample = comet_prepare_sample(encoder, store, encoder.prepare_sample, max_length)
+            print(f"✓ COMET分词缓存: {cache_dir}")
+        return model
     
     def initialize(self):
         """延迟初始化模型（避免启动时加载）"""
@@ -31,13 +94,14 @@ class COMETScorer:
             return True
         
         try:
-            from comet import download_model, load_from_checkpoint
-            
-            print(f"正在下载COMET模型: {self.model_name}...")
-            model_path = download_model(self.model_name)
-            
-            print(f"正在加载模型...")
-            self.model = load_from_checkpoint(model_path)
+            with get_registry().use(self._registry_key, self._load_model):
+                if self.use_embedding_cache and self._supports_embedding_cache():
+                    from .embedding_cache import EmbeddingCache
+                    self.embedding_cache = EmbeddingCache(
+                        self.model_name,
+                        cache_dir=self.embedding_cache_dir,
+                        max_memory_items=self.embedding_cache_size
+                    )
             
             self._initialized = True
             print(f"✓ COMET模型加载成功")
@@ -54,7 +118,8 @@ class COMETScorer:
         self,
         sources: List[str],
         translations: List[str],
-        references: Optional[List[str]] = None
+        references: Optional[List[Union[str, List[str]]]] = None,
+        aggregation: str = "max"
     ) -> Dict:
         """
         计算COMET分数
@@ -62,7 +127,8 @@ class COMETScorer:
         Args:
             sources: 源文本列表
             translations: 翻译文本列表
-            references: 参考翻译列表（可选，但推荐提供）
+            references: 参考翻译列表（可选，但推荐提供；每项可以是字符串或多个参考的列表）
+            aggregation: 多参考分数的聚合方式（"max" 或 "mean"）
             
         Returns:
             Dict: 包含scores和system_score的字典
@@ -71,6 +137,54 @@ class COMETScorer:
             if not self.initialize():
                 return {"scores": [], "system_score": 0.0, "error": "Model not initialized"}
         
+        # 推理期间固定模型（超出内存预算被卸载后会在此重新加载）
+        try:
+            with get_registry().use(self._registry_key, self._load_model), \
+                    get_thread_budget().limit(self.budget_metric):
+                return self._score(sources, translations, references, aggregation)
+        except Exception as e:
+            return {"scores": [], "system_score": 0.0, "error": str(e)}
+        finally:
+            flush_all()
+    
+    def _score(
+        self,
+        sources: List[str],
+        translations: List[str],
+        references: Optional[List[Union[str, List[str]]]],
+        aggregation: str
+    ) -> Dict:
+        """在模型已固定时计算COMET分数"""
+        # 多参考：展开为(src, mt, ref)三元组一次推理，再按样本聚合
+        if is_multi_reference(references):
+            segment_ids, flat_translations, flat_references, flat_sources = flatten_references(
+                translations, references, sources
+            )
+            flat_result = self._score(flat_sources, flat_translations, flat_references, aggregation)
+            if flat_result.get("error"):
+                return flat_result
+            scores = aggregate_by_segment(segment_ids, flat_result["scores"], len(translations), aggregation)
+            flat_result.update({
+                "scores": scores,
+                "system_score": sum(scores) / len(scores) if scores else 0.0,
+                "aggregation": aggregation
+            })
+            return flat_result
+        
+        # 有参考翻译且模型支持时，走句向量缓存路径（只编码新的MT）
+        if self.embedding_cache is not None and references and len(references) == len(sources) \
+                and all(ref is not None for ref in references):
+            try:
+                scores = self._score_with_cache(sources, translations, references)
+                return {
+                    "scores": scores,
+                    "system_score": sum(scores) / len(scores) if scores else 0.0,
+                    "model": self.model_name,
+                    "cache": self.embedding_cache.stats()
+                }
+            except Exception as e:
+                print(f"⚠️  COMET缓存路径失败，回退到完整推理: {e}")
+        
         try:
             # 构建数据
             data = []
@@ -84,7 +198,7 @@ class COMETScorer:
                 data.append(item)
             
             # 预测
-            output = self.model.predict(data, batch_size=8, gpus=0)
+            output = self.model.predict(data, batch_size=self.batch_size, gpus=0)
             
             return {
                 "scores": output.scores,  # 每个样本的分数
@@ -95,14 +209,93 @@ class COMETScorer:
         except Exception as e:
             return {"scores": [], "system_score": 0.0, "error": str(e)}
     
+    def _supports_embedding_cache(self) -> bool:
+        """
+        是否支持句向量缓存
+        
+        只有RegressionMetric（如wmt22-comet-da）分别编码src/mt/ref后再组合，
+        XCOMET/CometKiwi等联合编码模型无法复用单句向量
+        """
+        return (
+            type(self.model).__name__ == "RegressionMetric"
+            and hasattr(self.model, "get_sentence_embedding")
+            and hasattr(self.model, "estimate")
+        )
+    
+    def _encode(self, texts: List[str]):
+        """分批编码文本，返回句向量张量"""
+        import torch
+        
+        embeddings = []
+        device = self.model.device
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            inputs = self.model.encoder.prepare_sample(batch)
+            embeddings.append(self.model.get_sentence_embedding(
+                inputs["input_ids"].to(device),
+                inputs["attention_mask"].to(device)
+            ))
+        return torch.cat(embeddings, dim=0)
+    
+    def _encode_cached(self, texts: List[str]):
+        """编码文本，优先从缓存读取（同一批次内的重复文本只编码一次）"""
+        import numpy as np
+        import torch
+        
+        unique_texts = list(dict.fromkeys(texts))
+        vectors = {}
+        missing = []
+        for text in unique_texts:
+            cached = self.embedding_cache.get(text)
+            if cached is None:
+                missing.append(text)
+            else:
+                vectors[text] = cached
+        
+        if missing:
+            encoded = self._encode(missing).float().cpu().numpy()
+            self.embedding_cache.put_many(missing, encoded)
+            vectors.update(zip(missing, encoded))
+            self.embedding_cache.flush()
+        
+        matrix = np.stack([vectors[text] for text in texts])
+        return torch.from_numpy(matrix).to(self.model.device)
+    
+    def _score_with_cache(
+        self,
+        sources: List[str],
+        translations: List[str],
+        references: List[str]
+    ) -> List[float]:
+        """使用缓存的src/ref句向量计算COMET分数"""
+        import torch
+        
+        self.model.eval()
+        with torch.no_grad():
+            src_emb = self._encode_cached(sources)
+            ref_emb = self._encode_cached(references)
+            
+            # MT不写入缓存，但同一批次内的重复MT（如多参考展开）只编码一次
+            unique_translations = list(dict.fromkeys(translations))
+            positions = {text: i for i, text in enumerate(unique_translations)}
+            mt_emb = self._encode(unique_translations)[[positions[text] for text in translations]]
+            
+            scores = []
+            for start in range(0, len(translations), self.batch_size):
+                end = start + self.batch_size
+                prediction = self.model.estimate(src_emb[start:end], mt_emb[start:end], ref_emb[start:end])
+                scores.extend(prediction.score.view(-1).tolist())
+        
+        return scores
+    
     def score_single(
         self,
         source: str,
         translation: str,
-        reference: Optional[str] = None
+        reference: Optional[Union[str, List[str]]] = None
     ) -> float:
         """
-        计算单个样本的COMET分数
+        计算单个样本的COMET分数（reference可以是多个参考的列表）
         
         Returns:
             float: COMET分数 (0-1)
@@ -119,8 +312,15 @@ class COMETScorer:
 class COMETKiwiScorer(COMETScorer):
     """COMET-Kiwi: 无参考翻译的QE模型"""
     
-    def __init__(self):
-        super().__init__(model_name="Unbabel/wmt22-cometkiwi-da")
+    budget_metric = "qe"
+    
+    def __init__(
+        self,
+        model_name: str = "Unbabel/wmt22-cometkiwi-da",
+        batch_size: int = 8,
+        token_cache_dir: Optional[str] = None
+    ):
+        super().__init__(model_name=model_name, batch_size=batch_size, token_cache_dir=token_cache_dir)
     
     def score(self, sources: List[str], translations: List[str], references: Optional[List[str]] = None):
         """无参考翻译评估"""
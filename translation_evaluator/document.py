@@ -0,0 +1,224 @@
+"""
+文档级评估
+将长文档按句子边界切分（中文/英文），以参考翻译（无参考时以源文本）为轴，
+用基于长度的动态规划（Gale-Church）对齐译文和源文本，
+再取两组对齐边界的公共粗化，得到 (源文本, 译文, 参考) 片段三元组
+"""
+
+from typing import List, Optional, Tuple, Dict
+import math
+import re
+
+
+# 英文中常见的不断句缩写
+_EN_ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e",
+    "fig", "no", "vol", "inc", "ltd", "co", "corp", "dept", "approx", "u.s", "a.m", "p.m"
+}
+
+_ZH_BOUNDARY = re.compile(r"([。！？!?；;…]+[”’」』）)\"']*)")
+_EN_BOUNDARY = re.compile(r"([.!?]+[\"')\]]*)\s+(?=[\"'(\[]?[A-Z0-9])")
+_CJK = re.compile(r"[一-鿿]")
+
+# Gale-Church 对齐参数：各类对齐的先验概率与长度差方差
+_BEAD_PRIORS = {(1, 1): 0.89, (1, 0): 0.0099, (0, 1): 0.0099, (2, 1): 0.089, (1, 2): 0.089, (2, 2): 0.011}
+_VARIANCE = 6.8
+
+
+def detect_language(text: str) -> str:
+    """根据汉字比例粗略判断中文/英文"""
+    letters = [ch for ch in text if not ch.isspace()]
+    if not letters:
+        return "en"
+    return "zh" if len(_CJK.findall(text)) / len(letters) > 0.3 else "en"
+
+
+def split_sentences(text: str, lang: Optional[str] = None) -> List[str]:
+    """
+    按句子边界切分文本（换行也视为边界）
+
+    Args:
+        text: 文本
+        lang: "zh" 或 "en"（None表示自动判断）
+    """
+    if lang is None:
+        lang = detect_language(text)
+
+    sentences = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if lang.startswith("zh"):
+            parts = _ZH_BOUNDARY.split(line)
+            # split保留了分隔符，将其接回前一句
+            pieces = ["".join(parts[i:i + 2]) for i in range(0, len(parts), 2)]
+        else:
+            pieces = []
+            start = 0
+            for match in _EN_BOUNDARY.finditer(line):
+                words = line[start:match.start(1)].split()
+                last_word = words[-1].lower().rstrip(".") if words else ""
+                if last_word in _EN_ABBREVIATIONS or (len(last_word) == 1 and last_word.isalpha()):
+                    continue
+                pieces.append(line[start:match.end(1)])
+                start = match.end()
+            pieces.append(line[start:])
+        sentences.extend(piece.strip() for piece in pieces if piece.strip())
+    return sentences
+
+
+def _bead_cost(length_a: int, length_b: int, ratio: float, prior: float) -> float:
+    """Gale-Church对齐代价：-log P(对齐类型) - log P(长度差)"""
+    if length_a == 0 or length_b == 0:
+        return -math.log(prior) + 2.0
+    mean = (length_a + length_b / ratio) / 2
+    delta = (length_b - length_a * ratio) / math.sqrt(_VARIANCE * mean * ratio)
+    # 双侧正态尾概率 2 * (1 - Phi(|delta|))
+    p = max(math.erfc(abs(delta) / math.sqrt(2)), 1e-12)
+    return -math.log(prior) - math.log(p)
+
+
+def align_sentences(
+    sentences_a: List[str],
+    sentences_b: List[str],
+    band: Optional[int] = None
+) -> List[Tuple[int, int]]:
+    """
+    基于长度的句子对齐（Gale-Church动态规划）
+
+    Args:
+        sentences_a: 句子列表a
+        sentences_b: 句子列表b
+        band: 只搜索（按句子数比例的）对角线附近的带宽（默认 max(20, 句子数的2%)），长文档保持近似线性的耗时；
+            两侧句子数相差悬殊时自动放宽到相邻两行对角线的间距以上
+
+    Returns:
+        对齐后的切分点 [(i, j), ...]：a的前i句与b的前j句对齐，首项为(0, 0)，末项为(len(a), len(b))
+    """
+    n, m = len(sentences_a), len(sentences_b)
+    if n == 0 or m == 0:
+        return [(0, 0), (n, m)] if (n or m) else [(0, 0)]
+    if band is None:
+        band = max(20, int(0.02 * max(n, m)))
+    # 对角线每行移动 m/n 列，带宽小于该间距时终点不可达
+    band = max(band, math.ceil(max(n, m) / min(n, m)) + 2)
+    lengths_a = [len(s) for s in sentences_a]
+    lengths_b = [len(s) for s in sentences_b]
+    ratio = (sum(lengths_b) or 1) / (sum(lengths_a) or 1)
+
+    prefix_a = [0]
+    for length in lengths_a:
+        prefix_a.append(prefix_a[-1] + length)
+    prefix_b = [0]
+    for length in lengths_b:
+        prefix_b.append(prefix_b[-1] + length)
+
+    inf = float("inf")
+    cost = [[inf] * (m + 1) for _ in range(n + 1)]
+    back = [[None] * (m + 1) for _ in range(n + 1)]
+    cost[0][0] = 0.0
+    for i in range(n + 1):
+        center = i * m / n
+        for j in range(max(0, int(center) - band), min(m, int(center) + band + 1) + 1):
+            if cost[i][j] == inf:
+                continue
+            for (di, dj), prior in _BEAD_PRIORS.items():
+                ni, nj = i + di, j + dj
+                if ni > n or nj > m:
+                    continue
+                c = cost[i][j] + _bead_cost(
+                    prefix_a[ni] - prefix_a[i], prefix_b[nj] - prefix_b[j], ratio, prior
+                )
+                if c < cost[ni][nj]:
+                    cost[ni][nj] = c
+                    back[ni][nj] = (i, j)
+
+    if cost[n][m] == inf:
+        # 带宽内没有到达终点的路径：整体作为一个片段
+        return [(0, 0), (n, m)]
+
+    cuts = [(n, m)]
+    while cuts[-1] != (0, 0):
+        cuts.append(back[cuts[-1][0]][cuts[-1][1]])
+    return cuts[::-1]
+
+
+def _cut_map(cuts: List[Tuple[int, int]]) -> Dict[int, int]:
+    """轴句子切分点 → 另一侧切分点（同一轴切分点对应多个时取最大，即未对齐的句子并入前一片段）"""
+    mapping = {}
+    for other, pivot in cuts:
+        mapping[pivot] = max(other, mapping.get(pivot, 0))
+    mapping[0] = 0
+    return mapping
+
+
+def align_document(
+    source: str,
+    translation: str,
+    reference: Optional[str] = None,
+    src_lang: Optional[str] = None,
+    tgt_lang: Optional[str] = None
+) -> List[Tuple[str, str, str]]:
+    """
+    将文档切分并对齐为片段三元组
+
+    以参考翻译为轴（没有参考时以源文本为轴），分别对齐译文和源文本，
+    只保留两组对齐都认可的轴切分点（公共粗化），保证三者的片段一一对应
+
+    Args:
+        source: 源文档
+        translation: 译文文档
+        reference: 参考译文文档（可选）
+        src_lang: 源语言（zh/en，None表示自动判断）
+        tgt_lang: 目标语言（zh/en，None表示自动判断）
+
+    Returns:
+        [(源文本片段, 译文片段, 参考片段), ...]（没有参考时参考片段为空字符串）
+    """
+    hyp_sentences = split_sentences(translation, tgt_lang)
+    src_sentences = split_sentences(source, src_lang) if source else []
+    if reference:
+        pivot = split_sentences(reference, tgt_lang)
+    else:
+        pivot = src_sentences
+
+    if not pivot:
+        return [(source or "", translation, reference or "")]
+
+    # 对齐：句子列表 → {轴切分点: 该侧切分点}
+    sides = {"hyp": (hyp_sentences, _cut_map(align_sentences(hyp_sentences, pivot)))}
+    if reference and src_sentences:
+        sides["src"] = (src_sentences, _cut_map(align_sentences(src_sentences, pivot)))
+
+    common = sorted(set.intersection(*(set(mapping) for _, mapping in sides.values())))
+    joiner = {"hyp": "" if (tgt_lang or detect_language(translation)).startswith("zh") else " "}
+    joiner["src"] = "" if (src_lang or detect_language(source or "")).startswith("zh") else " "
+    pivot_joiner = joiner["hyp"] if reference else joiner["src"]
+
+    segments = []
+    for start, end in zip(common, common[1:]):
+        parts = {}
+        for name, (sentences, mapping) in sides.items():
+            parts[name] = joiner[name].join(sentences[mapping[start]:mapping[end]])
+        pivot_text = pivot_joiner.join(pivot[start:end])
+        if reference:
+            segments.append((parts.get("src", ""), parts["hyp"], pivot_text))
+        else:
+            segments.append((pivot_text, parts["hyp"], ""))
+
+    return segments
+
+
+def estimate_tokens(text: str, tokenizer=None) -> int:
+    """
+    估计子词数（有tokenizer时精确计算；否则汉字按1个、英文单词按1.3个估计）
+    """
+    if tokenizer is not None:
+        try:
+            return len(tokenizer(text, add_special_tokens=True)["input_ids"])
+        except Exception:
+            pass
+    cjk = len(_CJK.findall(text))
+    words = len(_CJK.sub(" ", text).split())
+    return cjk + int(math.ceil(words * 1.3)) + 2
@@ -0,0 +1,240 @@
+"""
+句向量缓存
+内存LRU + 内存映射磁盘存储，按(模型名, 文本哈希)索引
+用于在固定测试集上重复评估多个系统时复用src/ref的编码结果。
+磁盘存储与分词缓存（token_store）的设计相同：向量按行追加写入一个float32文件，
+定长二进制索引记录每个文本的行号，数据和索引都只追加不修改，追加时加文件锁，
+多个工作进程可以共享同一目录
+"""
+
+from typing import List, Dict, Optional
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+
+import numpy as np
+
+from .token_store import _FileLock
+
+
+# 索引记录：sha1摘要(20字节) + 行号(int64)，定长、只追加
+_RECORD = struct.Struct("<20sq")
+
+
+class EmbeddingCache:
+    """句向量缓存（内存LRU + memmap磁盘存储，线程安全，磁盘目录可被多个进程共享）"""
+
+    def __init__(
+        self,
+        model_name: str,
+        cache_dir: Optional[str] = None,
+        max_memory_items: int = 50000
+    ):
+        """
+        初始化缓存
+
+        Args:
+            model_name: 模型名称（不同模型的向量互不共享）
+            cache_dir: 磁盘缓存目录（None表示仅使用内存缓存）
+            max_memory_items: 内存LRU的最大条目数
+        """
+        self.model_name = model_name
+        self.max_memory_items = max_memory_items
+        self._memory = OrderedDict()
+        self._pending: Dict[bytes, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # 磁盘存储：索引 {sha1摘要: 行号}，_index_pos为已读入的索引文件字节数
+        self._disk_dir = None
+        self._index: Dict[bytes, int] = {}
+        self._index_pos = 0
+        self._dim = None
+        self._mmap = None
+        self._mmap_rows = 0
+
+        if cache_dir:
+            safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+            self._disk_dir = os.path.join(cache_dir, safe_name)
+            os.makedirs(self._disk_dir, exist_ok=True)
+            self._file_lock = _FileLock(os.path.join(self._disk_dir, "lock"))
+            if not self._check_meta():
+                self._disk_dir = None
+            else:
+                self._load_index()
+
+    @property
+    def _data_path(self) -> str:
+        return os.path.join(self._disk_dir, "embeddings.f32")
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self._disk_dir, "index.bin")
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self._disk_dir, "meta.json")
+
+    def _check_meta(self, dim: Optional[int] = None) -> bool:
+        """
+        目录记录的模型和向量维度与当前一致；
+        dim不为None时在新目录中写入模型名和维度（调用方持有文件锁）
+        """
+        try:
+            if not os.path.exists(self._meta_path):
+                if dim is not None:
+                    tmp_path = self._meta_path + ".tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump({"model": self.model_name, "dim": dim}, f)
+                    os.replace(tmp_path, self._meta_path)
+                    self._dim = dim
+                return True
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except Exception as e:
+            print(f"⚠️  句向量缓存目录不可用，仅使用内存缓存: {e}")
+            return False
+        if meta.get("model") != self.model_name or (dim is not None and meta.get("dim") != dim):
+            print(f"⚠️  缓存目录的模型或向量维度不匹配，仅使用内存缓存: {self._disk_dir}")
+            return False
+        self._dim = meta.get("dim")
+        return True
+
+    def _load_index(self):
+        """读入索引文件中新增的记录（其他进程追加的条目随之可见）；不完整的末尾记录留到下次"""
+        try:
+            size = os.path.getsize(self._index_path)
+        except OSError:
+            return
+        if size - self._index_pos < _RECORD.size:
+            return
+        if self._dim is None and not self._check_meta():
+            return
+        with open(self._index_path, "rb") as f:
+            f.seek(self._index_pos)
+            data = f.read((size - self._index_pos) // _RECORD.size * _RECORD.size)
+        for digest, row in _RECORD.iter_unpack(data):
+            self._index.setdefault(digest, row)
+        self._index_pos += len(data)
+
+    def key(self, text: str) -> bytes:
+        """文本哈希（同一目录只存放同一模型的向量）"""
+        return hashlib.sha1(text.encode("utf-8")).digest()
+
+    def _read_row(self, row: int) -> Optional[np.ndarray]:
+        """从memmap读取一行（文件增长后重新映射；数据尚未完整写入时返回None）"""
+        if self._mmap is None or row >= self._mmap_rows:
+            rows = os.path.getsize(self._data_path) // (4 * self._dim)
+            self._mmap = np.memmap(self._data_path, dtype=np.float32, mode="r", shape=(rows, self._dim)) \
+                if rows else None
+            self._mmap_rows = rows
+        if row >= self._mmap_rows:
+            return None
+        return np.array(self._mmap[row])
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """查询单个文本的句向量"""
+        key = self.key(text)
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+            else:
+                embedding = self._pending.get(key)
+            if embedding is not None:
+                self.hits += 1
+                return embedding
+
+            if self._disk_dir:
+                if key not in self._index:
+                    # 其他进程可能已写入该文本
+                    self._load_index()
+                if key in self._index:
+                    embedding = self._read_row(self._index[key])
+                    if embedding is not None:
+                        self._remember(key, embedding)
+                        self.disk_hits += 1
+                        return embedding
+
+            self.misses += 1
+            return None
+
+    def _remember(self, key: bytes, embedding: np.ndarray):
+        """写入内存LRU"""
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def put_many(self, texts: List[str], embeddings: np.ndarray):
+        """
+        批量写入句向量（磁盘部分在flush时追加）
+
+        Args:
+            texts: 文本列表
+            embeddings: 形状为 (len(texts), dim) 的向量矩阵
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                key = self.key(text)
+                self._remember(key, embedding)
+                if self._disk_dir and key not in self._index:
+                    self._pending[key] = embedding
+
+    def flush(self):
+        """
+        把新向量追加到数据文件，再把对应的定长索引记录追加到索引文件（先数据后索引，
+        读到的索引记录总是指向已写完的数据）。写入量只与新条目数有关，与缓存大小无关
+        """
+        with self._lock:
+            if not self._disk_dir or not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            dim = int(next(iter(pending.values())).shape[0])
+
+            with self._file_lock:
+                # 新目录写入维度；维度与其他进程写入的不一致时不再写盘
+                if not self._check_meta(dim):
+                    self._disk_dir = None
+                    return
+                # 先读入其他进程追加的记录，已存在的条目不再重复写入
+                self._load_index()
+                pending = {key: embedding for key, embedding in pending.items() if key not in self._index}
+                if not pending:
+                    return
+                records = []
+                with open(self._data_path, "ab") as f:
+                    # 截掉中断的写入留下的不完整行（没有索引记录指向它）
+                    size = f.tell()
+                    if size % (4 * dim):
+                        size -= size % (4 * dim)
+                        f.truncate(size)
+                    row = size // (4 * dim)
+                    for key, embedding in pending.items():
+                        f.write(embedding.tobytes())
+                        records.append(_RECORD.pack(key, row))
+                        self._index[key] = row
+                        row += 1
+                with open(self._index_path, "ab") as f:
+                    f.write(b"".join(records))
+                self._index_pos = os.path.getsize(self._index_path)
+
+    def stats(self) -> Dict:
+        """缓存统计信息"""
+        return {
+            "memory_items": len(self._memory),
+            "disk_items": len(self._index),
+            "pending": len(self._pending),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,159 @@
+"""
+BERTScore的IDF权重表
+按参考语料统计文档频率（df）并持久化到磁盘，服务时直接加载，新的参考到达时增量更新。
+权重定义与bert_score.get_idf_dict一致：idf = log((N + 1) / (df + 1))，[SEP]/[CLS]权重为0，
+未出现过的子词取 log((N + 1) / 1)
+"""
+
+from typing import Dict, Iterable, List, Optional, Union
+from collections import Counter, defaultdict
+import hashlib
+import json
+import math
+import os
+import threading
+
+from .references import as_reference_list
+
+
+def _encode(tokenizer, text: str) -> List[int]:
+    """与bert_score相同的句子编码（含特殊符号，按模型最大长度截断）"""
+    try:
+        from bert_score.utils import sent_encode
+        return sent_encode(tokenizer, text)
+    except ImportError:
+        return tokenizer.encode(
+            text.strip(), add_special_tokens=True, max_length=tokenizer.model_max_length, truncation=True
+        )
+
+
+def _tokenizer_name(tokenizer) -> Optional[str]:
+    return getattr(tokenizer, "name_or_path", None) or None
+
+
+class IDFTable:
+    """可增量更新、可持久化的IDF表（线程安全）"""
+
+    def __init__(self, path: Optional[str] = None, dedupe: bool = True):
+        """
+        Args:
+            path: 表文件路径（JSON），存在时自动加载
+            dedupe: 对参考去重（同一参考多次到达只计一次，服务时逐样本更新不会抬高df）
+        """
+        self.path = path
+        self.dedupe = dedupe
+        self.tokenizer_name: Optional[str] = None
+        self.num_docs = 0
+        self.df: Counter = Counter()
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        # 缓存按当前df计算的权重字典，更新后失效
+        self._weights = None
+        self.dirty = False
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def _check_tokenizer(self, tokenizer):
+        name = _tokenizer_name(tokenizer)
+        if self.tokenizer_name is None:
+            self.tokenizer_name = name
+        elif name is not None and name != self.tokenizer_name:
+            raise ValueError(f"IDF表由 {self.tokenizer_name} 分词器构建，与当前模型 {name} 不一致")
+
+    def add(self, references: Iterable[Union[str, List[str]]], tokenizer) -> int:
+        """
+        增量加入参考翻译（每项可以是字符串或多个参考的列表，每个参考计为一篇文档）
+
+        Returns:
+            int: 实际新增的文档数
+        """
+        self._check_tokenizer(tokenizer)
+        # 串行更新：去重判断与计数之间不会插入其他线程的更新
+        with self._update_lock:
+            docs = {}
+            for reference in references:
+                for text in as_reference_list(reference):
+                    if not text or not text.strip():
+                        continue
+                    key = hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest() if self.dedupe else len(docs)
+                    if key not in self._seen:
+                        docs[key] = text
+            if not docs:
+                return 0
+
+            counts = Counter()
+            for text in docs.values():
+                counts.update(set(_encode(tokenizer, text)))
+
+            with self._lock:
+                if self.dedupe:
+                    self._seen.update(docs)
+                self.df.update(counts)
+                self.num_docs += len(docs)
+                self._weights = None
+                self.dirty = True
+            return len(docs)
+
+    def weights(self, tokenizer) -> Dict[int, float]:
+        """bert_score使用的idf_dict（defaultdict，未出现的子词取最大权重）"""
+        self._check_tokenizer(tokenizer)
+        with self._lock:
+            if self._weights is None:
+                n = self.num_docs
+                default = math.log(n + 1)
+                weights = defaultdict(lambda: default)
+                weights.update({token: math.log((n + 1) / (count + 1)) for token, count in self.df.items()})
+                self._weights = weights
+            weights = self._weights
+        weights[tokenizer.sep_token_id] = 0
+        weights[tokenizer.cls_token_id] = 0
+        return weights
+
+    def save(self, path: Optional[str] = None):
+        """原子写入表文件"""
+        path = path or self.path
+        if not path:
+            raise ValueError("未指定IDF表路径")
+        with self._lock:
+            state = {
+                "tokenizer": self.tokenizer_name,
+                "num_docs": self.num_docs,
+                "df": {str(token): count for token, count in self.df.items()},
+                "seen": sorted(self._seen) if self.dedupe else None
+            }
+            self.dirty = False
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def load(self, path: Optional[str] = None):
+        path = path or self.path
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        with self._lock:
+            self.tokenizer_name = state.get("tokenizer")
+            self.num_docs = state["num_docs"]
+            self.df = Counter({int(token): count for token, count in state["df"].items()})
+            self._seen = set(state.get("seen") or [])
+            self._weights = None
+            self.dirty = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "tokenizer": self.tokenizer_name,
+                "num_docs": self.num_docs,
+                "vocab_size": len(self.df)
+            }
@@ -0,0 +1,258 @@
+"""
+增量语料评估
+持久化语料级充分统计量（BLEU/ChrF）和神经指标的运行和，
+追加新样本时只计算新数据，即可得到更新后的语料级结果
+"""
+
+from typing import List, Dict, Optional, Union, Iterator
+import json
+import os
+
+import numpy as np
+
+from .sufficient_stats import char_bleu_statistics, bleu_from_statistics
+from .references import has_reference
+
+
+# 运行均值跟踪的逐句字段
+SEGMENT_FIELDS = ["bleu", "chrf", "comet", "bleurt", "bertscore_f1", "mqm_overall", "final_score"]
+
+# 逐句字段对应的指标（final_score总是计入均值）
+FIELD_METRICS = {
+    "bleu": "bleu", "chrf": "chrf", "comet": "comet", "bleurt": "bleurt",
+    "bertscore_f1": "bertscore", "mqm_overall": "mqm"
+}
+
+
+class IncrementalEvaluation:
+    """增量语料评估（状态持久化到目录）"""
+
+    def __init__(self, evaluator, state_dir: Optional[str] = None):
+        """
+        初始化增量评估
+
+        Args:
+            evaluator: 已初始化的UnifiedEvaluator（或CombinedQualityScorer）
+            state_dir: 状态目录，包含 state.json（运行统计量）和 segments.jsonl（逐句分数）；
+                None表示只在内存中累计（不持久化）
+        """
+        self.evaluator = evaluator
+        self.state_dir = state_dir
+
+        self.state = self._empty_state()
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+            self._load()
+
+    @property
+    def _state_path(self) -> str:
+        return os.path.join(self.state_dir, "state.json")
+
+    @property
+    def _segments_path(self) -> str:
+        return os.path.join(self.state_dir, "segments.jsonl")
+
+    def _config(self) -> Dict:
+        """影响充分统计量和运行均值含义的配置（恢复状态时必须一致）"""
+        chrf = getattr(self.evaluator, "chrf_scorer", None)
+        config = {
+            "chrf_char_order": getattr(chrf, "char_order", None),
+            "chrf_word_order": getattr(chrf, "n", None),
+            "chrf_beta": getattr(chrf, "beta", None),
+            "model_versions": self.evaluator.model_versions()
+        }
+        # 与从state.json读回的配置比较（元组等类型经JSON往返后变为列表）
+        return json.loads(json.dumps(config, ensure_ascii=False, default=str))
+
+    def _empty_state(self) -> Dict:
+        return {
+            "config": self._config(),
+            "n_segments": 0,
+            "segments_bytes": 0,
+            "sums": {field: 0.0 for field in SEGMENT_FIELDS},
+            "counts": {field: 0 for field in SEGMENT_FIELDS},
+            "bleu_stats": None,
+            "chrf_stats": None,
+            "n_with_reference": 0
+        }
+
+    def _load(self):
+        """加载状态，并截断崩溃时多写入的逐句记录"""
+        if not os.path.exists(self._state_path):
+            # 没有状态文件时，残留的逐句记录不可信
+            if os.path.exists(self._segments_path):
+                os.remove(self._segments_path)
+            return
+
+        with open(self._state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+
+        if state.get("config") != self._config():
+            raise ValueError(
+                f"增量评估状态与当前评估器配置不一致: {state.get('config')} vs {self._config()}"
+            )
+        self.state = state
+
+        if os.path.exists(self._segments_path) and os.path.getsize(self._segments_path) > state["segments_bytes"]:
+            with open(self._segments_path, "r+b") as f:
+                f.truncate(state["segments_bytes"])
+
+    def _save_state(self):
+        """原子写入状态文件"""
+        tmp_path = self._state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._state_path)
+
+    def append(
+        self,
+        sources: List[str],
+        translations: List[str],
+        references: Optional[List[Union[str, List[str]]]] = None,
+        mqm_scores: Optional[List[Dict]] = None
+    ) -> Dict:
+        """
+        追加样本并返回更新后的语料级结果（只评估新样本）
+
+        Args:
+            sources: 源文本列表
+            translations: 翻译文本列表
+            references: 参考翻译列表（可选，每项可以是字符串或多个参考的列表）
+            mqm_scores: MQM评分列表（可选）
+
+        Returns:
+            Dict: corpus_result()的结果
+        """
+        self.update(sources, translations, references, mqm_scores)
+        return self.corpus_result()
+
+    def update(
+        self,
+        sources: List[str],
+        translations: List[str],
+        references: Optional[List[Union[str, List[str]]]] = None,
+        mqm_scores: Optional[List[Dict]] = None
+    ) -> List:
+        """
+        追加样本并返回新样本的逐句评分（参数同append）
+
+        Returns:
+            List[PaperGradeScore]: 新样本的逐句评分
+        """
+        n = len(translations)
+        if n == 0:
+            return []
+        references = [references[i] if references and i < len(references) else None for i in range(n)]
+
+        results = self.evaluator.batch_score(sources, translations, references, mqm_scores)
+
+        # 语料级充分统计量（只统计有参考翻译的样本）
+        ref_indices = [i for i in range(n) if has_reference(references[i])]
+        ref_translations = [translations[i] for i in ref_indices]
+        ref_references = [references[i] for i in ref_indices]
+
+        bleu_stats = []
+        if getattr(self.evaluator, "use_bleu", True):
+            bleu_stats = [char_bleu_statistics(t, r) for t, r in zip(ref_translations, ref_references)]
+        chrf_stats = []
+        chrf = getattr(self.evaluator, "chrf_scorer", None)
+        if chrf is not None and getattr(self.evaluator, "use_chrf", False) and ref_indices:
+            chrf_stats = chrf.sentence_statistics(ref_translations, ref_references)
+
+        # 先追加逐句记录，再更新状态（崩溃时由状态中的字节数截断）
+        if self.state_dir:
+            with open(self._segments_path, "a", encoding="utf-8") as f:
+                for i, result in enumerate(results):
+                    record = {"index": self.state["n_segments"] + i}
+                    record.update({field: getattr(result, field, 0.0) for field in SEGMENT_FIELDS})
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.state["segments_bytes"] = os.path.getsize(self._segments_path)
+
+        enabled = set(self.evaluator.model_versions())
+        mqm_list = [mqm_scores[i] if mqm_scores and i < len(mqm_scores) else None for i in range(n)]
+        for field in SEGMENT_FIELDS:
+            counted = [
+                result for result, reference, mqm in zip(results, references, mqm_list)
+                if self._computed(field, result, reference, mqm, enabled)
+            ]
+            self.state["sums"][field] += sum(getattr(r, field, 0.0) for r in counted)
+            self.state["counts"][field] += len(counted)
+        self.state["bleu_stats"] = self._add_stats(self.state["bleu_stats"], bleu_stats)
+        self.state["chrf_stats"] = self._add_stats(self.state["chrf_stats"], chrf_stats)
+        self.state["n_with_reference"] += len(ref_indices)
+        self.state["n_segments"] += n
+        if self.state_dir:
+            self._save_state()
+
+        return results
+
+    def _computed(self, field: str, result, reference, mqm: Optional[Dict], enabled: set) -> bool:
+        """样本的该字段是否实际计算（未启用、级联跳过、缺少参考或MQM评分的不计入均值）"""
+        metric = FIELD_METRICS.get(field)
+        if metric is None:
+            return True
+        if result.metrics is not None and metric not in result.metrics:
+            return False
+        if result.skipped and metric in result.skipped:
+            return False
+        if metric == "mqm":
+            return bool(mqm) and getattr(self.evaluator, "use_mqm", False)
+        if metric not in enabled:
+            return False
+        if has_reference(reference):
+            return True
+        # 无参考模型（如CometKiwi）对无参考样本同样给出分数
+        comet = getattr(self.evaluator, "comet_scorer", None)
+        return metric == "comet" and comet is not None and not comet.requires_reference
+
+    @staticmethod
+    def _add_stats(running: Optional[List[float]], new_stats: List[List[int]]) -> Optional[List[float]]:
+        """累加充分统计量"""
+        if not new_stats:
+            return running
+        total = np.asarray(new_stats, dtype=np.float64).sum(axis=0)
+        if running is not None:
+            total = total + np.asarray(running, dtype=np.float64)
+        return total.tolist()
+
+    def corpus_result(self) -> Dict:
+        """
+        当前语料级结果
+
+        Returns:
+            Dict: n_segments, corpus_bleu, corpus_chrf（语料级统计），
+                各逐句指标的均值 mean_<字段名>（只对实际计算了该指标的样本求均值），
+                以及参与均值的样本数 n_<字段名>
+        """
+        n = self.state["n_segments"]
+        result = {
+            "n_segments": n,
+            "n_with_reference": self.state["n_with_reference"],
+            "corpus_bleu": 0.0,
+            "corpus_chrf": 0.0
+        }
+
+        if self.state["bleu_stats"] is not None:
+            result["corpus_bleu"] = bleu_from_statistics(self.state["bleu_stats"])
+        if self.state["chrf_stats"] is not None:
+            result["corpus_chrf"] = self.evaluator.chrf_scorer.corpus_score_from_statistics(self.state["chrf_stats"])
+
+        for field in SEGMENT_FIELDS:
+            count = self.state["counts"][field]
+            result[f"mean_{field}"] = self.state["sums"][field] / count if count else 0.0
+            result[f"n_{field}"] = count
+
+        return result
+
+    def segment_scores(self) -> Iterator[Dict]:
+        """逐句分数（流式读取）"""
+        if not self.state_dir or not os.path.exists(self._segments_path):
+            return
+        with open(self._segments_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
@@ -0,0 +1,288 @@
+"""
+进程级模型注册表
+同一进程中的多个评估器共享已加载的模型（按键去重），
+使用中的模型按引用计数固定，空闲模型在超出内存预算时按LRU卸载。
+每个模型的内存占用按加载前后的进程RSS差值估计（安装psutil时使用psutil，否则读取/proc/self/statm）
+"""
+
+from typing import Callable, Dict, Hashable, Optional
+from contextlib import contextmanager
+import gc
+import os
+import sys
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# 内存预算（MB）的环境变量，未设置时不限制
+BUDGET_ENV = "TRANSLATION_EVALUATOR_MODEL_BUDGET_MB"
+
+
+def current_rss() -> int:
+    """当前进程的常驻内存（字节），无法获取时返回0"""
+    if psutil is not None:
+        try:
+            return psutil.Process().memory_info().rss
+        except Exception:
+            pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
+
+
+def _release_memory():
+    """回收已卸载模型的内存（已导入torch时同时清空CUDA缓存）"""
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        try:
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except Exception:
+            pass
+
+
+class _Entry:
+    """已加载的模型"""
+
+    def __init__(self, model, rss_bytes: int, load_seconds: float, unloader: Optional[Callable]):
+        self.model = model
+        self.rss_bytes = rss_bytes
+        self.load_seconds = load_seconds
+        self.unloader = unloader
+        self.refcount = 0
+        self.last_used = time.monotonic()
+
+
+class ModelRegistry:
+    """进程级模型注册表（线程安全）"""
+
+    def __init__(self, memory_budget_mb: Optional[float] = None):
+        """
+        Args:
+            memory_budget_mb: 已加载模型的总内存预算（MB），None表示读取环境变量
+                TRANSLATION_EVALUATOR_MODEL_BUDGET_MB（未设置则不限制）
+        """
+        if memory_budget_mb is None and os.environ.get(BUDGET_ENV):
+            memory_budget_mb = float(os.environ[BUDGET_ENV])
+        self.memory_budget_mb = memory_budget_mb
+
+        self._lock = threading.Lock()
+        # 串行加载：RSS差值才能归属到单个模型，也避免同一模型被并发加载两次
+        self._load_lock = threading.Lock()
+        self._entries: Dict[Hashable, _Entry] = {}
+        # 卸载过的模型的内存占用，重新加载前据此预先腾出空间
+        self._known_sizes: Dict[Hashable, int] = {}
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    @property
+    def _budget_bytes(self) -> Optional[int]:
+        if self.memory_budget_mb is None:
+            return None
+        return int(self.memory_budget_mb * 1024 * 1024)
+
+    def acquire(self, key: Hashable, loader: Callable, unloader: Optional[Callable] = None):
+        """
+        获取模型（未加载时调用loader加载），引用计数+1
+
+        Args:
+            key: 模型键，如 ("comet", "Unbabel/wmt22-comet-da")
+            loader: 无参函数，返回加载好的模型（加载失败时抛出异常）
+            unloader: 卸载时对模型调用的清理函数（可选）
+
+        Returns:
+            模型对象（用完后必须调用release）
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.refcount += 1
+                entry.last_used = time.monotonic()
+                self.hits += 1
+                return entry.model
+
+        with self._load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refcount += 1
+                    entry.last_used = time.monotonic()
+                    self.hits += 1
+                    return entry.model
+
+            self._enforce_budget(reserve=self._known_sizes.get(key, 0))
+            gc.collect()
+            before = current_rss()
+            started = time.monotonic()
+            model = loader()
+            entry = _Entry(model, max(0, current_rss() - before), time.monotonic() - started, unloader)
+            entry.refcount = 1
+
+            with self._lock:
+                self._entries[key] = entry
+                self._known_sizes[key] = entry.rss_bytes
+                self.loads += 1
+            print(f"📦 模型已加载: {self._format_key(key)} "
+                  f"(约 {entry.rss_bytes / 1024 / 1024:.0f}MB, {entry.load_seconds:.1f}秒)")
+
+        self._enforce_budget()
+        return model
+
+    def release(self, key: Hashable):
+        """引用计数-1（模型保留在内存中，超出预算时才会被卸载）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.refcount <= 0:
+                return
+            entry.refcount -= 1
+            entry.last_used = time.monotonic()
+        self._enforce_budget()
+
+    @contextmanager
+    def use(self, key: Hashable, loader: Callable, unloader: Optional[Callable] = None):
+        """在with块内固定模型（块内不会被卸载）"""
+        model = self.acquire(key, loader, unloader)
+        try:
+            yield model
+        finally:
+            self.release(key)
+
+    def peek(self, key: Hashable):
+        """返回已加载的模型（未加载时返回None，不改变引用计数）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.model if entry is not None else None
+
+    def is_loaded(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def unload(self, key: Hashable, force: bool = False) -> bool:
+        """
+        卸载模型
+
+        Args:
+            force: 即使模型正在使用也从注册表中移除（使用者持有的引用在用完后释放）
+
+        Returns:
+            bool: 是否已卸载
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry.refcount > 0 and not force):
+                return False
+            del self._entries[key]
+        self._dispose(key, entry)
+        _release_memory()
+        return True
+
+    def unload_idle(self, idle_seconds: float = 0.0) -> int:
+        """卸载空闲超过idle_seconds秒的模型，返回卸载数量"""
+        now = time.monotonic()
+        with self._lock:
+            keys = [
+                key for key, entry in self._entries.items()
+                if entry.refcount == 0 and now - entry.last_used >= idle_seconds
+            ]
+        return sum(1 for key in keys if self.unload(key))
+
+    def set_budget(self, memory_budget_mb: Optional[float]):
+        """修改内存预算（立即按新预算卸载空闲模型）"""
+        self.memory_budget_mb = memory_budget_mb
+        self._enforce_budget()
+
+    def total_bytes(self) -> int:
+        """已加载模型的估计总内存"""
+        with self._lock:
+            return sum(entry.rss_bytes for entry in self._entries.values())
+
+    def _enforce_budget(self, reserve: int = 0):
+        """超出预算时按最近最少使用顺序卸载空闲模型（reserve为即将加载的模型预留的字节数）"""
+        budget = self._budget_bytes
+        if budget is None:
+            return
+        evicted = []
+        with self._lock:
+            total = reserve + sum(entry.rss_bytes for entry in self._entries.values())
+            idle = sorted(
+                (item for item in self._entries.items() if item[1].refcount == 0),
+                key=lambda item: item[1].last_used
+            )
+            for key, entry in idle:
+                if total <= budget:
+                    break
+                del self._entries[key]
+                total -= entry.rss_bytes
+                evicted.append((key, entry))
+            self.evictions += len(evicted)
+            over_budget = total > budget
+
+        for key, entry in evicted:
+            self._dispose(key, entry)
+            print(f"♻️  超出内存预算，已卸载空闲模型: {self._format_key(key)}")
+        if evicted:
+            _release_memory()
+        if over_budget and not reserve:
+            print(f"⚠️  使用中的模型超出内存预算 ({total / 1024 / 1024:.0f}MB > {self.memory_budget_mb:.0f}MB)")
+
+    @staticmethod
+    def _dispose(key: Hashable, entry: _Entry):
+        if entry.unloader is not None:
+            try:
+                entry.unloader(entry.model)
+            except Exception as e:
+                print(f"⚠️  模型清理失败 {ModelRegistry._format_key(key)}: {e}")
+        entry.model = None
+
+    @staticmethod
+    def _format_key(key: Hashable) -> str:
+        if isinstance(key, tuple):
+            return ":".join(str(part) for part in key)
+        return str(key)
+
+    def stats(self) -> Dict:
+        """已加载模型、引用计数与内存占用"""
+        now = time.monotonic()
+        with self._lock:
+            models = [
+                {
+                    "key": self._format_key(key),
+                    "refcount": entry.refcount,
+                    "rss_mb": round(entry.rss_bytes / 1024 / 1024, 1),
+                    "load_seconds": round(entry.load_seconds, 2),
+                    "idle_seconds": round(now - entry.last_used, 1) if entry.refcount == 0 else 0.0
+                }
+                for key, entry in self._entries.items()
+            ]
+            return {
+                "models": models,
+                "total_mb": round(sum(m["rss_mb"] for m in models), 1),
+                "budget_mb": self.memory_budget_mb,
+                "process_rss_mb": round(current_rss() / 1024 / 1024, 1),
+                "loads": self.loads,
+                "hits": self.hits,
+                "evictions": self.evictions
+            }
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ModelRegistry:
+    """进程级默认注册表"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
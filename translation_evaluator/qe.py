@@ -0,0 +1,235 @@
+"""
+无参考质量评估（QE）
+使用COMETKiwi只根据源文本和译文打分，不计算任何依赖参考翻译的指标。
+面向持续的高并发在线流量：
+- 动态批处理：并发提交的单个样本在后台线程中凑批推理（达到批大小或等待超时即执行）
+- LRU缓存：重复的 (源文本, 译文) 直接返回缓存分数；同一样本在途时共享同一个结果
+"""
+
+from typing import Callable, ContextManager, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import nullcontext
+import threading
+import time
+
+from .comet_scorer import COMETKiwiScorer
+
+
+class QualityEstimator:
+    """COMETKiwi质量评估（动态批处理 + 缓存，线程安全）"""
+
+    def __init__(
+        self,
+        model_name: str = "Unbabel/wmt22-cometkiwi-da",
+        max_batch_size: int = 64,
+        max_wait: float = 0.01,
+        cache_size: int = 100000,
+        batch_context: Optional[Callable[[int], ContextManager]] = None,
+        token_cache_dir: Optional[str] = None
+    ):
+        """
+        Args:
+            model_name: COMETKiwi模型名称（如 "Unbabel/wmt23-cometkiwi-da-xl"）
+            max_batch_size: 动态批处理的最大批大小
+            max_wait: 凑批的最长等待时间（秒），第一个样本到达后最多等待这么久
+            cache_size: LRU缓存条目数（0表示不缓存）
+            batch_context: 可选，以批大小为参数、返回上下文管理器的函数，
+                每次推理在其中执行（例如服务器的调度槽位）
+            token_cache_dir: 分词缓存目录（可选，见token_store）
+        """
+        self.model_name = model_name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self.batch_context = batch_context
+        self.scorer = COMETKiwiScorer(
+            model_name=model_name, batch_size=min(self.max_batch_size, 32), token_cache_dir=token_cache_dir
+        )
+
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        # 待凑批的样本及其Future；相同样本在途时共享Future
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[str, str]] = []
+        self._pending: Dict[Tuple[str, str], Future] = {}
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+
+        # 统计信息
+        self.requests = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_segments = 0
+        self.inference_seconds = 0.0
+
+    def initialize(self) -> bool:
+        """加载COMETKiwi模型（首次推理时也会自动加载）"""
+        return self.scorer.initialize()
+
+    def _cache_get(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._cache_lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+            return value
+
+    def _cache_put(self, keys: List[Tuple[str, str]], values: List[float]):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            for key, value in zip(keys, values):
+                self._cache[key] = value
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _infer(self, keys: List[Tuple[str, str]], context: Optional[Callable[[int], ContextManager]]) -> List[float]:
+        """对一批唯一样本推理并写入缓存（推理在context返回的上下文中执行）"""
+        started = time.monotonic()
+        with (context(len(keys)) if context else nullcontext()):
+            result = self.scorer.score([src for src, _ in keys], [mt for _, mt in keys])
+        if result.get("error"):
+            raise RuntimeError(f"COMETKiwi推理失败: {result['error']}")
+        scores = [float(score) for score in result.get("scores", [])]
+        if len(scores) != len(keys):
+            raise RuntimeError(f"COMETKiwi返回的分数数量不符: {len(scores)} vs {len(keys)}")
+
+        with self._cond:
+            self.batches += 1
+            self.batched_segments += len(keys)
+            self.inference_seconds += time.monotonic() - started
+        self._cache_put(keys, scores)
+        return scores
+
+    def submit(self, source: str, translation: str) -> Future:
+        """
+        提交单个样本，返回Future（结果为分数）
+
+        缓存命中时立即完成；否则进入动态批处理队列，由后台线程凑批推理
+        """
+        key = (source or "", translation)
+        future = Future()
+        cached = self._cache_get(key)
+        if cached is not None:
+            with self._cond:
+                self.requests += 1
+                self.cache_hits += 1
+            future.set_result(cached)
+            return future
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("QualityEstimator已关闭")
+            self.requests += 1
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.coalesced += 1
+                return pending
+            self._pending[key] = future
+            self._queue.append(key)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="qe-batcher", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+        return future
+
+    def score(self, source: str, translation: str, timeout: Optional[float] = None) -> float:
+        """单个样本评分（阻塞直到所在的批次完成）"""
+        return self.submit(source, translation).result(timeout)
+
+    def _run(self):
+        """后台凑批线程：队列满一批或第一个样本等待超过max_wait后执行推理"""
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue and self._closed:
+                    return
+                deadline = time.monotonic() + self.max_wait
+                while len(self._queue) < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                keys = self._queue[:self.max_batch_size]
+                del self._queue[:self.max_batch_size]
+
+            try:
+                scores = self._infer(keys, self.batch_context)
+                outcome = [(score, None) for score in scores]
+            except Exception as e:
+                outcome = [(None, e)] * len(keys)
+
+            with self._cond:
+                futures = [self._pending.pop(key) for key in keys]
+            for future, (score, error) in zip(futures, outcome):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(score)
+
+    def score_batch(
+        self,
+        sources: List[str],
+        translations: List[str],
+        chunk_size: Optional[int] = None,
+        chunk_context: Optional[Callable[[int], ContextManager]] = None
+    ) -> List[float]:
+        """
+        批量评分（调用线程直接推理，不经过动态批处理队列）
+
+        先查缓存并对批内重复样本去重，只对未命中的唯一样本推理
+
+        Args:
+            sources: 源文本列表
+            translations: 译文列表
+            chunk_size: 推理分块大小（默认max_batch_size的4倍）
+            chunk_context: 可选，每个分块在其返回的上下文中执行（覆盖batch_context）
+        """
+        if len(sources) != len(translations):
+            raise ValueError(f"sources和translations长度不匹配: {len(sources)} vs {len(translations)}")
+        keys = [(source or "", translation) for source, translation in zip(sources, translations)]
+        scores: Dict[Tuple[str, str], float] = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            cached = self._cache_get(key)
+            if cached is None:
+                missing.append(key)
+            else:
+                scores[key] = cached
+
+        with self._cond:
+            self.requests += len(keys)
+            self.cache_hits += len(keys) - len(missing)
+
+        chunk_size = chunk_size or self.max_batch_size * 4
+        context = chunk_context or self.batch_context
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            scores.update(zip(chunk, self._infer(chunk, context)))
+        return [scores[key] for key in keys]
+
+    def close(self):
+        """停止后台线程（队列中的样本处理完后退出）"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "model": self.model_name,
+                "requests": self.requests,
+                "cache_hits": self.cache_hits,
+                "coalesced": self.coalesced,
+                "cache_size": len(self._cache),
+                "queue_depth": len(self._queue),
+                "batches": self.batches,
+                "mean_batch_size": self.batched_segments / self.batches if self.batches else 0.0,
+                "inference_seconds": round(self.inference_seconds, 3)
+            }
@@ -0,0 +1,79 @@
+"""
+多参考翻译支持
+每个样本的reference可以是字符串（单参考）或字符串列表（多参考）
+"""
+
+from typing import List, Dict, Optional, Union, Tuple
+
+Reference = Union[str, List[str], None]
+
+
+def as_reference_list(reference: Reference) -> List[str]:
+    """将单个样本的参考翻译规范化为非空字符串列表"""
+    if reference is None:
+        return []
+    if isinstance(reference, str):
+        return [reference] if reference.strip() else []
+    return [ref for ref in reference if ref and ref.strip()]
+
+
+def has_reference(reference: Reference) -> bool:
+    """样本是否有至少一个非空参考翻译"""
+    return bool(as_reference_list(reference))
+
+
+def is_multi_reference(references: Optional[List[Reference]]) -> bool:
+    """批量数据中是否存在多参考样本"""
+    return bool(references) and any(isinstance(ref, (list, tuple)) for ref in references)
+
+
+def flatten_references(
+    translations: List[str],
+    references: List[Reference],
+    sources: Optional[List[str]] = None
+) -> Tuple[List[int], List[str], List[str], List[str]]:
+    """
+    将多参考样本展开为 (样本索引, 翻译, 参考, 源文本) 的平铺列表
+
+    Returns:
+        (segment_ids, translations, references, sources)
+    """
+    segment_ids, flat_translations, flat_references, flat_sources = [], [], [], []
+    for i, (translation, reference) in enumerate(zip(translations, references)):
+        for ref in as_reference_list(reference):
+            segment_ids.append(i)
+            flat_translations.append(translation)
+            flat_references.append(ref)
+            flat_sources.append(sources[i] if sources else "")
+    return segment_ids, flat_translations, flat_references, flat_sources
+
+
+def aggregate_by_segment(
+    segment_ids: List[int],
+    values: List[float],
+    n_segments: int,
+    aggregation: str = "max"
+) -> List[float]:
+    """
+    按样本聚合多参考分数
+
+    Args:
+        segment_ids: 每个平铺分数对应的样本索引
+        values: 平铺分数
+        n_segments: 样本数
+        aggregation: "max" 或 "mean"
+
+    Returns:
+        List[float]: 每个样本的分数（没有参考的样本为0.0）
+    """
+    if aggregation not in ("max", "mean"):
+        raise ValueError(f"不支持的多参考聚合方式: {aggregation}")
+
+    grouped: Dict[int, List[float]] = {}
+    for i, value in zip(segment_ids, values):
+        grouped.setdefault(i, []).append(value)
+
+    result = [0.0] * n_segments
+    for i, group in grouped.items():
+        result[i] = max(group) if aggregation == "max" else sum(group) / len(group)
+    return result
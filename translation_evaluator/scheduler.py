@@ -0,0 +1,108 @@
+"""
+优先级调度
+交互式请求（/eval，单样本、对延迟敏感）优先于批量请求（/eval/batch，吞吐优先）。
+批量请求按分块申请执行槽位，分块之间让出槽位，
+因此交互式请求最多等待一个分块的时间
+"""
+
+from typing import Dict
+from collections import deque
+from contextlib import contextmanager
+import threading
+import time
+
+
+# 优先级类别（数值越小优先级越高）
+INTERACTIVE = 0
+BULK = 1
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+
+class PriorityScheduler:
+    """按优先级分配执行槽位（线程安全）"""
+
+    def __init__(self, max_concurrency: int = 1, interactive_burst: int = 16):
+        """
+        Args:
+            max_concurrency: 同时执行的槽位数（评估器共享模型，默认串行）
+            interactive_burst: 有批量请求等待时，连续放行交互式请求的上限，
+                之后放行一个批量分块，避免批量请求饿死
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.interactive_burst = max(1, interactive_burst)
+
+        self._cond = threading.Condition()
+        self._waiting = {INTERACTIVE: deque(), BULK: deque()}
+        self._running = 0
+        self._consecutive_interactive = 0
+
+        self.granted = {INTERACTIVE: 0, BULK: 0}
+        self.wait_time = {INTERACTIVE: 0.0, BULK: 0.0}
+        self.max_wait_time = {INTERACTIVE: 0.0, BULK: 0.0}
+
+    def _next_priority(self):
+        """下一个应放行的优先级类别（没有等待者时返回None）"""
+        interactive, bulk = self._waiting[INTERACTIVE], self._waiting[BULK]
+        if interactive and (not bulk or self._consecutive_interactive < self.interactive_burst):
+            return INTERACTIVE
+        if bulk:
+            return BULK
+        return None
+
+    def acquire(self, priority: int = BULK):
+        """等待执行槽位"""
+        token = object()
+        started = time.monotonic()
+        with self._cond:
+            queue = self._waiting[priority]
+            queue.append(token)
+            while not (
+                self._running < self.max_concurrency
+                and self._next_priority() == priority
+                and queue[0] is token
+            ):
+                self._cond.wait()
+
+            queue.popleft()
+            self._running += 1
+            if priority == INTERACTIVE:
+                self._consecutive_interactive += 1
+            else:
+                self._consecutive_interactive = 0
+
+            waited = time.monotonic() - started
+            self.granted[priority] += 1
+            self.wait_time[priority] += waited
+            self.max_wait_time[priority] = max(self.max_wait_time[priority], waited)
+            # 还有空闲槽位时让其他等待者继续检查
+            self._cond.notify_all()
+
+    def release(self):
+        """释放执行槽位"""
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: int = BULK):
+        """在with块内占用一个执行槽位"""
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict:
+        """各优先级的等待数、放行数和等待时间"""
+        with self._cond:
+            result = {"running": self._running, "max_concurrency": self.max_concurrency}
+            for priority, name in PRIORITY_NAMES.items():
+                granted = self.granted[priority]
+                result[name] = {
+                    "waiting": len(self._waiting[priority]),
+                    "granted": granted,
+                    "mean_wait": self.wait_time[priority] / granted if granted else 0.0,
+                    "max_wait": self.max_wait_time[priority]
+                }
+            return result
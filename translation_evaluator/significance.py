@@ -0,0 +1,181 @@
+"""
+配对Bootstrap显著性检验
+基于NumPy索引矩阵的向量化重采样，分块执行以限制内存占用
+支持逐句分数（COMET/BLEURT/BERTScore等取均值的指标）
+和逐句充分统计量（BLEU/ChrF等语料级指标）
+"""
+
+from typing import List, Dict, Optional, Callable
+from itertools import combinations
+
+import numpy as np
+
+from .sufficient_stats import bleu_from_statistics, chrf_from_statistics
+
+
+# 默认的语料级统计函数（输入为 (k, n_stats) 的求和统计量，输出 (k,) 的分数）
+DEFAULT_CORPUS_FUNCTIONS = {
+    "bleu": bleu_from_statistics,
+    "chrf": chrf_from_statistics,
+}
+
+
+def _corpus_statistic(values: np.ndarray, corpus_fn: Optional[Callable]) -> Callable:
+    """
+    返回一个函数：由重采样计数矩阵 (k, n) 计算k个语料级统计量
+    """
+    n = values.shape[0]
+    if values.ndim == 1:
+        return lambda counts: counts @ values / n
+    if corpus_fn is None:
+        raise ValueError("充分统计量（二维输入）需要提供corpus_functions中对应的语料级函数")
+    return lambda counts: corpus_fn(counts @ values)
+
+
+def paired_bootstrap(
+    system_scores: Dict[str, Dict[str, object]],
+    n_resamples: int = 1000,
+    confidence: float = 0.95,
+    max_memory_mb: float = 64.0,
+    seed: Optional[int] = 12345,
+    corpus_functions: Optional[Dict[str, Callable]] = None
+) -> Dict:
+    """
+    对所有系统两两进行配对Bootstrap检验
+
+    Args:
+        system_scores: {系统名: {指标名: 逐句数据}}
+            - 一维数组 (n,): 逐句分数，语料分数取均值（COMET/BLEURT/BERTScore等）
+            - 二维数组 (n, n_stats): 逐句充分统计量，求和后经corpus_functions计算（BLEU/ChrF）
+        n_resamples: 重采样次数
+        confidence: 置信水平（用于置信区间）
+        max_memory_mb: 每个分块的索引/计数矩阵内存上限
+        seed: 随机种子（None表示不固定）
+        corpus_functions: {指标名: 语料级函数}，默认提供bleu和chrf（ChrF2参数）
+
+    Returns:
+        Dict: {
+            "n_segments", "n_resamples", "confidence",
+            "metrics": {
+                指标名: {
+                    "systems": {系统名: {"score", "ci"}},
+                    "pairs": [{"system_a", "system_b", "delta", "ci", "p_value"}]
+                }
+            }
+        }
+    """
+    systems = list(system_scores.keys())
+    if len(systems) < 1:
+        return {"error": "没有系统分数"}
+
+    functions = dict(DEFAULT_CORPUS_FUNCTIONS)
+    if corpus_functions:
+        functions.update(corpus_functions)
+
+    # 只检验所有系统都提供的指标
+    metrics = [m for m in system_scores[systems[0]] if all(m in system_scores[s] for s in systems)]
+
+    # 所有系统、所有指标的段数必须一致（配对检验）
+    values = {}
+    n_segments = None
+    for system in systems:
+        for metric in metrics:
+            array = np.asarray(system_scores[system][metric], dtype=np.float64)
+            if n_segments is None:
+                n_segments = array.shape[0]
+            elif array.shape[0] != n_segments:
+                raise ValueError(f"段数不一致: {system}/{metric} 有 {array.shape[0]} 段，期望 {n_segments}")
+            values[(system, metric)] = array
+
+    if not n_segments:
+        return {"error": "没有可用的逐句分数"}
+
+    statistics = {
+        key: _corpus_statistic(array, functions.get(key[1]))
+        for key, array in values.items()
+    }
+
+    # 分块大小：索引矩阵(int64)和计数矩阵(float64)各占 chunk * n * 8 字节
+    chunk_size = max(1, int(max_memory_mb * 1024 * 1024 // (n_segments * 16)))
+    chunk_size = min(chunk_size, n_resamples)
+
+    rng = np.random.default_rng(seed)
+    samples = {key: np.empty(n_resamples) for key in values}
+    offsets = None
+
+    for start in range(0, n_resamples, chunk_size):
+        size = min(chunk_size, n_resamples - start)
+
+        # 同一组重采样索引用于所有系统和指标（配对）
+        indices = rng.integers(0, n_segments, size=(size, n_segments))
+        if offsets is None or len(offsets) != size:
+            offsets = (np.arange(size) * n_segments)[:, None]
+        counts = np.bincount((indices + offsets).ravel(), minlength=size * n_segments)
+        counts = counts.reshape(size, n_segments).astype(np.float64)
+        del indices
+
+        for key, statistic in statistics.items():
+            samples[key][start:start + size] = statistic(counts)
+
+    alpha = 1.0 - confidence
+    lower_q, upper_q = 100 * alpha / 2, 100 * (1 - alpha / 2)
+    full_counts = np.ones((1, n_segments))
+
+    result = {
+        "n_segments": n_segments,
+        "n_resamples": n_resamples,
+        "confidence": confidence,
+        "metrics": {}
+    }
+
+    for metric in metrics:
+        observed = {s: float(statistics[(s, metric)](full_counts)[0]) for s in systems}
+
+        metric_result = {"systems": {}, "pairs": []}
+        for system in systems:
+            lo, hi = np.percentile(samples[(system, metric)], [lower_q, upper_q])
+            metric_result["systems"][system] = {
+                "score": observed[system],
+                "ci": [float(lo), float(hi)]
+            }
+
+        for system_a, system_b in combinations(systems, 2):
+            deltas = samples[(system_a, metric)] - samples[(system_b, metric)]
+            observed_delta = observed[system_a] - observed[system_b]
+
+            # 中心化的双侧p值（与sacrebleu的paired bootstrap一致）
+            centered = np.abs(deltas - deltas.mean())
+            p_value = (np.sum(centered >= abs(observed_delta)) + 1) / (n_resamples + 1)
+            lo, hi = np.percentile(deltas, [lower_q, upper_q])
+
+            metric_result["pairs"].append({
+                "system_a": system_a,
+                "system_b": system_b,
+                "delta": observed_delta,
+                "ci": [float(lo), float(hi)],
+                "p_value": float(p_value)
+            })
+
+        result["metrics"][metric] = metric_result
+
+    return result
+
+
+def segment_scores_from_results(
+    results: List,
+    metrics: Optional[List[str]] = None
+) -> Dict[str, List[float]]:
+    """
+    从batch_score返回的评分对象中提取逐句分数，作为paired_bootstrap的输入
+
+    Args:
+        results: ComprehensiveScore/PaperGradeScore列表
+        metrics: 字段名列表（默认: comet, bleurt, bertscore_f1, chrf, bleu, final_score）
+
+    Returns:
+        Dict[str, List[float]]: {字段名: 逐句分数}
+    """
+    if metrics is None:
+        metrics = ["comet", "bleurt", "bertscore_f1", "chrf", "bleu", "final_score"]
+    # 句子级的bleu/chrf取均值；若需要语料级BLEU/ChrF，请传入充分统计量
+    return {metric: [getattr(r, metric, 0.0) for r in results] for metric in metrics}
@@ -0,0 +1,76 @@
+"""
+请求合并（single-flight）
+并发请求中相同的样本只计算一次：第一个请求负责计算，
+其他请求等待同一个结果
+"""
+
+from typing import Callable, Dict, Hashable, List, Tuple
+from concurrent.futures import Future
+import threading
+
+
+class SingleFlight:
+    """按键合并进行中的计算（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+        self.computed = 0
+        self.coalesced = 0
+
+    def claim(self, keys: List[Hashable]) -> Tuple[List[Hashable], Dict[Hashable, Future]]:
+        """
+        认领一组键
+
+        Returns:
+            (owned, waiting): owned为本调用负责计算的键（计算后必须resolve），
+            waiting为其他调用正在计算的键及其Future
+        """
+        owned, waiting = [], {}
+        seen = set()
+        with self._lock:
+            for key in keys:
+                if key in seen:
+                    continue
+                seen.add(key)
+                future = self._inflight.get(key)
+                if future is None:
+                    self._inflight[key] = Future()
+                    owned.append(key)
+                else:
+                    waiting[key] = future
+            self.computed += len(owned)
+            self.coalesced += len(waiting)
+        return owned, waiting
+
+    def resolve(self, key: Hashable, value=None, error: BaseException = None):
+        """发布计算结果（或异常），唤醒等待者"""
+        with self._lock:
+            future = self._inflight.pop(key, None)
+        if future is None:
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def do(self, key: Hashable, fn: Callable):
+        """计算单个键；相同键的计算正在进行时等待其结果"""
+        owned, waiting = self.claim([key])
+        if waiting:
+            return waiting[key].result()
+        try:
+            value = fn()
+        except BaseException as e:
+            self.resolve(key, error=e)
+            raise
+        self.resolve(key, value)
+        return value
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._inflight),
+                "computed": self.computed,
+                "coalesced": self.coalesced
+            }
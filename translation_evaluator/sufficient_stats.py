@@ -0,0 +1,130 @@
+"""
+充分统计量
+BLEU/ChrF等语料级指标不能由句子分数取平均得到，
+需要对每个句子的n-gram计数求和后再计算。这里提供逐句统计量的提取和
+向量化的语料分数计算（用于显著性检验、增量评估等场景）
+"""
+
+from typing import List, Union
+from collections import Counter
+
+import numpy as np
+
+
+def _char_ngrams(text: str, n: int) -> Counter:
+    """字符级n-gram计数"""
+    return Counter(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def char_bleu_statistics(
+    candidate: str,
+    references: Union[str, List[str]],
+    max_order: int = 4
+) -> List[int]:
+    """
+    计算字符级BLEU的逐句充分统计量（与CombinedQualityScorer的字符级BLEU一致）
+
+    Args:
+        candidate: 翻译文本
+        references: 参考翻译（字符串或多个参考的列表）
+        max_order: 最大n-gram阶数
+
+    Returns:
+        List[int]: [hyp_len, ref_len, match_1..match_N, total_1..total_N]
+            多参考时ref_len取最接近hyp_len的参考长度，匹配计数按各参考的最大计数截断
+    """
+    if isinstance(references, str):
+        references = [references]
+    references = [ref for ref in references if ref]
+
+    hyp_len = len(candidate)
+    if references:
+        ref_len = min((abs(len(ref) - hyp_len), len(ref)) for ref in references)[1]
+    else:
+        ref_len = 0
+
+    matches = []
+    totals = []
+    for n in range(1, max_order + 1):
+        hyp_ngrams = _char_ngrams(candidate, n)
+        max_ref_counts = Counter()
+        for ref in references:
+            for ngram, count in _char_ngrams(ref, n).items():
+                if count > max_ref_counts[ngram]:
+                    max_ref_counts[ngram] = count
+        matches.append(sum(min(count, max_ref_counts[ngram]) for ngram, count in hyp_ngrams.items()))
+        totals.append(max(hyp_len - n + 1, 0))
+
+    return [hyp_len, ref_len] + matches + totals
+
+
+def bleu_from_statistics(stats, max_order: int = 4):
+    """
+    由（求和后的）BLEU充分统计量计算BLEU分数（向量化）
+
+    Args:
+        stats: 形状为 (2 + 2 * max_order,) 或 (k, 2 + 2 * max_order) 的统计量
+        max_order: 最大n-gram阶数
+
+    Returns:
+        BLEU分数 (0-1)，输入为一维时返回float，否则返回形状为 (k,) 的数组
+    """
+    stats = np.asarray(stats, dtype=np.float64)
+    single = stats.ndim == 1
+    stats = np.atleast_2d(stats)
+
+    hyp_len = stats[:, 0]
+    ref_len = stats[:, 1]
+    matches = stats[:, 2:2 + max_order]
+    totals = stats[:, 2 + max_order:2 + 2 * max_order]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precisions = np.where(totals > 0, matches / np.maximum(totals, 1), 0.0)
+        valid = np.all(precisions > 0, axis=1)
+        log_avg = np.where(valid, np.log(np.where(precisions > 0, precisions, 1.0)).mean(axis=1), 0.0)
+        brevity = np.where(
+            hyp_len < ref_len,
+            np.exp(1.0 - ref_len / np.maximum(hyp_len, 1)),
+            1.0
+        )
+    scores = np.where(valid & (hyp_len > 0), brevity * np.exp(log_avg), 0.0)
+
+    return float(scores[0]) if single else scores
+
+
+def chrf_from_statistics(stats, char_order: int = 6, word_order: int = 2, beta: float = 2.0):
+    """
+    由（求和后的）ChrF充分统计量计算ChrF分数（向量化，与sacrebleu一致）
+
+    Args:
+        stats: 形状为 (3 * order,) 或 (k, 3 * order) 的统计量，
+            每个阶数依次为 [hyp, ref, match] 计数
+        char_order: 字符n-gram阶数
+        word_order: 词n-gram阶数
+        beta: F-score的beta参数
+
+    Returns:
+        ChrF分数 (0-1)，输入为一维时返回float，否则返回形状为 (k,) 的数组
+    """
+    stats = np.asarray(stats, dtype=np.float64)
+    single = stats.ndim == 1
+    stats = np.atleast_2d(stats)
+
+    order = char_order + word_order
+    triples = stats[:, :3 * order].reshape(len(stats), order, 3)
+    n_hyp, n_ref, n_match = triples[:, :, 0], triples[:, :, 1], triples[:, :, 2]
+
+    # sacreBLEU 2.x 的有效阶数平滑
+    effective = (n_hyp > 0) & (n_ref > 0)
+    prec = np.where(effective, n_match / np.maximum(n_hyp, 1), 0.0)
+    rec = np.where(effective, n_match / np.maximum(n_ref, 1), 0.0)
+    effective_order = effective.sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_prec = np.where(effective_order > 0, prec.sum(axis=1) / np.maximum(effective_order, 1), 0.0)
+        avg_rec = np.where(effective_order > 0, rec.sum(axis=1) / np.maximum(effective_order, 1), 0.0)
+        factor = beta ** 2
+        denom = factor * avg_prec + avg_rec
+        scores = np.where(denom > 0, (1 + factor) * avg_prec * avg_rec / np.where(denom > 0, denom, 1.0), 0.0)
+
+    return float(scores[0]) if single else scores
@@ -0,0 +1,324 @@
+"""
+CPU线程预算
+COMET/BERTScore（torch）和BLEURT（TensorFlow）默认各自按全部核心创建线程池，
+在同一进程中并发运行时严重超订CPU。这里按配置集中分配每个指标（和每个工作进程）的线程数与可选的CPU亲和性：
+- torch: intra-op线程数是进程级设置，无法按调用切换（并发的指标会互相覆盖）。
+  每次配置后在首个指标执行前设置一次，取torch指标（comet/bertscore/qe）预算的最大值；
+  需要不同线程数的torch指标应部署在不同的工作进程中
+- TensorFlow: intra/inter-op线程数只能在运行时初始化前设置，BLEURT加载模型前应用一次
+- BLAS: 安装threadpoolctl时限制numpy等链接的BLAS/OpenMP线程池（同样是进程级，取所有指标预算的最大值，设置一次）
+- 亲和性: Linux上os.sched_setaffinity(0, ...)只作用于调用线程及其之后创建的线程，指标执行期间设置、结束后恢复。
+  torch已经创建的OpenMP工作线程不会随之迁移，要绑定torch的计算线程，应在进程首次推理前
+  （或启动时用taskset等）设置整个工作进程的亲和性
+
+配置（JSON文件或字典，也可通过环境变量 TRANSLATION_EVALUATOR_THREAD_BUDGET 指定文件）：
+    {
+        "cores": [0, 1, ..., 15],          # 可选，默认为进程可用的全部核心
+        "workers": 2,                      # 共享本机的工作进程数，每个进程分得一段核心
+        "affinity": true,                  # 未指定cores的指标按顺序分得互不重叠的核心段
+        "metrics": {
+            "comet": {"threads": 4},
+            "bertscore": {},               # 未指定threads的指标平分剩余核心
+            "bleurt": {"threads": 2, "inter_op": 1, "cores": [6, 7]}
+        }
+    }
+配置中没有列出的指标使用本进程的全部核心（不设置亲和性）。
+"""
+
+from typing import Callable, Dict, List, Optional
+from contextlib import ExitStack, contextmanager
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+
+# 配置文件路径的环境变量，未设置时不限制
+CONFIG_ENV = "TRANSLATION_EVALUATOR_THREAD_BUDGET"
+# 工作进程序号的环境变量（多进程部署时每个进程分得一段核心）
+WORKER_ENV = "TRANSLATION_EVALUATOR_WORKER"
+
+# 使用torch的指标（共享进程级的intra-op线程数）
+TORCH_METRICS = ("comet", "bertscore", "qe")
+
+
+def available_cores() -> List[int]:
+    """进程可用的CPU核心"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class ThreadBudget:
+    """按指标分配线程数与CPU亲和性（线程安全）"""
+
+    def __init__(self, config: Optional[Dict] = None, worker: Optional[int] = None):
+        """
+        Args:
+            config: 预算配置（格式见模块说明），None表示读取环境变量
+                TRANSLATION_EVALUATOR_THREAD_BUDGET指定的文件（未设置则不限制）
+            worker: 工作进程序号，None表示读取环境变量TRANSLATION_EVALUATOR_WORKER（默认0）
+        """
+        if config is None and os.environ.get(CONFIG_ENV):
+            config = self.load(os.environ[CONFIG_ENV])
+        if worker is None:
+            worker = int(os.environ.get(WORKER_ENV, 0))
+        self.worker = worker
+
+        self._lock = threading.Lock()
+        self._tensorflow_configured = False
+        # 已应用的进程级设置：torch线程数（及设置前的原值）和BLAS限制
+        self._torch_threads = None
+        self._torch_default = None
+        self._blas_limits = None
+        self.runs: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+        self.configure(config)
+
+    @staticmethod
+    def load(path: str) -> Dict:
+        """读取JSON配置文件"""
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def configure(self, config: Optional[Dict]):
+        """应用新配置（之后开始执行的指标生效；TensorFlow线程数只在初始化前生效）"""
+        config = dict(config or {})
+        cores = list(config.get("cores") or available_cores())
+        workers = max(1, int(config.get("workers", 1)))
+        share = max(1, len(cores) // workers)
+        start = (self.worker % workers) * share
+        worker_cores = cores[start:start + share] or cores
+
+        metrics = {name: dict(spec or {}) for name, spec in (config.get("metrics") or {}).items()}
+        fixed = sum(spec["threads"] for spec in metrics.values() if spec.get("threads"))
+        flexible = [name for name, spec in metrics.items() if not spec.get("threads")]
+        for name in flexible:
+            metrics[name]["threads"] = max(1, (len(worker_cores) - fixed) // len(flexible))
+
+        if config.get("affinity"):
+            offset = 0
+            for name, spec in metrics.items():
+                if spec.get("cores"):
+                    continue
+                if offset >= len(worker_cores):
+                    offset = 0
+                spec["cores"] = worker_cores[offset:offset + spec["threads"]]
+                offset += spec["threads"]
+
+        with self._lock:
+            self.config = config
+            self.enabled = bool(config)
+            self.worker_cores = worker_cores
+            self.metrics = metrics
+            self._reset_process_limits()
+
+    def threads(self, metric: str) -> int:
+        """指标的线程数（未配置的指标使用本进程的全部核心）"""
+        spec = self.metrics.get(metric)
+        return spec["threads"] if spec else len(self.worker_cores)
+
+    def cores(self, metric: str) -> Optional[List[int]]:
+        """指标绑定的核心（None表示不设置亲和性）"""
+        spec = self.metrics.get(metric)
+        return list(spec["cores"]) if spec and spec.get("cores") else None
+
+    def process_threads(self, metrics) -> int:
+        """一组指标共享进程级线程池时的线程数（取预算最大值，都未配置时为本进程的全部核心）"""
+        threads = [self.metrics[name]["threads"] for name in metrics if name in self.metrics]
+        return max(threads) if threads else len(self.worker_cores)
+
+    def _apply_process_limits(self):
+        """设置进程级的torch线程数与BLAS限制（每次配置后只设置一次；torch在导入后才能设置）"""
+        torch = sys.modules.get("torch")
+        if (torch is None or self._torch_threads is not None) and \
+                (threadpool_limits is None or self._blas_limits is not None):
+            return
+        with self._lock:
+            if torch is not None and self._torch_threads is None:
+                if self._torch_default is None:
+                    self._torch_default = torch.get_num_threads()
+                self._torch_threads = self.process_threads(TORCH_METRICS)
+                torch.set_num_threads(self._torch_threads)
+            if threadpool_limits is not None and self._blas_limits is None:
+                self._blas_limits = threadpool_limits(limits=self.process_threads(self.metrics))
+
+    def _reset_process_limits(self):
+        """恢复进程级设置（调用方持有self._lock），新配置在下一个指标执行前重新应用"""
+        torch = sys.modules.get("torch")
+        if torch is not None and self._torch_default is not None:
+            torch.set_num_threads(self._torch_default)
+        if self._blas_limits is not None:
+            self._blas_limits.restore_original_limits()
+        self._torch_threads = None
+        self._blas_limits = None
+
+    @contextmanager
+    def limit(self, metric: str):
+        """
+        在指标的线程预算内执行（未启用预算时不做任何修改）
+
+        torch与BLAS的线程数是进程级设置，只在配置后首次执行时设置一次，不随调用切换；
+        按调用切换的只有调用线程的CPU亲和性
+        """
+        if not self.enabled:
+            yield
+            return
+
+        self._apply_process_limits()
+        cores = self.cores(metric)
+        started = time.monotonic()
+        with ExitStack() as stack:
+            if cores and hasattr(os, "sched_setaffinity"):
+                previous_cores = os.sched_getaffinity(0)
+                os.sched_setaffinity(0, cores)
+                stack.callback(os.sched_setaffinity, 0, previous_cores)
+            yield
+
+        with self._lock:
+            self.runs[metric] = self.runs.get(metric, 0) + 1
+            self.seconds[metric] = self.seconds.get(metric, 0.0) + time.monotonic() - started
+
+    def configure_tensorflow(self, metric: str = "bleurt"):
+        """按指标预算设置TensorFlow线程数（须在TF运行时初始化前调用，之后调用无效）"""
+        if not self.enabled or self._tensorflow_configured:
+            return
+        try:
+            import tensorflow as tf
+            spec = self.metrics.get(metric, {})
+            tf.config.threading.set_intra_op_parallelism_threads(self.threads(metric))
+            tf.config.threading.set_inter_op_parallelism_threads(spec.get("inter_op", 1))
+            self._tensorflow_configured = True
+            print(f"✓ TensorFlow线程数: intra={self.threads(metric)}, inter={spec.get('inter_op', 1)}")
+        except ImportError:
+            pass
+        except RuntimeError as e:
+            # 运行时已初始化
+            print(f"⚠️  TensorFlow线程数设置失败: {e}")
+
+    def benchmark(
+        self,
+        workloads: Dict[str, Callable[[], None]],
+        thread_counts: Optional[List[int]] = None,
+        repeats: int = 1
+    ) -> Dict:
+        """
+        在本机上搜索最优的线程划分
+
+        先逐个指标测量不同线程数下的耗时（各指标单独运行），再在线程总数不超过本进程核心数的划分中，
+        选择并发运行时最慢指标耗时最短的一个，最后按该划分并发运行一次验证
+        （同一进程中的torch指标共享进程级线程数，验证时取划分中的最大值，实际耗时可能偏离预测）
+
+        Args:
+            workloads: 指标名 → 执行一次代表性负载的函数（应先预热，避免把模型加载计入）
+            thread_counts: 候选线程数（默认1、2、4…直到本进程核心数）
+            repeats: 每个测量点重复次数（取最短耗时）
+
+        Returns:
+            Dict: 最优配置（可直接保存为配置文件）、各指标的耗时曲线和验证结果
+        """
+        original = self.config
+        worker_cores = self.worker_cores
+        total = len(worker_cores)
+        if not thread_counts:
+            thread_counts = sorted({min(total, 2 ** i) for i in range(total.bit_length() + 1)})
+        thread_counts = [n for n in thread_counts if 1 <= n <= total]
+
+        curves: Dict[str, Dict[int, float]] = {}
+        for metric, workload in workloads.items():
+            curves[metric] = {}
+            for threads in thread_counts:
+                self.configure({"cores": worker_cores, "metrics": {metric: {"threads": threads}}})
+                elapsed = []
+                for _ in range(max(1, repeats)):
+                    started = time.monotonic()
+                    with self.limit(metric):
+                        workload()
+                    elapsed.append(time.monotonic() - started)
+                curves[metric][threads] = min(elapsed)
+                print(f"   {metric}: {threads} 线程 {min(elapsed):.3f}s")
+
+        metrics = list(workloads)
+        best = None
+        for split in itertools.product(thread_counts, repeat=len(metrics)):
+            if sum(split) > total:
+                continue
+            makespan = max(curves[metric][threads] for metric, threads in zip(metrics, split))
+            if best is None or makespan < best[0]:
+                best = (makespan, split)
+        if best is None:
+            self.configure(original)
+            raise ValueError(f"{len(metrics)} 个指标无法在 {total} 个核心内各分得至少1个线程")
+
+        # 保留原配置的核心范围与工作进程数，每个工作进程按同样的划分使用自己的核心段
+        config = {
+            **{key: original[key] for key in ("cores", "workers") if key in original},
+            "affinity": True,
+            "metrics": {metric: {"threads": threads} for metric, threads in zip(metrics, best[1])}
+        }
+        self.configure(config)
+
+        # 按最优划分并发运行，验证实际耗时
+        errors = []
+
+        def run(metric):
+            try:
+                with self.limit(metric):
+                    workloads[metric]()
+            except Exception as e:
+                errors.append(f"{metric}: {e}")
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=run, args=(metric,)) for metric in metrics]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        concurrent_seconds = time.monotonic() - started
+
+        return {
+            "config": config,
+            "curves": {metric: {str(n): round(t, 4) for n, t in curve.items()} for metric, curve in curves.items()},
+            "predicted_seconds": round(best[0], 4),
+            "concurrent_seconds": round(concurrent_seconds, 4),
+            "errors": errors
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "worker": self.worker,
+                "worker_cores": len(self.worker_cores),
+                "torch_threads": self._torch_threads,
+                "metrics": {
+                    name: {
+                        "threads": spec["threads"],
+                        "cores": spec.get("cores"),
+                        "runs": self.runs.get(name, 0),
+                        "seconds": round(self.seconds.get(name, 0.0), 3)
+                    }
+                    for name, spec in self.metrics.items()
+                }
+            }
+
+
+_budget: Optional[ThreadBudget] = None
+_budget_lock = threading.Lock()
+
+
+def get_thread_budget() -> ThreadBudget:
+    """进程级默认线程预算"""
+    global _budget
+    if _budget is None:
+        with _budget_lock:
+            if _budget is None:
+                _budget = ThreadBudget()
+    return _budget
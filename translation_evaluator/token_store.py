@@ -0,0 +1,405 @@
+"""
+分词结果缓存
+按(分词器标识, 文本哈希)索引子词id序列：内存LRU + 磁盘存储（所有序列首尾相接写入一个int32文件，
+定长二进制索引记录每个文本的 [偏移, 长度]，读取时内存映射）。
+数据和索引都只追加不修改，追加时加文件锁，多个工作进程可以共享同一目录，
+读取走内存映射，各进程共享操作系统的页缓存而不复制数据。
+新条目先留在内存，按条目数或时间间隔批量写盘（进程退出时写完剩余条目）
+"""
+
+from typing import Callable, Dict, List, Optional, Sequence
+from collections import OrderedDict
+import atexit
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# 分词缓存目录的环境变量（评估器未指定token_cache_dir时使用）
+CACHE_DIR_ENV = "TRANSLATION_EVALUATOR_TOKEN_CACHE"
+
+# 索引记录：sha1摘要(20字节) + 偏移(int64) + 长度(int32)，定长、只追加
+_RECORD = struct.Struct("<20sqi")
+
+
+class _FileLock:
+    """跨进程文件锁（没有fcntl的平台上只在进程内互斥）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a+")
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+class TokenStore:
+    """分词结果缓存（线程安全，磁盘目录可被多个进程共享）"""
+
+    def __init__(
+        self,
+        tokenizer_id: str,
+        cache_dir: Optional[str] = None,
+        max_memory_items: int = 200000,
+        flush_interval: float = 30.0,
+        flush_size: int = 4096
+    ):
+        """
+        Args:
+            tokenizer_id: 分词器标识（模型名 + 影响结果的分词参数，不同标识的结果互不共享）
+            cache_dir: 磁盘缓存目录（None表示仅使用内存缓存）
+            max_memory_items: 内存LRU的最大条目数
+            flush_interval: maybe_flush写盘的最长间隔（秒）
+            flush_size: 待写入条目达到该数量时maybe_flush立即写盘
+        """
+        self.tokenizer_id = tokenizer_id
+        # 创建实例的进程（fork出的工作进程需要自行flush，见comet_prepare_sample）
+        self.pid = os.getpid()
+        self.max_memory_items = max_memory_items
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._memory = OrderedDict()
+        self._pending: Dict[bytes, np.ndarray] = {}
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # 磁盘存储：索引 {sha1摘要: (偏移, 长度)}，_index_pos为已读入的索引文件字节数
+        self._disk_dir = None
+        self._index: Dict[bytes, tuple] = {}
+        self._index_pos = 0
+        self._mmap = None
+        self._mmap_size = 0
+
+        if cache_dir:
+            safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", tokenizer_id)
+            self._disk_dir = os.path.join(cache_dir, safe_name)
+            os.makedirs(self._disk_dir, exist_ok=True)
+            self._file_lock = _FileLock(os.path.join(self._disk_dir, "lock"))
+            if not self._check_meta():
+                self._disk_dir = None
+            else:
+                self._load_index()
+
+    @property
+    def _data_path(self) -> str:
+        return os.path.join(self._disk_dir, "tokens.i32")
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self._disk_dir, "index.bin")
+
+    def _check_meta(self) -> bool:
+        """目录记录的分词器与当前一致（新目录写入分词器标识）"""
+        meta_path = os.path.join(self._disk_dir, "meta.json")
+        try:
+            with self._file_lock:
+                if not os.path.exists(meta_path):
+                    with open(meta_path, "w", encoding="utf-8") as f:
+                        json.dump({"tokenizer": self.tokenizer_id}, f)
+                    return True
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+        except Exception as e:
+            print(f"⚠️  分词缓存目录不可用，仅使用内存缓存: {e}")
+            return False
+        if meta.get("tokenizer") != self.tokenizer_id:
+            print(f"⚠️  分词缓存目录的分词器不匹配，仅使用内存缓存: {self._disk_dir}")
+            return False
+        return True
+
+    def _load_index(self):
+        """读入索引文件中新增的记录（其他进程追加的条目随之可见）；不完整的末尾记录留到下次"""
+        try:
+            size = os.path.getsize(self._index_path)
+        except OSError:
+            return
+        if size - self._index_pos < _RECORD.size:
+            return
+        with open(self._index_path, "rb") as f:
+            f.seek(self._index_pos)
+            data = f.read((size - self._index_pos) // _RECORD.size * _RECORD.size)
+        for digest, offset, length in _RECORD.iter_unpack(data):
+            self._index.setdefault(digest, (offset, length))
+        self._index_pos += len(data)
+
+    def key(self, text: str) -> bytes:
+        """文本哈希（同一目录只存放同一分词器的结果）"""
+        return hashlib.sha1(text.encode("utf-8")).digest()
+
+    def _read(self, offset: int, length: int) -> Optional[np.ndarray]:
+        """从memmap读取一个序列（文件增长后重新映射；数据尚未完整写入时返回None）"""
+        if self._mmap is None or offset + length > self._mmap_size:
+            size = os.path.getsize(self._data_path) // 4
+            self._mmap = np.memmap(self._data_path, dtype=np.int32, mode="r", shape=(size,)) if size else None
+            self._mmap_size = size
+        if offset + length > self._mmap_size:
+            return None
+        return np.array(self._mmap[offset:offset + length])
+
+    def _remember(self, key: bytes, ids: np.ndarray):
+        self._memory[key] = ids
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """批量查询（未命中的位置为None）"""
+        results: List[Optional[np.ndarray]] = []
+        with self._lock:
+            reloaded = False
+            for text in texts:
+                key = self.key(text)
+                ids = self._memory.get(key)
+                if ids is not None:
+                    self._memory.move_to_end(key)
+                else:
+                    ids = self._pending.get(key)
+                if ids is not None:
+                    self.hits += 1
+                    results.append(ids)
+                    continue
+
+                if self._disk_dir:
+                    if key not in self._index and not reloaded:
+                        # 其他进程可能已写入该文本
+                        self._load_index()
+                        reloaded = True
+                    if key in self._index:
+                        ids = self._read(*self._index[key])
+                        if ids is not None:
+                            self._remember(key, ids)
+                            self.disk_hits += 1
+                            results.append(ids)
+                            continue
+
+                self.misses += 1
+                results.append(None)
+        return results
+
+    def put_many(self, texts: Sequence[str], sequences: Sequence[Sequence[int]]):
+        """批量写入（磁盘部分在flush时追加）"""
+        with self._lock:
+            for text, ids in zip(texts, sequences):
+                key = self.key(text)
+                ids = np.asarray(ids, dtype=np.int32)
+                self._remember(key, ids)
+                if self._disk_dir and key not in self._index:
+                    self._pending[key] = ids
+
+    def encode(self, texts: Sequence[str], tokenize: Callable[[List[str]], List[Sequence[int]]]) -> List[np.ndarray]:
+        """
+        取得文本的子词id序列，只对未缓存的唯一文本调用tokenize（批量）
+
+        Args:
+            texts: 文本列表
+            tokenize: 以文本列表为参数、返回id序列列表的分词函数
+        """
+        cached = self.get_many(texts)
+        missing = list(dict.fromkeys(text for text, ids in zip(texts, cached) if ids is None))
+        if not missing:
+            return cached
+
+        encoded = dict(zip(missing, (np.asarray(ids, dtype=np.int32) for ids in tokenize(missing))))
+        self.put_many(missing, [encoded[text] for text in missing])
+        return [ids if ids is not None else encoded[text] for text, ids in zip(texts, cached)]
+
+    def flush(self):
+        """
+        把新序列追加到数据文件，再把对应的定长索引记录追加到索引文件（先数据后索引，
+        读到的索引记录总是指向已写完的数据）。写入量只与新条目数有关，与缓存大小无关
+        """
+        with self._lock:
+            self._flushed_at = time.monotonic()
+            if not self._disk_dir or not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+
+            with self._file_lock:
+                # 先读入其他进程追加的记录，已存在的条目不再重复写入
+                self._load_index()
+                pending = {key: ids for key, ids in pending.items() if key not in self._index}
+                if not pending:
+                    return
+                records = []
+                with open(self._data_path, "ab") as f:
+                    offset = f.tell() // 4
+                    for key, ids in pending.items():
+                        f.write(ids.tobytes())
+                        records.append(_RECORD.pack(key, offset, len(ids)))
+                        self._index[key] = (offset, len(ids))
+                        offset += len(ids)
+                with open(self._index_path, "ab") as f:
+                    f.write(b"".join(records))
+                self._index_pos = os.path.getsize(self._index_path)
+
+    def maybe_flush(self):
+        """待写入条目足够多或距上次写盘超过flush_interval时写盘"""
+        if len(self._pending) >= self.flush_size or time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def stats(self) -> Dict:
+        """缓存统计信息"""
+        return {
+            "tokenizer": self.tokenizer_id,
+            "memory_items": len(self._memory),
+            "disk_items": len(self._index),
+            "pending": len(self._pending),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses
+        }
+
+
+_stores: Dict[tuple, TokenStore] = {}
+_stores_lock = threading.Lock()
+
+
+def resolve_cache_dir(cache_dir: Optional[str] = None) -> Optional[str]:
+    """分词缓存目录：显式参数优先，其次是环境变量；都没有时返回None（不启用）"""
+    return cache_dir or os.environ.get(CACHE_DIR_ENV) or None
+
+
+def get_token_store(tokenizer_id: str, cache_dir: Optional[str] = None) -> TokenStore:
+    """进程级共享的分词缓存（相同分词器标识与目录只创建一个实例）"""
+    cache_dir = resolve_cache_dir(cache_dir)
+    key = (tokenizer_id, os.path.abspath(cache_dir) if cache_dir else None)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = TokenStore(tokenizer_id, cache_dir)
+        return store
+
+
+def flush_all(force: bool = False):
+    """
+    写盘所有分词缓存的新条目（各评分器在每次打分后调用）
+
+    Args:
+        force: 立即写盘；默认只在条目数或时间间隔达到阈值时写盘（见TokenStore.maybe_flush）
+    """
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        try:
+            store.flush() if force else store.maybe_flush()
+        except Exception as e:
+            print(f"⚠️  分词缓存写入失败 ({store.tokenizer_id}): {e}")
+
+
+atexit.register(flush_all, force=True)
+
+
+def comet_prepare_sample(encoder, store: TokenStore, original: Callable, max_length: int):
+    """
+    COMET编码器prepare_sample的缓存版本：子词id从缓存读取，只对新文本分词，
+    再按原实现的方式补齐成批（pad + attention_mask）；带其他参数的调用走原实现
+    """
+    def prepare_sample(sample, *args, **kwargs):
+        if args or kwargs or not isinstance(sample, (list, tuple)):
+            return original(sample, *args, **kwargs)
+        import torch
+
+        tokenizer = encoder.tokenizer
+        sequences = store.encode(
+            list(sample),
+            lambda texts: tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]
+        )
+        width = max((len(ids) for ids in sequences), default=0)
+        input_ids = torch.full((len(sequences), width), tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(sequences), width), dtype=torch.long)
+        for row, ids in enumerate(sequences):
+            input_ids[row, :len(ids)] = torch.from_numpy(ids.astype(np.int64))
+            attention_mask[row, :len(ids)] = 1
+        if os.getpid() != store.pid:
+            # DataLoader工作进程中整理批次：进程退出前没有机会再写盘
+            store.flush()
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+    return prepare_sample
+
+
+class CachedTokenizer:
+    """
+    HuggingFace分词器代理（BERTScore使用）：encode的结果按调用参数分别缓存，
+    其余属性和方法直接转发；isinstance检查与原分词器一致（bert_score据此选择编码参数）
+    """
+
+    def __init__(self, tokenizer, cache_dir: Optional[str] = None):
+        self._tokenizer = tokenizer
+        self._cache_dir = cache_dir
+        self._name = getattr(tokenizer, "name_or_path", None) or type(tokenizer).__name__
+
+    @property
+    def __class__(self):
+        return self._tokenizer.__class__
+
+    def __getattr__(self, name):
+        return getattr(self._tokenizer, name)
+
+    def __call__(self, *args, **kwargs):
+        return self._tokenizer(*args, **kwargs)
+
+    def encode(self, text, **kwargs):
+        if not isinstance(text, str):
+            return self._tokenizer.encode(text, **kwargs)
+        options = ",".join(f"{k}={kwargs[k]}" for k in sorted(kwargs))
+        store = get_token_store(f"{self._name}:{options}", self._cache_dir)
+        return store.encode([text], lambda texts: [self._tokenizer.encode(texts[0], **kwargs)])[0].tolist()
+
+
+class CachedWordTokenizer:
+    """
+    BLEURT分词器代理：tokenize的结果以子词id缓存，读取时用分词器的逆映射还原为子词。
+    分词器没有 id → 子词 的逆映射时不可用（见inverse_mapping）
+    """
+
+    def __init__(self, tokenizer, inverse: Callable, tokenizer_id: str, cache_dir: Optional[str] = None):
+        self._tokenizer = tokenizer
+        self._inverse = inverse
+        self._store = get_token_store(tokenizer_id, cache_dir)
+
+    def __getattr__(self, name):
+        return getattr(self._tokenizer, name)
+
+    def tokenize(self, text):
+        ids = self._store.encode(
+            [text], lambda texts: [self._tokenizer.convert_tokens_to_ids(self._tokenizer.tokenize(texts[0]))]
+        )[0]
+        return list(self._inverse([int(i) for i in ids]))
+
+    @staticmethod
+    def inverse_mapping(tokenizer) -> Optional[Callable]:
+        """分词器的 id → 子词 逆映射（WordPiece词表或SentencePiece模型），没有时返回None"""
+        for owner in (tokenizer, getattr(tokenizer, "tokenizer", None), getattr(tokenizer, "_tokenizer", None)):
+            convert = getattr(owner, "convert_ids_to_tokens", None)
+            if callable(convert):
+                return convert
+        sp_model = getattr(tokenizer, "_sp_model", None) or getattr(tokenizer, "sp_model", None)
+        if sp_model is not None and hasattr(sp_model, "IdToPiece"):
+            return lambda ids: [sp_model.IdToPiece(i) for i in ids]
+        return None
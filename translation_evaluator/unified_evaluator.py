@@ -3,11 +3,17 @@
 BLEU, COMET, BLEURT, BERTScore, MQM, ChrF
 """
 
-from typing import List, Dict, Optional
-from dataclasses import dataclass
+from typing import List, Dict, Optional, Union, Callable, ContextManager, Tuple
+from contextlib import nullcontext
+from dataclasses import dataclass, asdict
+import math
+import random
+from statistics import NormalDist
 
 from .combined_scorer import ComprehensiveScore, CombinedQualityScorer
+from .references import has_reference
 from .chrf_scorer import ChrF2Scorer
+from .qe import QualityEstimator
 
 
 @dataclass
@@ -30,7 +36,17 @@ class UnifiedEvaluator(CombinedQualityScorer):
         use_bertscore: bool = True,
         use_mqm: bool = True,
         use_chrf: bool = True,
-        comet_model: str = "Unbabel/wmt22-comet-da"
+        comet_model: str = "Unbabel/wmt22-comet-da",
+        multi_ref_aggregation: str = "max",
+        qe_model: str = "Unbabel/wmt22-cometkiwi-da",
+        bertscore_idf: Optional[Union[str, Dict[str, str]]] = None,
+        update_bertscore_idf: bool = False,
+        bertscore_lang: str = "zh",
+        bertscore_models: Optional[Dict[str, str]] = None,
+        comet_models: Optional[Dict[str, str]] = None,
+        token_cache_dir: Optional[str] = None,
+        bertscore_precision: str = "fp32",
+        bertscore_num_layers: Optional[int] = None
     ):
         """
         初始化统一评估器
@@ -43,12 +59,32 @@ class UnifiedEvaluator(CombinedQualityScorer):
             use_mqm: 是否使用MQM（单模型系统通常为False）
             use_chrf: 是否使用ChrF
             comet_model: COMET模型名称
+            multi_ref_aggregation: 多参考时COMET/BLEURT分数的聚合方式（"max" 或 "mean"）
+            qe_model: 无参考质量评估（qe_score）使用的COMETKiwi模型名称
+            bertscore_idf: BERTScore的IDF表路径（指定后使用idf加权；字符串只用于bertscore_lang，
+                按语言路由时以字典指定各目标语言的表）
+            update_bertscore_idf: 打分时把新到达的参考增量加入IDF表
+            bertscore_lang: 未指定语言对的样本使用的BERTScore目标语言
+            bertscore_models: 目标语言 → BERTScore模型（可选）
+            comet_models: 语言对 → COMET模型（可选，如 {"en-de": "..."}）
+            token_cache_dir: 神经指标共用的分词缓存目录（可选，多个进程可共享）
+            bertscore_precision: BERTScore推理精度（"fp32"、"int8"、"bf16"）
+            bertscore_num_layers: BERTScore使用的隐藏层（可选，更浅的层更快）
         """
         super().__init__(
             use_comet=use_comet,
             use_bleurt=use_bleurt,
             use_bertscore=use_bertscore,
-            comet_model=comet_model
+            comet_model=comet_model,
+            multi_ref_aggregation=multi_ref_aggregation,
+            bertscore_idf=bertscore_idf,
+            update_bertscore_idf=update_bertscore_idf,
+            bertscore_lang=bertscore_lang,
+            bertscore_models=bertscore_models,
+            comet_models=comet_models,
+            token_cache_dir=token_cache_dir,
+            bertscore_precision=bertscore_precision,
+            bertscore_num_layers=bertscore_num_layers
         )
         
         self.use_bleu = use_bleu
@@ -59,6 +95,10 @@ class UnifiedEvaluator(CombinedQualityScorer):
         self.chrf_scorer = None
         if self.use_chrf:
             self.chrf_scorer = ChrF2Scorer()
+        
+        # 无参考质量评估（首次调用qe_score时创建）
+        self.qe_model = qe_model
+        self._quality_estimator = None
     
     def initialize(self):
         """初始化所有评估模型"""
@@ -75,12 +115,24 @@ class UnifiedEvaluator(CombinedQualityScorer):
         
         return success
     
+    def reconfigure(self, use_bleu: Optional[bool] = None, use_mqm: Optional[bool] = None, **kwargs):
+        """
+        增量重新配置（参数见CombinedQualityScorer.reconfigure，另支持开关BLEU/MQM，立即生效）
+        """
+        if use_bleu is not None:
+            self.use_bleu = use_bleu
+        if use_mqm is not None:
+            self.use_mqm = use_mqm
+        return super().reconfigure(**kwargs)
+    
     def score(
         self,
         source: str,
         translation: str,
-        reference: Optional[str] = None,
-        mqm_score: Optional[Dict] = None
+        reference: Optional[Union[str, List[str]]] = None,
+        mqm_score: Optional[Dict] = None,
+        metrics: Optional[Union[str, List[str]]] = None,
+        lang_pair: Optional[Union[str, Tuple[str, str]]] = None
     ) -> PaperGradeScore:
         """
         综合评分（包含所有6个指标）
@@ -88,15 +140,21 @@ class UnifiedEvaluator(CombinedQualityScorer):
         Args:
             source: 源文本
             translation: 翻译文本
-            reference: 参考翻译（可选）
+            reference: 参考翻译（可选，可以是多个参考的列表）
             mqm_score: MQM评分（可选，单模型系统通常为None）
+            metrics: 只计算这些指标（如 ["bleu", "chrf"]，None表示所有已启用的指标）
+            lang_pair: 语言对（如 "en-zh"，BERTScore/COMET据此选择模型）
             
         Returns:
-            PaperGradeScore: 包含所有6个指标的评分
+            PaperGradeScore: 包含所有6个指标的评分（未计算的指标为0，metrics字段列出实际计算的指标）
         """
-        # 使用父类方法计算基础指标
-        base_score = super().score(source, translation, reference, mqm_score)
+        # 使用父类方法计算基础指标（包含ChrF）
+        base_score = super().score(source, translation, reference, mqm_score, metrics=metrics, lang_pair=lang_pair)
         
+        return self._to_paper_grade(base_score, mqm_score)
+    
+    def _to_paper_grade(self, base_score: ComprehensiveScore, mqm_score: Optional[Dict]) -> PaperGradeScore:
+        """将基础评分转换为论文级评分，并重新计算综合评分"""
         # 创建论文级评分对象
         result = PaperGradeScore(
             bleu=base_score.bleu if self.use_bleu else 0.0,
@@ -108,12 +166,14 @@ class UnifiedEvaluator(CombinedQualityScorer):
             mqm_terminology=base_score.mqm_terminology if self.use_mqm and mqm_score else 0.0,
             mqm_overall=base_score.mqm_overall if self.use_mqm and mqm_score else 0.0,
             final_score=0.0,  # 重新计算
-            model_info=base_score.model_info
+            model_info=base_score.model_info,
+            metrics=base_score.metrics,
+            skipped=base_score.skipped
         )
         
-        # 计算ChrF
-        if self.use_chrf and self.chrf_scorer and reference:
-            result.chrf = self.chrf_scorer.score_single(translation, reference)
+        # ChrF已由父类计算，无需重复
+        if self.use_chrf and self.chrf_scorer:
+            result.chrf = base_score.chrf
         
         # 重新计算综合评分（包含ChrF）
         result.final_score = self._calculate_paper_grade_score(result)
@@ -183,25 +243,507 @@ class UnifiedEvaluator(CombinedQualityScorer):
         self,
         sources: List[str],
         translations: List[str],
-        references: Optional[List[str]] = None,
-        mqm_scores: Optional[List[Dict]] = None
+        references: Optional[List[Union[str, List[str]]]] = None,
+        mqm_scores: Optional[List[Dict]] = None,
+        checkpoint_path: Optional[str] = None,
+        chunk_size: int = 256,
+        chunk_context: Optional[Callable[[int], ContextManager]] = None,
+        metrics: Optional[Union[str, List[str]]] = None,
+        lang_pairs: Optional[List] = None
     ) -> List[PaperGradeScore]:
         """
-        批量评分
+        批量评分（每个指标对整个批次批量推理一次）
+        
+        Args:
+            sources: 源文本列表
+            translations: 翻译文本列表
+            references: 参考翻译列表（可选，每项可以是字符串或多个参考的列表）
+            mqm_scores: MQM评分列表（可选）
+            checkpoint_path: 检查点路径（可选）。指定后按chunk_size分块评估，
+                每完成一块就持久化，中断后用相同参数重新调用会从第一个未完成的分块继续；
+                全部分块完成后检查点保留一段时间（见checkpoint.COMPLETED_TTL），重新提交直接返回结果。
+                相同检查点的并发调用依次执行
+            chunk_size: 使用检查点或chunk_context时的分块大小
+            chunk_context: 可选，以分块样本数为参数、返回上下文管理器的函数。
+                指定后按chunk_size分块评估，每个分块在其上下文中执行
+                （例如服务器的调度槽位，分块之间让出给交互式请求）
+            metrics: 只计算这些指标（None表示所有已启用的指标），未请求的模型不会被调用或初始化
+            lang_pairs: 每个样本的语言对（可选，如 "en-zh"），混合语言的批次按目标语言分组推理
         
         Returns:
             List[PaperGradeScore]: 每个样本的综合评分
         """
+        if checkpoint_path or chunk_context:
+            return self._batch_score_chunked(
+                sources, translations, references, mqm_scores, checkpoint_path, chunk_size, chunk_context, metrics,
+                lang_pairs
+            )
+        
+        base_scores = super().batch_score(
+            sources, translations, references, mqm_scores, metrics=metrics, lang_pairs=lang_pairs
+        )
+        
+        return [
+            self._to_paper_grade(base, mqm_scores[i] if mqm_scores and i < len(mqm_scores) else None)
+            for i, base in enumerate(base_scores)
+        ]
+
+    def _batch_score_chunked(
+        self,
+        sources: List[str],
+        translations: List[str],
+        references: Optional[List[Union[str, List[str]]]],
+        mqm_scores: Optional[List[Dict]],
+        checkpoint_path: Optional[str],
+        chunk_size: int,
+        chunk_context: Optional[Callable[[int], ContextManager]] = None,
+        metrics: Optional[Union[str, List[str]]] = None,
+        lang_pairs: Optional[List] = None
+    ) -> List[PaperGradeScore]:
+        """分块评估，已完成的分块从检查点读取（相同检查点的并发运行依次执行）"""
+        from .checkpoint import job_lock
+        
+        if not checkpoint_path:
+            return self._run_chunks(
+                sources, translations, references, mqm_scores, None, chunk_size, chunk_context, metrics, lang_pairs
+            )
+        with job_lock(checkpoint_path):
+            return self._run_chunks(
+                sources, translations, references, mqm_scores, checkpoint_path, chunk_size, chunk_context, metrics,
+                lang_pairs
+            )
+    
+    def _run_chunks(
+        self,
+        sources: List[str],
+        translations: List[str],
+        references: Optional[List[Union[str, List[str]]]],
+        mqm_scores: Optional[List[Dict]],
+        checkpoint_path: Optional[str],
+        chunk_size: int,
+        chunk_context: Optional[Callable[[int], ContextManager]] = None,
+        metrics: Optional[Union[str, List[str]]] = None,
+        lang_pairs: Optional[List] = None
+    ) -> List[PaperGradeScore]:
+        """逐块评估（调用方持有检查点的任务锁）"""
+        from .checkpoint import BatchCheckpoint, fingerprint
+        
+        n = len(translations)
+        checkpoint = None
+        if checkpoint_path:
+            parts = [sources, translations, references, mqm_scores, self.model_versions()]
+            if metrics is not None:
+                parts.append(self._select_metrics(metrics))
+            if lang_pairs:
+                parts.append([self.parse_lang_pair(pair) for pair in lang_pairs])
+            checkpoint = BatchCheckpoint(checkpoint_path, fingerprint(*parts), chunk_size)
+            
+            completed = checkpoint.completed_chunks()
+            if completed:
+                print(f"📂 从检查点恢复: 已完成 {len(completed)} 个分块")
+        
         results = []
+        for chunk_id, start in enumerate(range(0, n, chunk_size)):
+            end = min(n, start + chunk_size)
+            
+            cached = checkpoint.get(chunk_id) if checkpoint else None
+            if cached is not None:
+                results.extend(PaperGradeScore(**record) for record in cached)
+                continue
+            
+            with (chunk_context(end - start) if chunk_context else nullcontext()):
+                chunk_results = self.batch_score(
+                    sources[start:end],
+                    translations[start:end],
+                    references[start:end] if references else None,
+                    mqm_scores[start:end] if mqm_scores else None,
+                    metrics=metrics,
+                    lang_pairs=lang_pairs[start:end] if lang_pairs else None
+                )
+            if checkpoint:
+                checkpoint.put(chunk_id, [asdict(r) for r in chunk_results])
+            results.extend(chunk_results)
+        
+        if checkpoint and checkpoint.completed_at is None:
+            checkpoint.mark_complete()
+        return results
+    
+    # 级联模式中作为门控的词汇指标，以及只在不确定区间内计算的神经网络指标
+    CASCADE_GATES = {"chrf": "chrf", "bleu": "bleu"}
+    NEURAL_METRICS = ("comet", "bleurt", "bertscore")
+    
+    def batch_score_cascade(
+        self,
+        sources: List[str],
+        translations: List[str],
+        references: Optional[List[Union[str, List[str]]]] = None,
+        mqm_scores: Optional[List[Dict]] = None,
+        band: tuple = (0.3, 0.8),
+        gate_metric: str = "chrf",
+        metrics: Optional[Union[str, List[str]]] = None,
+        lang_pairs: Optional[List] = None
+    ) -> Dict:
+        """
+        级联评分（用于大规模质检过滤）
+        
+        先对整个批次计算ChrF/BLEU，只对门控指标落在不确定区间 [low, high] 内的样本
+        运行COMET/BLEURT/BERTScore；明显很差（< low）或明显很好（> high）的样本
+        只保留词汇指标，神经网络指标记为跳过。没有参考翻译的样本无法门控，总是计算神经网络指标
+        
+        Args:
+            sources: 源文本列表
+            translations: 翻译文本列表
+            references: 参考翻译列表（可选，每项可以是字符串或多个参考的列表）
+            mqm_scores: MQM评分列表（可选）
+            band: 不确定区间 (low, high)，门控指标在该区间内（含边界）时计算神经网络指标
+            gate_metric: 门控指标（chrf 或 bleu）
+            metrics: 只计算这些指标（None表示所有已启用的指标）
+            lang_pairs: 每个样本的语言对（可选）
+            
+        Returns:
+            Dict: {
+                "scores": List[PaperGradeScore]（跳过的样本skipped字段列出未计算的指标，
+                          其余样本为None；综合评分只基于已计算的指标）,
+                "stats": {"total", "neural_segments", "skipped_low", "skipped_high", "no_reference",
+                          "neural_metrics", "inference_avoided", "avoided_fraction", "band", "gate_metric"}
+            }
+        """
+        low, high = band
+        if low > high:
+            raise ValueError(f"band下界不能大于上界: {band}")
+        if gate_metric not in self.CASCADE_GATES:
+            raise ValueError(f"不支持的门控指标: {gate_metric}（可选: {', '.join(self.CASCADE_GATES)}）")
+        
+        selected = self._select_metrics(metrics)
+        if gate_metric not in selected:
+            raise ValueError(f"门控指标{gate_metric}未启用")
+        lexical = [metric for metric in selected if metric not in self.NEURAL_METRICS]
+        neural = [metric for metric in selected if metric in self.NEURAL_METRICS]
+        
+        n = len(translations)
+        results = self.batch_score(sources, translations, references, mqm_scores, metrics=lexical)
+        
+        field = self.CASCADE_GATES[gate_metric]
+        skipped_low, skipped_high, no_reference = [], [], 0
+        uncertain = []
+        for i, result in enumerate(results):
+            if not references or i >= len(references) or not has_reference(references[i]):
+                no_reference += 1
+                uncertain.append(i)
+                continue
+            gate = getattr(result, field)
+            if gate < low:
+                skipped_low.append(i)
+            elif gate > high:
+                skipped_high.append(i)
+            else:
+                uncertain.append(i)
+        
+        if neural and uncertain:
+            print(f"🪜 级联评分: {n} 个样本中 {len(uncertain)} 个进入神经网络指标 ({', '.join(neural)})")
+            neural_results = self.batch_score(
+                [sources[i] if sources and i < len(sources) else "" for i in uncertain],
+                [translations[i] for i in uncertain],
+                [references[i] for i in uncertain] if references else None,
+                metrics=neural,
+                lang_pairs=[lang_pairs[i] if i < len(lang_pairs) else None for i in uncertain] if lang_pairs else None
+            )
+            for i, neural_result in zip(uncertain, neural_results):
+                result = results[i]
+                result.comet = neural_result.comet
+                result.bleurt = neural_result.bleurt
+                result.bertscore_f1 = neural_result.bertscore_f1
+                result.metrics = lexical + neural
+        
+        # 没有启用神经网络指标时没有被跳过的指标，skipped与计算过的样本一样保持None
+        if neural:
+            for i in skipped_low + skipped_high:
+                results[i].skipped = list(neural)
+        for result in results:
+            result.final_score = self._calculate_paper_grade_score(result)
+        
+        avoided = len(skipped_low) + len(skipped_high)
+        return {
+            "scores": results,
+            "stats": {
+                "total": n,
+                "neural_segments": len(uncertain) if neural else 0,
+                "skipped_low": len(skipped_low),
+                "skipped_high": len(skipped_high),
+                "no_reference": no_reference,
+                "neural_metrics": neural,
+                "inference_avoided": avoided * len(neural),
+                "avoided_fraction": avoided / n if n and neural else 0.0,
+                "band": [low, high],
+                "gate_metric": gate_metric
+            }
+        }
+    
+    def quality_estimator(self) -> QualityEstimator:
+        """无参考质量评估器（COMETKiwi，延迟创建；模型通过进程级注册表共享）"""
+        if self._quality_estimator is None:
+            self._quality_estimator = QualityEstimator(model_name=self.qe_model, token_cache_dir=self.token_cache_dir)
+        return self._quality_estimator
+    
+    def qe_score(self, source: str, translation: str) -> float:
+        """
+        无参考质量评估（只运行COMETKiwi，不计算任何依赖参考翻译的指标）
+        
+        并发调用会被动态合并成批次推理，重复样本直接返回缓存分数
+        """
+        return self.quality_estimator().score(source, translation)
+    
+    def qe_batch_score(self, sources: List[str], translations: List[str]) -> List[float]:
+        """批量无参考质量评估（只运行COMETKiwi）"""
+        return self.quality_estimator().score_batch(sources, translations)
+    
+    def compare_systems(
+        self,
+        sources: List[str],
+        translations_a: List[str],
+        translations_b: List[str],
+        references: Optional[List[str]] = None,
+        metric: str = "comet",
+        confidence: float = 0.95,
+        chunk_size: int = 64,
+        min_segments: int = 100,
+        futility_margin: float = 0.005,
+        seed: Optional[int] = None
+    ) -> Dict:
+        """
+        序贯比较两个系统（提前停止，节省神经网络推理）
+        
+        按随机顺序分块评分，维护逐句差值的运行均值/方差（配对z检验）。
+        每次检查使用Bonferroni校正后的临界值（alpha / 计划检查次数），
+        因此多次检查的总体一类错误率不超过 1 - confidence。
+        
+        停止条件：
+        - 显著：|z| 超过临界值
+        - 无效（futility）：差值的置信区间完全落在 [-futility_margin, futility_margin] 内，
+          即两个系统实际上等价，继续评分也不会得出有意义的差异
+        
+        Args:
+            sources: 源文本列表
+            translations_a: 系统A的翻译列表
+            translations_b: 系统B的翻译列表
+            references: 参考翻译列表（可选）
+            metric: 比较使用的指标（comet, bleurt, bertscore, chrf, bleu）
+            confidence: 置信水平
+            chunk_size: 每次评分的段数
+            min_segments: 开始检查前至少评分的段数
+            futility_margin: 等价边界（0表示不做无效停止）
+            seed: 随机种子
+            
+        Returns:
+            Dict: decision (a_better / b_better / equivalent / inconclusive),
+                segments_used, total_segments, mean_difference (A - B), ci, z, critical_z 等
+            
+        Raises:
+            RuntimeError: 指标评分出错（不把出错的分块当作0分参与检验）
+        """
+        n_total = len(translations_a)
+        if len(translations_b) != n_total or len(sources) != n_total:
+            raise ValueError("sources、translations_a、translations_b长度必须一致")
+        if not self._metric_available(metric):
+            raise ValueError(f"指标不可用: {metric}")
+        if not references and (metric != "comet" or self.comet_scorer.requires_reference):
+            # 没有参考时所有样本都记为0分，检验会得出"等价"
+            raise ValueError(f"{metric}需要参考翻译")
+        
+        order = list(range(n_total))
+        random.Random(seed).shuffle(order)
+        
+        # Bonferroni校正：按计划检查次数平分alpha
+        planned_looks = max(1, math.ceil(max(n_total - min_segments, 0) / chunk_size) + 1)
+        alpha = 1.0 - confidence
+        critical_z = NormalDist().inv_cdf(1.0 - alpha / (2 * planned_looks))
+        
+        # Welford运行统计量
+        count = 0
+        mean = 0.0
+        m2 = 0.0
+        sum_a = 0.0
+        sum_b = 0.0
+        decision = "inconclusive"
+        z = 0.0
+        half_width = float("inf")
+        
+        for start in range(0, n_total, chunk_size):
+            chunk = order[start:start + chunk_size]
+            chunk_sources = [sources[i] for i in chunk]
+            chunk_refs = [references[i] for i in chunk] if references else None
+            
+            # 两个系统一起送入评估器，共享一次批量推理
+            combined = self._metric_scores(
+                metric,
+                chunk_sources + chunk_sources,
+                [translations_a[i] for i in chunk] + [translations_b[i] for i in chunk],
+                chunk_refs + chunk_refs if chunk_refs else None,
+                raise_errors=True
+            )
+            scores_a = combined[:len(chunk)]
+            scores_b = combined[len(chunk):]
+            
+            for a, b in zip(scores_a, scores_b):
+                count += 1
+                sum_a += a
+                sum_b += b
+                delta = (a - b) - mean
+                mean += delta / count
+                m2 += delta * ((a - b) - mean)
+            
+            if count < min(min_segments, n_total) or count < 2:
+                continue
+            
+            std_error = math.sqrt(m2 / (count - 1) / count)
+            half_width = critical_z * std_error
+            z = mean / std_error if std_error > 0 else (0.0 if mean == 0 else math.copysign(float("inf"), mean))
+            
+            if abs(z) >= critical_z:
+                decision = "a_better" if mean > 0 else "b_better"
+                break
+            if futility_margin > 0 and -futility_margin <= mean - half_width and mean + half_width <= futility_margin:
+                decision = "equivalent"
+                break
         
-        for i in range(len(translations)):
-            source = sources[i]
-            translation = translations[i]
-            reference = references[i] if references and i < len(references) else None
-            mqm = mqm_scores[i] if mqm_scores and i < len(mqm_scores) else None
+        return {
+            "metric": metric,
+            "decision": decision,
+            "stopped_early": count < n_total,
+            "segments_used": count,
+            "total_segments": n_total,
+            "mean_a": sum_a / count if count else 0.0,
+            "mean_b": sum_b / count if count else 0.0,
+            "mean_difference": mean,
+            "ci": [mean - half_width, mean + half_width],
+            "z": z,
+            "critical_z": critical_z,
+            "confidence": confidence
+        }
+    
+    def score_documents(
+        self,
+        sources: List[str],
+        translations: List[str],
+        references: Optional[List[Union[str, List[str]]]] = None,
+        src_lang: Optional[str] = None,
+        tgt_lang: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        metrics: Optional[Union[str, List[str]]] = None
+    ) -> List[Dict]:
+        """
+        文档级评分
+        
+        按句子边界切分并对齐每篇文档（以参考译文为轴，没有参考时以源文本为轴），
+        所有文档的所有片段一次批量评分，再按片段长度加权聚合为文档分数。
+        文档级BLEU/ChrF由各片段充分统计量之和计算（不含跨片段边界的n-gram）
+        
+        Args:
+            sources: 源文档列表
+            translations: 译文文档列表
+            references: 参考译文文档列表（可选；多参考时只使用第一个参考）
+            src_lang: 源语言（zh/en，None表示自动判断）
+            tgt_lang: 目标语言（zh/en，None表示自动判断）
+            max_tokens: 模型的最大输入长度（默认取COMET编码器的上限，未加载时为512）
+            metrics: 只计算这些指标（None表示所有已启用的指标）
+        
+        Returns:
+            List[Dict]: 每篇文档 {
+                "score": 文档级PaperGradeScore,
+                "n_segments": 片段数,
+                "segments": [{"source", "translation", "reference", "weight", "score"}],
+                "truncation": {"max_tokens", "document_tokens", "document_would_truncate",
+                               "segments_truncated", "max_segment_tokens"}
+            }
+        """
+        from .document import align_document, estimate_tokens
+        from .references import as_reference_list
+        from .sufficient_stats import char_bleu_statistics, bleu_from_statistics
+        
+        tokenizer, model_max_tokens = self._document_tokenizer()
+        max_tokens = max_tokens or model_max_tokens
+        
+        documents = []
+        flat_sources, flat_translations, flat_references = [], [], []
+        for d, translation in enumerate(translations):
+            source = sources[d] if sources and d < len(sources) else ""
+            reference_list = as_reference_list(references[d]) if references and d < len(references) else []
+            reference = reference_list[0] if reference_list else None
+            
+            segments = align_document(source, translation, reference, src_lang, tgt_lang)
+            document_tokens = max(estimate_tokens(text, tokenizer) for text in (source, translation, reference or ""))
+            segment_tokens = [max(estimate_tokens(text, tokenizer) for text in segment) for segment in segments]
+            
+            documents.append({
+                "start": len(flat_translations),
+                "segments": segments,
+                "has_reference": reference is not None,
+                "truncation": {
+                    "max_tokens": max_tokens,
+                    "document_tokens": document_tokens,
+                    "document_would_truncate": document_tokens > max_tokens,
+                    "segments_truncated": sum(1 for tokens in segment_tokens if tokens > max_tokens),
+                    "max_segment_tokens": max(segment_tokens) if segment_tokens else 0
+                }
+            })
+            for seg_source, seg_translation, seg_reference in segments:
+                flat_sources.append(seg_source)
+                flat_translations.append(seg_translation)
+                flat_references.append(seg_reference or None)
+        
+        print(f"📄 文档模式: {len(translations)} 篇文档 → {len(flat_translations)} 个片段")
+        segment_scores = self.batch_score(
+            flat_sources,
+            flat_translations,
+            flat_references if any(flat_references) else None,
+            metrics=metrics,
+            lang_pairs=[(src_lang, tgt_lang)] * len(flat_translations) if tgt_lang else None
+        )
+        
+        fields = [name for name, value in asdict(PaperGradeScore()).items() if isinstance(value, float)]
+        results = []
+        for document in documents:
+            segments = document["segments"]
+            scores = segment_scores[document["start"]:document["start"] + len(segments)]
+            # 按轴片段（参考或源文本）的长度加权
+            weights = [max(1, len(ref or src or hyp)) for src, hyp, ref in segments]
+            total_weight = sum(weights)
+            
+            doc_score = PaperGradeScore(**{
+                name: sum(getattr(s, name) * w for s, w in zip(scores, weights)) / total_weight
+                for name in fields
+            })
+            doc_score.model_info = scores[0].model_info if scores else {}
+            doc_score.metrics = scores[0].metrics if scores else []
+            computed = doc_score.metrics or []
             
-            score = self.score(source, translation, reference, mqm)
-            results.append(score)
+            if document["has_reference"]:
+                seg_translations = [hyp for _, hyp, _ in segments]
+                seg_references = [ref for _, _, ref in segments]
+                if "bleu" in computed:
+                    bleu_stats = [char_bleu_statistics(hyp, ref) for hyp, ref in zip(seg_translations, seg_references)]
+                    doc_score.bleu = float(bleu_from_statistics([sum(column) for column in zip(*bleu_stats)]))
+                if "chrf" in computed:
+                    doc_score.chrf = self.chrf_scorer.corpus_score_from_statistics(
+                        self.chrf_scorer.sentence_statistics(seg_translations, seg_references)
+                    )
+            doc_score.final_score = self._calculate_paper_grade_score(doc_score)
+            
+            results.append({
+                "score": doc_score,
+                "n_segments": len(segments),
+                "segments": [
+                    {"source": src, "translation": hyp, "reference": ref, "weight": w, "score": s}
+                    for (src, hyp, ref), w, s in zip(segments, weights, scores)
+                ],
+                "truncation": document["truncation"]
+            })
         
         return results
-
+    
+    def _document_tokenizer(self):
+        """文档模式用于统计长度的分词器及其最大长度（COMET未加载时使用估计值）"""
+        encoder = getattr(getattr(self.comet_scorer, "model", None), "encoder", None)
+        tokenizer = getattr(encoder, "tokenizer", None)
+        max_positions = getattr(encoder, "max_positions", None)
+        return tokenizer, int(max_positions) if max_positions else 512